@@ -80,6 +80,7 @@ class Apply(api.BaseResource):
                 enable_chart_cleanup=req.get_param_as_bool(
                     'enable_chart_cleanup'),
                 dry_run=req.get_param_as_bool('dry_run'),
+                show_diff=req.get_param_as_bool('show_diff'),
                 force_wait=req.get_param_as_bool('wait'),
                 timeout=req.get_param_as_int('timeout') or 0,
                 tiller_host=req.get_param('tiller_host'),
@@ -23,6 +23,8 @@ from armada.common import policy
 from armada import const
 from armada.handlers.tiller import Tiller
 from armada.handlers.manifest import Manifest
+from armada.handlers.test import run_tests
+from armada.handlers.test import test_passed
 from armada.utils.release import release_prefix
 from armada.utils import validate
 
@@ -58,10 +60,7 @@ class TestReleasesReleaseNameController(api.BaseResource):
         }
 
         if tiller_resp:
-            test_status = getattr(
-                tiller_resp.info.status, 'last_test_suite_run', 'FAILED')
-
-            if test_status.result[0].status == 'PASSED':
+            if test_passed(tiller_resp):
                 msg['result'] = 'PASSED: {}'.format(release)
                 msg['message'] = 'MESSAGE: Test Pass'
                 self.logger.info(msg)
@@ -156,42 +155,27 @@ class TestReleasesManifestController(api.BaseResource):
 
         prefix = armada_obj.get(const.KEYWORD_ARMADA).get(
             const.KEYWORD_PREFIX)
-        known_releases = [release[0] for release in tiller.list_charts()]
-
-        message = {
-            'tests': {
-                'passed': [],
-                'skipped': [],
-                'failed': []
-            }
-        }
+        known_releases = [release.name
+                          for release in tiller.get_release_index()]
 
+        tests = []
+        skipped = []
         for group in armada_obj.get(const.KEYWORD_ARMADA).get(
                 const.KEYWORD_GROUPS):
             for ch in group.get(const.KEYWORD_CHARTS):
                 release_name = release_prefix(
-                    prefix, ch.get('chart').get('chart_name'))
+                    prefix, ch.get('chart').get('release'))
 
                 if release_name in known_releases:
-                    self.logger.info('RUNNING: %s tests', release_name)
-                    resp = tiller.testing_release(release_name)
-
-                    if not resp:
-                        continue
-
-                    test_status = getattr(
-                        resp.info.status, 'last_test_suite_run',
-                        'FAILED')
-                    if test_status.results[0].status:
-                        self.logger.info("PASSED: %s", release_name)
-                        message['test']['passed'].append(release_name)
-                    else:
-                        self.logger.info("FAILED: %s", release_name)
-                        message['test']['failed'].append(release_name)
+                    tests.append((release_name, None))
                 else:
                     self.logger.info(
                         'Release %s not found - SKIPPING', release_name)
-                    message['test']['skipped'].append(release_name)
+                    skipped.append(release_name)
+
+        results, _ = run_tests(tiller, tests)
+        results['skipped'] = skipped + results['skipped']
+        message = {'tests': results}
 
         resp.status = falcon.HTTP_200
         resp.body = json.dumps(message)
@@ -80,7 +80,7 @@ class Release(api.BaseResource):
                       tiller.tiller_namespace, tiller.timeout)
 
             releases = {}
-            for release in tiller.list_releases():
+            for release in tiller.iter_releases():
                 releases.setdefault(release.namespace, [])
                 releases[release.namespace].append(release.name)
 
@@ -85,6 +85,9 @@ SHORT_DESC = "Command installs manifest charts."
 @click.option('--enable-chart-cleanup',
               help="Clean up unmanaged charts.",
               is_flag=True)
+@click.option('--show-diff',
+              help="Show the diff of the charts and values being upgraded.",
+              is_flag=True)
 @click.option('--set',
               help=("Use to override Armada Manifest values. Accepts "
                     "overrides that adhere to the format "
@@ -130,13 +133,13 @@ SHORT_DESC = "Command installs manifest charts."
               is_flag=True)
 @click.pass_context
 def apply_create(ctx, locations, api, disable_update_post, disable_update_pre,
-                 dry_run, enable_chart_cleanup, set, tiller_host, tiller_port,
-                 tiller_namespace, timeout, values, wait, target_manifest,
-                 debug):
+                 dry_run, enable_chart_cleanup, show_diff, set, tiller_host,
+                 tiller_port, tiller_namespace, timeout, values, wait,
+                 target_manifest, debug):
     CONF.debug = debug
     ApplyManifest(ctx, locations, api, disable_update_post, disable_update_pre,
-                  dry_run, enable_chart_cleanup, set, tiller_host, tiller_port,
-                  tiller_namespace, timeout, values, wait,
+                  dry_run, enable_chart_cleanup, show_diff, set, tiller_host,
+                  tiller_port, tiller_namespace, timeout, values, wait,
                   target_manifest).safe_invoke()
 
 
@@ -149,6 +152,7 @@ class ApplyManifest(CliAction):
                  disable_update_pre,
                  dry_run,
                  enable_chart_cleanup,
+                 show_diff,
                  set,
                  tiller_host,
                  tiller_port,
@@ -166,6 +170,7 @@ class ApplyManifest(CliAction):
         self.disable_update_pre = disable_update_pre
         self.dry_run = dry_run
         self.enable_chart_cleanup = enable_chart_cleanup
+        self.show_diff = show_diff
         self.set = set
         self.tiller_host = tiller_host
         self.tiller_port = tiller_port
@@ -179,7 +184,7 @@ class ApplyManifest(CliAction):
         for result in resp:
             if not resp[result] and not result == 'diff':
                 self.logger.info('Did not perform chart %s(s)', result)
-            elif result == 'diff' and not resp[result]:
+            elif result == 'diff' and not resp[result] and self.show_diff:
                 self.logger.info('No release changes detected')
 
             for ch in resp[result]:
@@ -209,6 +214,7 @@ class ApplyManifest(CliAction):
                 disable_update_post=self.disable_update_post,
                 enable_chart_cleanup=self.enable_chart_cleanup,
                 dry_run=self.dry_run,
+                show_diff=self.show_diff,
                 set_ovr=self.set,
                 force_wait=self.wait,
                 timeout=self.timeout,
@@ -231,6 +237,7 @@ class ApplyManifest(CliAction):
                 'disable_update_pre': self.disable_update_pre,
                 'dry_run': self.dry_run,
                 'enable_chart_cleanup': self.enable_chart_cleanup,
+                'show_diff': self.show_diff,
                 'tiller_host': self.tiller_host,
                 'tiller_port': self.tiller_port,
                 'tiller_namespace': self.tiller_namespace,
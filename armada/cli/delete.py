@@ -100,7 +100,8 @@ class DeleteChartManifest(CliAction):
     def invoke(self):
         tiller = Tiller(
             tiller_host=self.tiller_host, tiller_port=self.tiller_port)
-        known_release_names = [release[0] for release in tiller.list_charts()]
+        known_release_names = [release.name
+                               for release in tiller.get_release_index()]
 
         if self.releases:
             target_releases = [r.strip() for r in self.releases.split(',')
@@ -20,6 +20,8 @@ from oslo_config import cfg
 from armada.cli import CliAction
 from armada import const
 from armada.handlers.manifest import Manifest
+from armada.handlers.test import run_tests
+from armada.handlers.test import test_passed
 from armada.handlers.tiller import Tiller
 from armada.utils.release import release_prefix
 
@@ -107,7 +109,8 @@ class TestChartManifest(CliAction):
             tiller_host=self.tiller_host,
             tiller_port=self.tiller_port,
             tiller_namespace=self.tiller_namespace)
-        known_release_names = [release[0] for release in tiller.list_charts()]
+        known_release_names = [release.name
+                               for release in tiller.get_release_index()]
 
         if self.release:
             if not self.ctx.obj.get('api', False):
@@ -118,9 +121,7 @@ class TestChartManifest(CliAction):
                     self.logger.info("FAILED: %s", self.release)
                     return
 
-                test_status = getattr(resp.info.status, 'last_test_suite_run',
-                                      'FAILED')
-                if test_status.results[0].status:
+                if test_passed(resp):
                     self.logger.info("PASSED: %s", self.release)
                 else:
                     self.logger.info("FAILED: %s", self.release)
@@ -146,31 +147,21 @@ class TestChartManifest(CliAction):
                 prefix = armada_obj.get(const.KEYWORD_ARMADA).get(
                     const.KEYWORD_PREFIX)
 
+                tests = []
                 for group in armada_obj.get(const.KEYWORD_ARMADA).get(
                         const.KEYWORD_GROUPS):
                     for ch in group.get(const.KEYWORD_CHARTS):
                         release_name = release_prefix(
-                            prefix, ch.get('chart').get('chart_name'))
+                            prefix, ch.get('chart').get('release'))
 
                         if release_name in known_release_names:
-                            self.logger.info('RUNNING: %s tests', release_name)
-                            resp = tiller.testing_release(release_name)
-
-                            if not resp:
-                                continue
-
-                            test_status = getattr(
-                                resp.info.status, 'last_test_suite_run',
-                                'FAILED')
-                            if test_status.results[0].status:
-                                self.logger.info("PASSED: %s", release_name)
-                            else:
-                                self.logger.info("FAILED: %s", release_name)
-
+                            tests.append((release_name, None))
                         else:
                             self.logger.info(
                                 'Release %s not found - SKIPPING',
                                 release_name)
+
+                run_tests(tiller, tests)
             else:
                 client = self.ctx.obj.get('CLIENT')
                 query = {
@@ -116,7 +116,7 @@ class TillerServices(CliAction):
 
         if self.releases:
             if not self.ctx.obj.get('api', False):
-                for release in tiller.list_releases():
+                for release in tiller.iter_releases():
                     self.logger.info(
                         "Release %s in namespace: %s",
                         release.name, release.namespace)
@@ -35,6 +35,102 @@ default_options = [
         default=None,
         help=utils.fmt("""
 Absolute path to the certificate file to use for chart registries
+""")),
+
+    cfg.StrOpt(
+        'chart_cache_dir',
+        default=None,
+        help=utils.fmt("""
+Directory in which built charts are cached between runs, keyed on the state of
+their source directory and dependencies. Caching is disabled when unset.
+""")),
+
+    cfg.IntOpt(
+        'chart_cache_max_size',
+        default=512,
+        min=0,
+        help=utils.fmt("""
+Maximum size of the built chart cache, in MiB. The least recently used charts
+are evicted first.
+""")),
+
+    cfg.IntOpt(
+        'chart_deploy_workers',
+        default=8,
+        min=1,
+        help=utils.fmt("""
+Maximum number of charts of an un-sequenced ChartGroup to deploy concurrently.
+""")),
+
+    cfg.IntOpt(
+        'chart_group_deploy_workers',
+        default=4,
+        min=1,
+        help=utils.fmt("""
+Maximum number of ChartGroups to deploy concurrently when ChartGroups declare
+dependencies on each other with `depends_on`.
+""")),
+
+    cfg.StrOpt(
+        'git_cache_dir',
+        default=None,
+        help=utils.fmt("""
+Directory in which local mirrors of git chart sources are kept between runs,
+so that only new objects have to be fetched. Mirrors are not used when unset.
+""")),
+
+    cfg.IntOpt(
+        'git_cache_max_size',
+        default=2048,
+        min=0,
+        help=utils.fmt("""
+Maximum size of the git mirror cache, in MiB. The least recently used mirrors
+are evicted first, at the end of a run. Mirrors with checkouts still in use are
+kept.
+""")),
+
+    cfg.IntOpt(
+        'git_fetch_depth',
+        default=1,
+        min=0,
+        help=utils.fmt("""
+Number of commits of history to fetch when cloning a git chart source, 0
+fetching the whole history. Not used for mirrors, see `git_cache_dir`.
+""")),
+
+    cfg.BoolOpt(
+        'git_sparse_checkout',
+        default=False,
+        help=utils.fmt("""
+Only check out the subpaths of git chart sources used by the manifest. Not
+used for mirrors, see `git_cache_dir`.
+""")),
+
+    cfg.IntOpt(
+        'http_pool_maxsize',
+        default=10,
+        min=1,
+        help=utils.fmt("""
+Maximum number of connections kept open to each host for fetching documents
+and chart tarballs over HTTP.
+""")),
+
+    cfg.FloatOpt(
+        'http_retry_backoff_factor',
+        default=0.5,
+        min=0,
+        help=utils.fmt("""
+Backoff factor between retries of HTTP requests, the n-th retry waiting
+`http_retry_backoff_factor * 2 ** (n - 1)` seconds.
+""")),
+
+    cfg.IntOpt(
+        'http_retries',
+        default=3,
+        min=0,
+        help=utils.fmt("""
+Number of times HTTP requests failing to connect or answered with a server
+error are retried.
 """)),
 
     cfg.StrOpt(
@@ -61,6 +157,44 @@ The Keystone project domain name used for authentication.
         default='admin',
         help=utils.fmt('The Keystone project name used for authentication.')),
 
+    cfg.IntOpt(
+        'reference_resolve_workers',
+        default=8,
+        min=1,
+        help=utils.fmt("""
+Maximum number of document references to resolve concurrently.
+""")),
+
+    cfg.IntOpt(
+        'reference_timeout',
+        default=30,
+        min=1,
+        help=utils.fmt("""
+Timeout, in seconds, of each attempt of the network requests resolving a
+document reference, to connect and then between bytes received. As failed HTTP
+requests are retried up to http_retries times with a backoff, resolving a
+reference can take longer overall. Reading local file references is not
+bounded.
+""")),
+
+    cfg.IntOpt(
+        'release_test_workers',
+        default=8,
+        min=1,
+        help=utils.fmt("""
+Maximum number of releases to test concurrently, when testing the charts of
+an un-sequenced ChartGroup or the releases of a manifest.
+""")),
+
+    cfg.IntOpt(
+        'source_fetch_workers',
+        default=8,
+        min=1,
+        help=utils.fmt("""
+Maximum number of distinct chart sources (git repositories and references, or
+tarballs) to fetch concurrently.
+""")),
+
     # TODO(fmontei): Add support for multiple SSH keys, not just one site-wide
     # one.
     cfg.StrOpt(
@@ -70,6 +204,34 @@ The Keystone project domain name used for authentication.
 authenticating against a Git source repository. The path must be an absolute
 path to the private key that includes the name of the key itself.""")),
 
+    cfg.StrOpt(
+        'tarball_cache_dir',
+        default=None,
+        help=utils.fmt("""
+Directory in which tarball chart sources are kept extracted between runs.
+Cached tarballs are revalidated with conditional requests, or used without any
+request when the chart source pins their `checksum`. Tarballs are not cached
+when unset.
+""")),
+
+    cfg.IntOpt(
+        'tarball_cache_max_age',
+        default=168,
+        min=0,
+        help=utils.fmt("""
+Number of hours after which unused tarballs are evicted from the tarball cache,
+0 to never evict tarballs because of their age.
+""")),
+
+    cfg.IntOpt(
+        'tarball_cache_max_size',
+        default=1024,
+        min=0,
+        help=utils.fmt("""
+Maximum size of the tarball cache, in MiB. The least recently used tarballs
+are evicted first.
+""")),
+
     cfg.StrOpt(
         'tiller_pod_labels',
         default='app=helm,name=tiller',
@@ -26,6 +26,7 @@ KEYWORD_RELEASE = 'release'
 
 # Tiller
 DEFAULT_CHART_TIMEOUT = 3600
+DEFAULT_TEST_TIMEOUT = 300
 STATUS_DEPLOYED = 'DEPLOYED'
 STATUS_FAILED = 'FAILED'
 
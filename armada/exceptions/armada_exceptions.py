@@ -27,3 +27,20 @@ class ArmadaTimeoutException(ArmadaException):
     def __init__(self, reason):
         self._message = 'Armada timed out waiting on: %s' % (reason)
         super(ArmadaTimeoutException, self).__init__(self._message)
+
+
+class ChartDeployException(ArmadaException):
+    '''Exception that occurs while deploying charts.'''
+
+    def __init__(self, chart_names):
+        self._message = ('Exception deploying charts: %s' % chart_names)
+        super(ChartDeployException, self).__init__(self._message)
+
+
+class ChartGroupDeployException(ArmadaException):
+    '''Exception that occurs while deploying chart groups.'''
+
+    def __init__(self, chart_group_names):
+        self._message = (
+            'Exception deploying chart groups: %s' % chart_group_names)
+        super(ChartGroupDeployException, self).__init__(self._message)
@@ -116,6 +116,26 @@ class TarballExtractException(SourceException):
         super(TarballExtractException, self).__init__(self._message)
 
 
+class TarballChecksumException(SourceException):
+    '''
+    Exception that occurs when the SHA-256 checksum of a downloaded tarball
+    does not match the ``checksum`` of the chart source.
+
+    **Troubleshoot:**
+
+    * Ensure that the ``checksum`` of the chart source is up to date with the
+      tarball published at its ``location``.
+    '''
+
+    def __init__(self, tarball_url, expected, actual):
+        self._tarball_url = tarball_url
+        self._message = (
+            'Checksum mismatch for {}: expected {}, got {}'.format(
+                tarball_url, expected, actual))
+
+        super(TarballChecksumException, self).__init__(self._message)
+
+
 class InvalidPathException(SourceException):
     '''
     Exception that occurs when a nonexistant path is accessed.
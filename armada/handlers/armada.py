@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
+from concurrent import futures
 import difflib
 import time
 import yaml
@@ -22,12 +24,19 @@ from oslo_log import log as logging
 from armada.handlers.chartbuilder import ChartBuilder
 from armada.handlers.manifest import Manifest
 from armada.handlers.override import Override
+from armada.handlers.test import run_tests
 from armada.handlers.tiller import Tiller
 from armada.exceptions.armada_exceptions import ArmadaTimeoutException
+from armada.exceptions.armada_exceptions import ChartDeployException
+from armada.exceptions.armada_exceptions import ChartGroupDeployException
+from armada.exceptions.manifest_exceptions import ManifestException
 from armada.exceptions import source_exceptions
 from armada.exceptions import validate_exceptions
 from armada.exceptions import tiller_exceptions
+from armada.utils import dependency
+from armada.utils.release import release_digest
 from armada.utils.release import release_prefix
+from armada.utils.release import values_diff
 from armada.utils import source
 from armada.utils import validate
 
@@ -63,7 +72,8 @@ class Armada(object):
                  values=None,
                  target_manifest=None,
                  k8s_wait_attempts=1,
-                 k8s_wait_attempt_sleep=1):
+                 k8s_wait_attempt_sleep=1,
+                 show_diff=False):
         '''
         Initialize the Armada engine and establish a connection to Tiller.
 
@@ -88,6 +98,8 @@ class Armada(object):
             for pods to become ready.
         :param int k8s_wait_attempt_sleep: The time in seconds to sleep
             between attempts.
+        :param bool show_diff: Report the diff of the chart and values of
+            releases being upgraded.
         '''
         tiller_port = tiller_port or CONF.tiller_port
         tiller_namespace = tiller_namespace or CONF.tiller_namespace
@@ -106,17 +118,33 @@ class Armada(object):
             values=values).update_manifests()
         self.k8s_wait_attempts = k8s_wait_attempts
         self.k8s_wait_attempt_sleep = k8s_wait_attempt_sleep
+        self.display_diff = show_diff
         self.manifest = Manifest(
             self.documents,
             target_manifest=target_manifest).get_manifest()
+        self.release_index = None
+        # dependency charts built during this run, shared between charts
+        self.dependency_charts = {}
+        # git checkouts made by fetch_sources, cleaned up by post_flight_ops
+        self.source_dirs = []
 
-    def find_release_chart(self, known_releases, name):
+    def get_release_index(self):
         '''
-        Find a release given a list of known_releases and a release name
+        Return the index of releases known to Tiller.
+
+        The index is only listed from Tiller once per run, see
+        :meth:`Tiller.get_release_index`.
+        '''
+        if self.release_index is None:
+            self.release_index = self.tiller.get_release_index()
+        return self.release_index
+
+    def find_release_chart(self, name):
+        '''
+        Fetch the chart and values of the latest release ``name`` from Tiller
         '''
-        for chart_name, _, chart, values, _ in known_releases:
-            if chart_name == name:
-                return chart, values
+        content = self.tiller.get_release_content(name)
+        return content.release.chart, content.release.config.raw
 
     def pre_flight_ops(self):
         """Perform a series of checks and operations to ensure proper
@@ -155,70 +183,127 @@ class Armada(object):
                 for ch in group.get(KEYWORD_CHARTS, []):
                     ch_release_name = release_prefix(
                         prefix, ch.get('chart', {}).get('chart_name'))
-                    if release[0] == ch_release_name:
+                    if release.name == ch_release_name:
                         LOG.info('Purging failed release %s '
-                                 'before deployment', release[0])
-                        self.tiller.uninstall_release(release[0])
+                                 'before deployment', release.name)
+                        self.tiller.uninstall_release(release.name)
+                        self.release_index.remove(release)
 
-        # Clone the chart sources
+        # Fetch the chart sources
         #
         # We only support a git source type right now, which can also
         # handle git:// local paths as well
-        repos = {}
+        charts = []
         for group in manifest_data.get(KEYWORD_GROUPS, []):
             for ch in group.get(KEYWORD_CHARTS, []):
-                self.tag_cloned_repo(ch, repos)
+                charts.append(ch)
+                charts.extend(ch.get('chart', {}).get('dependencies', []))
+        self.fetch_sources(charts)
 
-                for dep in ch.get('chart', {}).get('dependencies', []):
-                    self.tag_cloned_repo(dep, repos)
+    def fetch_sources(self, charts):
+        '''
+        Fetch the sources of ``charts`` and set their ``source_dir``.
 
-    def tag_cloned_repo(self, ch, repos):
-        chart = ch.get('chart', {})
-        chart_source = chart.get('source', {})
+        Each distinct source, a git location and reference or a tarball
+        location, is fetched once for all the charts using it. Fetches run
+        concurrently, up to ``CONF.source_fetch_workers`` at a time. The git
+        checkouts are recorded in ``source_dirs`` for ``post_flight_ops`` to
+        clean up.
+        '''
+        sources = OrderedDict()
+        for ch in charts:
+            chart = ch.get('chart', {})
+            chart_source = chart.get('source', {})
+            location = chart_source.get('location')
+            ct_type = chart_source.get('type')
+            subpath = chart_source.get('subpath', '.')
+
+            if ct_type == 'local':
+                chart['source_dir'] = (location, subpath)
+            elif ct_type == 'tar':
+                sources.setdefault((ct_type, location), []).append(chart)
+            elif ct_type == 'git':
+                reference = chart_source.get('reference', 'master')
+                sources.setdefault(
+                    (ct_type, location, reference), []).append(chart)
+            else:
+                chart_name = chart.get('chart_name')
+                raise source_exceptions.ChartSourceException(
+                    ct_type, chart_name)
+
+        if not sources:
+            return
+
+        with futures.ThreadPoolExecutor(
+                max_workers=CONF.source_fetch_workers) as executor:
+            fetches = OrderedDict(
+                (key, executor.submit(
+                    self._fetch_source,
+                    source_charts[0].get('source', {}),
+                    [ch.get('source', {}).get('subpath', '.')
+                     for ch in source_charts]))
+                for key, source_charts in sources.items())
+
+        failures = []
+        for key, future in fetches.items():
+            try:
+                source_dir = future.result()
+            except Exception as e:
+                failures.append(e)
+                continue
+
+            for chart in sources[key]:
+                subpath = chart.get('source', {}).get('subpath', '.')
+                chart['source_dir'] = (source_dir, subpath)
+
+        checkouts = [future.result() for key, future in fetches.items()
+                     if key[0] == 'git' and not future.exception()]
+        if failures:
+            # Don't leak the clones that succeeded, post_flight_ops won't
+            # run.
+            for source_dir in checkouts:
+                source.source_cleanup(source_dir)
+            for e in failures[1:]:
+                LOG.error('Failed to fetch chart source: %s', e)
+            raise failures[0]
+
+        self.source_dirs.extend(checkouts)
+
+    def _fetch_source(self, chart_source, subpaths):
+        '''Fetch a git or tar chart source, of which ``subpaths`` are used,
+        and return its local path.'''
         location = chart_source.get('location')
         ct_type = chart_source.get('type')
-        subpath = chart_source.get('subpath', '.')
 
-        if ct_type == 'local':
-            chart['source_dir'] = (location, subpath)
-        elif ct_type == 'tar':
+        if ct_type == 'tar':
             LOG.info('Downloading tarball from: %s', location)
+            checksum = chart_source.get('checksum')
 
             if not CONF.certs:
                 LOG.warn(
                     'Disabling server validation certs to extract charts')
-                tarball_dir = source.get_tarball(location, verify=False)
-            else:
-                tarball_dir = source.get_tarball(location, verify=CONF.cert)
-
-            chart['source_dir'] = (tarball_dir, subpath)
-        elif ct_type == 'git':
-            reference = chart_source.get('reference', 'master')
-            repo_branch = (location, reference)
-
-            if repo_branch not in repos:
-                auth_method = chart_source.get('auth_method')
-                proxy_server = chart_source.get('proxy_server')
-
-                logstr = 'Cloning repo: {} from branch: {}'.format(
-                    *repo_branch)
-                if proxy_server:
-                    logstr += ' proxy: {}'.format(proxy_server)
-                if auth_method:
-                    logstr += ' auth method: {}'.format(auth_method)
-                LOG.info(logstr)
-
-                repo_dir = source.git_clone(*repo_branch,
-                                            proxy_server=proxy_server,
-                                            auth_method=auth_method)
-                repos[repo_branch] = repo_dir
-
-                chart['source_dir'] = (repo_dir, subpath)
-            else:
-                chart['source_dir'] = (repos.get(repo_branch), subpath)
-        else:
-            chart_name = chart.get('chart_name')
-            raise source_exceptions.ChartSourceException(ct_type, chart_name)
+                return source.get_tarball(location, verify=False,
+                                          subpaths=subpaths,
+                                          checksum=checksum)
+            return source.get_tarball(location, verify=CONF.certs,
+                                      subpaths=subpaths, checksum=checksum)
+
+        reference = chart_source.get('reference', 'master')
+        auth_method = chart_source.get('auth_method')
+        proxy_server = chart_source.get('proxy_server')
+
+        logstr = 'Cloning repo: {} from branch: {}'.format(
+            location, reference)
+        if proxy_server:
+            logstr += ' proxy: {}'.format(proxy_server)
+        if auth_method:
+            logstr += ' auth method: {}'.format(auth_method)
+        LOG.info(logstr)
+
+        return source.git_clone(location, reference,
+                                proxy_server=proxy_server,
+                                auth_method=auth_method,
+                                subpaths=subpaths)
 
     def get_releases_by_status(self, status):
         '''
@@ -227,9 +312,9 @@ class Armada(object):
         Return a list of current releases with a specified status
         '''
         filtered_releases = []
-        known_releases = self.tiller.list_charts()
+        known_releases = self.get_release_index()
         for release in known_releases:
-            if release[4] == status:
+            if release.status == status:
                 filtered_releases.append(release)
 
         return filtered_releases
@@ -245,274 +330,503 @@ class Armada(object):
         # a more cleaner format
         self.pre_flight_ops()
 
-        # extract known charts on tiller right now
-        known_releases = self.tiller.list_charts()
+        # extract known releases on tiller right now
+        known_releases = self.get_release_index()
         manifest_data = self.manifest.get(KEYWORD_ARMADA, {})
         prefix = manifest_data.get(KEYWORD_PREFIX, '')
+        chart_groups = manifest_data.get(KEYWORD_GROUPS, [])
+
+        # Validate every `depends_on` before deploying anything
+        group_graph = self._get_chart_group_graph(chart_groups)
+        for chartgroup in chart_groups:
+            self._get_chart_graph(chartgroup.get(KEYWORD_CHARTS, []),
+                                  chartgroup.get('sequenced', False))
+
+        try:
+            if group_graph is None:
+                for chartgroup in chart_groups:
+                    self._sync_chart_group(chartgroup, prefix, known_releases,
+                                           msg)
+            else:
+                groups_by_name = {cg.get('name'): cg for cg in chart_groups}
+
+                def _sync_group_by_name(name):
+                    return self._sync_chart_group(
+                        groups_by_name[name], prefix, known_releases, msg)
+
+                _, failures, skipped = dependency.run_graph(
+                    group_graph, _sync_group_by_name,
+                    CONF.chart_group_deploy_workers)
+
+                if failures or skipped:
+                    errors = ['%s (%s)' % (name, e)
+                              for name, e in failures.items()]
+                    errors.extend('%s (skipped)' % name for name in skipped)
+                    LOG.error('ChartGroup deploy(s) failed: %s', errors)
+                    raise ChartGroupDeployException(errors)
+        finally:
+            # Nothing waits on the pods of this run anymore
+            self.tiller.k8s.stop_informers()
 
-        for chartgroup in manifest_data.get(KEYWORD_GROUPS, []):
-            cg_name = chartgroup.get('name', '<missing name>')
-            cg_desc = chartgroup.get('description', '<missing description>')
-            LOG.info('Processing ChartGroup: %s (%s)', cg_name, cg_desc)
+        LOG.info("Performing Post-Flight Operations")
+        self.post_flight_ops()
 
-            cg_sequenced = chartgroup.get('sequenced', False)
-            cg_test_all_charts = chartgroup.get('test_charts', False)
+        if self.enable_chart_cleanup:
+            self.tiller.chart_cleanup(
+                prefix,
+                self.manifest[KEYWORD_ARMADA][KEYWORD_GROUPS],
+                known_releases=known_releases)
 
-            namespaces_seen = set()
-            tests_to_run = []
+        return msg
 
-            cg_charts = chartgroup.get(KEYWORD_CHARTS, [])
+    def _get_chart_group_graph(self, chart_groups):
+        '''
+        Return the dependency graph of the ChartGroups keyed by name, or None
+        if no ChartGroup declares ``depends_on``, in which case the groups
+        are processed in manifest order.
+        '''
+        if not any(cg.get('depends_on') for cg in chart_groups):
+            return None
 
-            # Track largest Chart timeout to stop the ChartGroup at the end
-            cg_max_timeout = 0
+        return dependency.build_graph(
+            [(cg.get('name'), cg.get('depends_on', []))
+             for cg in chart_groups], kind='ChartGroup')
 
-            for chart_entry in cg_charts:
-                chart = chart_entry.get('chart', {})
-                namespace = chart.get('namespace')
-                release = chart.get('release')
-                values = chart.get('values', {})
-                pre_actions = {}
-                post_actions = {}
-
-                wait_timeout = self.timeout
-                wait_labels = {}
-
-                release_name = release_prefix(prefix, release)
-
-                # Retrieve appropriate timeout value
-
-                if wait_timeout <= 0:
-                    # TODO(MarshM): chart's `data.timeout` should be deprecated
-                    chart_timeout = chart.get('timeout', 0)
-                    # Favor data.wait.timeout over data.timeout, until removed
-                    wait_values = chart.get('wait', {})
-                    wait_timeout = wait_values.get('timeout', chart_timeout)
-                    wait_labels = wait_values.get('labels', {})
-
-                this_chart_should_wait = (
-                    cg_sequenced or self.force_wait or
-                    wait_timeout > 0 or len(wait_labels) > 0)
-
-                if this_chart_should_wait and wait_timeout <= 0:
-                    LOG.warn('No Chart timeout specified, using default: %ss',
-                             DEFAULT_CHART_TIMEOUT)
-                    wait_timeout = DEFAULT_CHART_TIMEOUT
-
-                # Track namespaces + labels touched
-                namespaces_seen.add((namespace, tuple(wait_labels.items())))
-
-                # Naively take largest timeout to apply at end
-                # TODO(MarshM) better handling of timeout/timer
-                cg_max_timeout = max(wait_timeout, cg_max_timeout)
-
-                # Chart test policy can override ChartGroup, if specified
-                test_this_chart = chart.get('test', cg_test_all_charts)
-
-                chartbuilder = ChartBuilder(chart)
-                protoc_chart = chartbuilder.get_helm_chart()
-
-                deployed_releases = [x[0] for x in known_releases]
-
-                # Begin Chart timeout deadline
-                deadline = time.time() + wait_timeout
-
-                # TODO(mark-burnett): It may be more robust to directly call
-                # tiller status to decide whether to install/upgrade rather
-                # than checking for list membership.
-                if release_name in deployed_releases:
-
-                    # indicate to the end user what path we are taking
-                    LOG.info("Upgrading release %s in namespace %s",
-                             release_name, namespace)
-                    # extract the installed chart and installed values from the
-                    # latest release so we can compare to the intended state
-                    apply_chart, apply_values = self.find_release_chart(
-                        known_releases, release_name)
-
-                    upgrade = chart.get('upgrade', {})
-                    disable_hooks = upgrade.get('no_hooks', False)
-
-                    LOG.info("Checking Pre/Post Actions")
-                    if upgrade:
-                        upgrade_pre = upgrade.get('pre', {})
-                        upgrade_post = upgrade.get('post', {})
-
-                        if not self.disable_update_pre and upgrade_pre:
-                            pre_actions = upgrade_pre
-
-                        if not self.disable_update_post and upgrade_post:
-                            post_actions = upgrade_post
-
-                    # Show delta for both the chart templates and the chart
-                    # values
-                    # TODO(alanmeadows) account for .files differences
-                    # once we support those
-                    LOG.info('Checking upgrade chart diffs.')
-                    upgrade_diff = self.show_diff(
-                        chart, apply_chart, apply_values,
-                        chartbuilder.dump(), values, msg)
-
-                    if not upgrade_diff:
-                        LOG.info("There are no updates found in this chart")
-                        continue
-
-                    # TODO(MarshM): Add tiller dry-run before upgrade and
-                    # consider deadline impacts
-
-                    # do actual update
-                    timer = int(round(deadline - time.time()))
-                    LOG.info('Beginning Upgrade, wait=%s, timeout=%ss',
-                             this_chart_should_wait, timer)
-                    tiller_result = self.tiller.update_release(
-                        protoc_chart,
-                        release_name,
-                        namespace,
-                        pre_actions=pre_actions,
-                        post_actions=post_actions,
-                        dry_run=self.dry_run,
-                        disable_hooks=disable_hooks,
-                        values=yaml.safe_dump(values),
-                        wait=this_chart_should_wait,
-                        timeout=timer)
-
-                    if this_chart_should_wait:
-                        self.tiller.k8s.wait_until_ready(
-                            release=release_name,
-                            labels=wait_labels,
-                            namespace=namespace,
-                            k8s_wait_attempts=self.k8s_wait_attempts,
-                            k8s_wait_attempt_sleep=self.k8s_wait_attempt_sleep,
-                            timeout=timer
-                        )
-
-                    LOG.info('Upgrade completed with results from Tiller: %s',
-                             tiller_result.__dict__)
-                    msg['upgrade'].append(release_name)
-
-                # process install
-                else:
-                    LOG.info("Installing release %s in namespace %s",
-                             release_name, namespace)
-
-                    timer = int(round(deadline - time.time()))
-                    LOG.info('Beginning Install, wait=%s, timeout=%ss',
-                             this_chart_should_wait, timer)
-                    tiller_result = self.tiller.install_release(
-                        protoc_chart,
-                        release_name,
-                        namespace,
-                        dry_run=self.dry_run,
-                        values=yaml.safe_dump(values),
-                        wait=this_chart_should_wait,
-                        timeout=timer)
-
-                    if this_chart_should_wait:
-                        self.tiller.k8s.wait_until_ready(
-                            release=release_name,
-                            labels=wait_labels,
-                            namespace=namespace,
-                            k8s_wait_attempts=self.k8s_wait_attempts,
-                            k8s_wait_attempt_sleep=self.k8s_wait_attempt_sleep,
-                            timeout=timer
-                        )
-
-                    LOG.info('Install completed with results from Tiller: %s',
-                             tiller_result.__dict__)
-                    msg['install'].append(release_name)
-
-                # Sequenced ChartGroup should run tests after each Chart
-                timer = int(round(deadline - time.time()))
-                if test_this_chart and cg_sequenced:
-                    LOG.info('Running sequenced test, timeout remaining: %ss.',
-                             timer)
-                    if timer <= 0:
-                        reason = ('Timeout expired before testing sequenced '
-                                  'release %s' % release_name)
-                        LOG.error(reason)
-                        raise ArmadaTimeoutException(reason)
-                    self._test_chart(release_name, timer)
-
-                # Un-sequenced ChartGroup should run tests at the end
-                elif test_this_chart:
-                    # Keeping track of time remaining
-                    tests_to_run.append((release_name, timer))
-
-            # End of Charts in ChartGroup
-            LOG.info('All Charts applied.')
-
-            # After all Charts are applied, we should wait for the entire
-            # ChartGroup to become healthy by looking at the namespaces seen
-            # TODO(MarshM): Need to restrict to only releases we processed
-            # TODO(MarshM): Need to determine a better timeout
-            #               (not cg_max_timeout)
-            if cg_max_timeout <= 0:
-                cg_max_timeout = DEFAULT_CHART_TIMEOUT
-            deadline = time.time() + cg_max_timeout
-            for (ns, labels) in namespaces_seen:
-                labels_dict = dict(labels)
-                timer = int(round(deadline - time.time()))
-                LOG.info('Final wait for healthy namespace (%s), label=(%s), '
-                         'timeout remaining: %ss.', ns, labels_dict, timer)
-                if timer <= 0:
-                    reason = ('Timeout expired waiting on namespace: %s, '
-                              'label: %s' % (ns, labels_dict))
-                    LOG.error(reason)
-                    raise ArmadaTimeoutException(reason)
+    def _get_chart_graph(self, cg_charts, cg_sequenced):
+        '''
+        Return the dependency graph of the charts of a ChartGroup.
+
+        Charts refer to each other by (un-prefixed) ``release``. When no chart
+        of the group declares ``depends_on`` the graph is keyed by position
+        in the group, so that duplicate release names are left alone.
 
+        :raises ManifestException: If a dependency is unknown, cyclic, or
+            listed after its dependent in a sequenced ChartGroup.
+        '''
+        charts = [ch.get('chart', {}) for ch in cg_charts]
+        if not any(chart.get('depends_on') for chart in charts):
+            return OrderedDict((i, set()) for i in range(len(charts)))
+
+        graph = dependency.build_graph(
+            [(chart.get('release'), chart.get('depends_on', []))
+             for chart in charts], kind='chart')
+
+        if cg_sequenced:
+            releases = list(graph)
+            for position, release in enumerate(releases):
+                later = graph[release] - set(releases[:position])
+                if later:
+                    raise ManifestException(
+                        details='chart "{}" of a sequenced ChartGroup '
+                                'depends on later chart(s): {}'.format(
+                                    release, sorted(later)))
+
+        return graph
+
+    def _sync_chart_group(self, chartgroup, prefix, known_releases, msg):
+        '''
+        Deploy all charts of a ChartGroup, wait for the group to become
+        healthy and run its pending tests.
+        '''
+        cg_name = chartgroup.get('name', '<missing name>')
+        cg_desc = chartgroup.get('description', '<missing description>')
+        LOG.info('Processing ChartGroup: %s (%s)', cg_name, cg_desc)
+
+        cg_sequenced = chartgroup.get('sequenced', False)
+        cg_test_all_charts = chartgroup.get('test_charts', False)
+
+        tests_to_run = []
+
+        cg_charts = chartgroup.get(KEYWORD_CHARTS, [])
+
+        # Track largest Chart timeout to stop the ChartGroup at the end
+        cg_max_timeout = 0
+
+        results = self._deploy_charts(
+            cg_charts, cg_sequenced, cg_test_all_charts, prefix,
+            known_releases, msg)
+
+        for result in results:
+            # Naively take largest timeout to apply at end
+            # TODO(MarshM) better handling of timeout/timer
+            cg_max_timeout = max(result['wait_timeout'], cg_max_timeout)
+
+            # Un-sequenced ChartGroup should run tests at the end
+            if result['test']:
+                # Keeping track of time remaining
+                tests_to_run.append((result['release'],
+                                     result['test_timeout']))
+
+        # End of Charts in ChartGroup
+        LOG.info('All Charts applied.')
+
+        # After all Charts are applied, we should wait for the entire
+        # ChartGroup to become healthy by looking at the releases processed
+        # TODO(MarshM): Need to determine a better timeout
+        #               (not cg_max_timeout)
+        if cg_max_timeout <= 0:
+            cg_max_timeout = DEFAULT_CHART_TIMEOUT
+        deadline = time.time() + cg_max_timeout
+        for result in results:
+            ns = result['namespace']
+            labels_dict = result['wait_labels']
+            timer = int(round(deadline - time.time()))
+            LOG.info('Final wait for healthy release (%s), namespace (%s), '
+                     'label=(%s), timeout remaining: %ss.',
+                     result['release'], ns, labels_dict, timer)
+            if timer <= 0:
+                reason = ('Timeout expired waiting on release: %s, '
+                          'namespace: %s, label: %s' %
+                          (result['release'], ns, labels_dict))
+                LOG.error(reason)
+                raise ArmadaTimeoutException(reason)
+
+            self.tiller.k8s.wait_until_ready(
+                release=result['release'],
+                namespace=ns,
+                labels=labels_dict,
+                k8s_wait_attempts=self.k8s_wait_attempts,
+                k8s_wait_attempt_sleep=self.k8s_wait_attempt_sleep,
+                timeout=timer,
+                resources=result['resources'])
+
+        # After entire ChartGroup is healthy, run any pending tests
+        _, errors = run_tests(self.tiller, tests_to_run)
+        if errors:
+            failures = ['%s (test: %s)' % (release_name, e)
+                        for release_name, e in errors.items()]
+            LOG.error('Test(s) failed: %s', failures)
+            raise ChartDeployException(failures)
+
+    def _deploy_charts(self, cg_charts, cg_sequenced, cg_test_all_charts,
+                       prefix, known_releases, msg):
+        '''
+        Install or upgrade every chart of a ChartGroup.
+
+        Sequenced ChartGroups are processed one chart at a time, in order,
+        and the first failure is raised as-is. Tests of charts with
+        ``test_in_background`` run alongside the rest of the sequence and are
+        joined before returning. Charts of an un-sequenced
+        ChartGroup are deployed concurrently by a pool of at most
+        ``CONF.chart_deploy_workers`` threads, each chart starting once the
+        charts it ``depends_on`` are deployed. Every chart is allowed to
+        finish (each one bounded by its own wait timeout) and any failures
+        are reported together.
+
+        :returns: List of per-chart results, see ``_deploy_chart``.
+        :raises ChartDeployException: If any chart of an un-sequenced
+            ChartGroup fails to deploy.
+        '''
+        if cg_sequenced:
+            return self._deploy_sequenced_charts(
+                cg_charts, cg_test_all_charts, prefix, known_releases, msg)
+
+        if len(cg_charts) <= 1:
+            return [self._deploy_chart(chart_entry, cg_sequenced,
+                                       cg_test_all_charts, prefix,
+                                       known_releases, msg)
+                    for chart_entry in cg_charts]
+
+        graph = self._get_chart_graph(cg_charts, cg_sequenced)
+        charts_by_key = dict(zip(graph, cg_charts))
+
+        def _deploy_chart_by_key(key):
+            return self._deploy_chart(
+                charts_by_key[key], cg_sequenced, cg_test_all_charts,
+                prefix, known_releases, msg)
+
+        max_workers = max(1, min(CONF.chart_deploy_workers, len(cg_charts)))
+        LOG.info('Deploying %s charts concurrently with %s workers.',
+                 len(cg_charts), max_workers)
+
+        results, failures, skipped = dependency.run_graph(
+            graph, _deploy_chart_by_key, max_workers)
+
+        if failures or skipped:
+            def _release_name(key):
+                release = charts_by_key[key].get('chart', {}).get('release')
+                return release_prefix(prefix, release)
+
+            errors = ['%s (%s)' % (_release_name(key), e)
+                      for key, e in failures.items()]
+            errors.extend('%s (skipped)' % _release_name(key)
+                          for key in skipped)
+            LOG.error('Chart deploy(s) failed: %s', errors)
+            raise ChartDeployException(errors)
+
+        return list(results.values())
+
+    def _deploy_sequenced_charts(self, cg_charts, cg_test_all_charts, prefix,
+                                 known_releases, msg):
+        '''
+        Deploy the charts of a sequenced ChartGroup one after another,
+        running background tests on a thread pool in the meantime.
+        '''
+        results = []
+        test_futures = {}
+        with futures.ThreadPoolExecutor(
+                max_workers=CONF.chart_deploy_workers) as executor:
+            for chart_entry in cg_charts:
+                result = self._deploy_chart(
+                    chart_entry, True, cg_test_all_charts, prefix,
+                    known_releases, msg)
+                results.append(result)
+
+                if result['test_background']:
+                    LOG.info('Testing release %s in the background.',
+                             result['release'])
+                    future = executor.submit(
+                        self._test_chart, result['release'],
+                        result['test_timeout'])
+                    test_futures[future] = result['release']
+
+            failures = []
+            for future in futures.as_completed(test_futures):
+                release_name = test_futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    LOG.exception('Background test of release %s failed.',
+                                  release_name)
+                    failures.append('%s (test: %s)' % (release_name, e))
+
+        if failures:
+            LOG.error('Background test(s) failed: %s', failures)
+            raise ChartDeployException(failures)
+
+        return results
+
+    def _deploy_chart(self, chart_entry, cg_sequenced, cg_test_all_charts,
+                      prefix, known_releases, msg):
+        '''
+        Install or upgrade a single chart and wait for it if required.
+
+        Returns a dict describing what the ChartGroup still has to do for
+        this chart once all of its charts are applied: the ``namespace``,
+        ``wait_labels`` and ``wait_timeout`` to wait on, the ``resources`` of
+        the release manifest if it was installed or upgraded, and whether the
+        ``release`` should be tested (``test``) within ``test_timeout``.
+        ``test_background`` is set instead of ``test`` for a chart of a
+        sequenced ChartGroup whose tests should not hold up the next chart.
+        '''
+        chart = chart_entry.get('chart', {})
+        namespace = chart.get('namespace')
+        release = chart.get('release')
+        values = chart.get('values', {})
+        pre_actions = {}
+        post_actions = {}
+
+        wait_timeout = self.timeout
+        wait_labels = {}
+
+        release_name = release_prefix(prefix, release)
+
+        # Retrieve appropriate timeout value
+
+        if wait_timeout <= 0:
+            # TODO(MarshM): chart's `data.timeout` should be deprecated
+            chart_timeout = chart.get('timeout', 0)
+            # Favor data.wait.timeout over data.timeout, until removed
+            wait_values = chart.get('wait', {})
+            wait_timeout = wait_values.get('timeout', chart_timeout)
+            wait_labels = wait_values.get('labels', {})
+
+        this_chart_should_wait = (
+            cg_sequenced or self.force_wait or
+            wait_timeout > 0 or len(wait_labels) > 0)
+
+        if this_chart_should_wait and wait_timeout <= 0:
+            LOG.warn('No Chart timeout specified, using default: %ss',
+                     DEFAULT_CHART_TIMEOUT)
+            wait_timeout = DEFAULT_CHART_TIMEOUT
+
+        result = {
+            'release': release_name,
+            'namespace': namespace,
+            'wait_labels': wait_labels,
+            'wait_timeout': wait_timeout,
+            'test': False,
+            'test_background': False,
+            'test_timeout': 0,
+            'resources': None,
+        }
+
+        # Chart test policy can override ChartGroup, if specified
+        test_this_chart = chart.get('test', cg_test_all_charts)
+
+        chartbuilder = ChartBuilder(
+            chart, dependency_charts=self.dependency_charts)
+        protoc_chart = chartbuilder.get_helm_chart()
+
+        deployed_releases = {x.name: x for x in known_releases}
+
+        # Begin Chart timeout deadline
+        deadline = time.time() + wait_timeout
+
+        # TODO(mark-burnett): It may be more robust to directly call
+        # tiller status to decide whether to install/upgrade rather
+        # than checking for list membership.
+        if release_name in deployed_releases:
+
+            # indicate to the end user what path we are taking
+            LOG.info("Upgrading release %s in namespace %s",
+                     release_name, namespace)
+            upgrade = chart.get('upgrade', {})
+            disable_hooks = upgrade.get('no_hooks', False)
+
+            LOG.info("Checking Pre/Post Actions")
+            if upgrade:
+                upgrade_pre = upgrade.get('pre', {})
+                upgrade_post = upgrade.get('post', {})
+
+                if not self.disable_update_pre and upgrade_pre:
+                    pre_actions = upgrade_pre
+
+                if not self.disable_update_post and upgrade_post:
+                    post_actions = upgrade_post
+
+            # Compare digests of the installed and intended chart and
+            # values, the full diff is only computed when asked for
+            LOG.info('Checking upgrade chart digests.')
+            installed_checksum = deployed_releases[release_name].checksum
+            if installed_checksum == release_digest(protoc_chart, values):
+                LOG.info("There are no updates found in this chart")
+                return result
+
+            if self.display_diff:
+                # fetch the installed chart and installed values of the
+                # latest release so we can show the delta for both the
+                # chart templates and the chart values
+                apply_chart, apply_values = self.find_release_chart(
+                    release_name)
+                self.show_diff(
+                    chart, apply_chart, apply_values,
+                    chartbuilder.dump(), values, msg)
+
+            # TODO(MarshM): Add tiller dry-run before upgrade and
+            # consider deadline impacts
+
+            # do actual update
+            timer = int(round(deadline - time.time()))
+            LOG.info('Beginning Upgrade, wait=%s, timeout=%ss',
+                     this_chart_should_wait, timer)
+            tiller_result = self.tiller.update_release(
+                protoc_chart,
+                release_name,
+                namespace,
+                pre_actions=pre_actions,
+                post_actions=post_actions,
+                dry_run=self.dry_run,
+                disable_hooks=disable_hooks,
+                values=yaml.safe_dump(values),
+                wait=this_chart_should_wait,
+                timeout=timer)
+
+            if this_chart_should_wait:
                 self.tiller.k8s.wait_until_ready(
-                    namespace=ns,
-                    labels=labels_dict,
+                    release=release_name,
+                    labels=wait_labels,
+                    namespace=namespace,
                     k8s_wait_attempts=self.k8s_wait_attempts,
                     k8s_wait_attempt_sleep=self.k8s_wait_attempt_sleep,
-                    timeout=timer)
+                    timeout=timer,
+                    resources=tiller_result.resources
+                )
 
-            # After entire ChartGroup is healthy, run any pending tests
-            for (test, test_timer) in tests_to_run:
-                self._test_chart(test, test_timer)
+            LOG.info('Upgrade completed with results from Tiller: %s',
+                     tiller_result.__dict__)
+            result['resources'] = tiller_result.resources
+            msg['upgrade'].append(release_name)
 
-        LOG.info("Performing Post-Flight Operations")
-        self.post_flight_ops()
+        # process install
+        else:
+            LOG.info("Installing release %s in namespace %s",
+                     release_name, namespace)
+
+            timer = int(round(deadline - time.time()))
+            LOG.info('Beginning Install, wait=%s, timeout=%ss',
+                     this_chart_should_wait, timer)
+            tiller_result = self.tiller.install_release(
+                protoc_chart,
+                release_name,
+                namespace,
+                dry_run=self.dry_run,
+                values=yaml.safe_dump(values),
+                wait=this_chart_should_wait,
+                timeout=timer)
+
+            if this_chart_should_wait:
+                self.tiller.k8s.wait_until_ready(
+                    release=release_name,
+                    labels=wait_labels,
+                    namespace=namespace,
+                    k8s_wait_attempts=self.k8s_wait_attempts,
+                    k8s_wait_attempt_sleep=self.k8s_wait_attempt_sleep,
+                    timeout=timer,
+                    resources=tiller_result.resources
+                )
+
+            LOG.info('Install completed with results from Tiller: %s',
+                     tiller_result.__dict__)
+            result['resources'] = tiller_result.resources
+            msg['install'].append(release_name)
+
+        # Sequenced ChartGroup should run tests after each Chart
+        timer = int(round(deadline - time.time()))
+        if test_this_chart and cg_sequenced:
+            LOG.info('Running sequenced test, timeout remaining: %ss.',
+                     timer)
+            if timer <= 0:
+                reason = ('Timeout expired before testing sequenced '
+                          'release %s' % release_name)
+                LOG.error(reason)
+                raise ArmadaTimeoutException(reason)
+
+            # Non-gating tests run while the sequence carries on
+            if chart.get('test_in_background', False):
+                result['test_background'] = True
+                result['test_timeout'] = timer
+            else:
+                self._test_chart(release_name, timer)
 
-        if self.enable_chart_cleanup:
-            self.tiller.chart_cleanup(
-                prefix,
-                self.manifest[KEYWORD_ARMADA][KEYWORD_GROUPS])
+        # Un-sequenced ChartGroup should run tests at the end
+        elif test_this_chart:
+            result['test'] = True
+            result['test_timeout'] = timer
 
-        return msg
+        return result
 
     def post_flight_ops(self):
         '''
         Operations to run after deployment process has terminated
         '''
-        # Delete temp dirs used for deployment
-        for group in self.manifest.get(KEYWORD_ARMADA, {}).get(
-                KEYWORD_GROUPS, []):
-            for ch in group.get(KEYWORD_CHARTS, []):
-                chart = ch.get('chart', {})
-                if chart.get('source', {}).get('type') == 'git':
-                    source_dir = chart.get('source_dir')
-                    if isinstance(source_dir, tuple) and source_dir:
-                        source.source_cleanup(source_dir[0])
+        # Delete temp dirs used for deployment, including the checkouts of
+        # chart dependencies
+        while self.source_dirs:
+            source.source_cleanup(self.source_dirs.pop())
+
+        # The cached tarballs of this run are not in use anymore, enforce the
+        # tarball cache limits
+        if CONF.tarball_cache_dir:
+            source.evict_tarball_cache()
+
+        # Likewise for the git mirrors the cleaned up checkouts came from
+        if CONF.git_cache_dir:
+            source.evict_git_cache()
 
     def _test_chart(self, release_name, timeout):
-        # TODO(MarshM): Fix testing, it's broken, and track timeout
-        resp = self.tiller.testing_release(release_name, timeout=timeout)
-        status = getattr(resp.info.status, 'last_test_suite_run', 'FAILED')
-        LOG.info("Test INFO: %s", status)
-        if resp:
-            LOG.info("PASSED: %s", release_name)
-            return True
-        else:
-            LOG.info("FAILED: %s", release_name)
-            return False
+        results, errors = run_tests(
+            self.tiller, [(release_name, timeout)], max_workers=1)
+        if release_name in errors:
+            raise errors[release_name]
+        return release_name not in results['failed']
 
     def show_diff(self, chart, installed_chart, installed_values, target_chart,
                   target_values, msg):
-        '''Produce a unified diff of the installed chart vs our intention'''
+        '''Produce a unified diff of the installed chart vs our intention,
+        and a key path diff of the installed values vs the target values'''
 
-        # TODO(MarshM) This gives decent output comparing values. Would be
-        # nice to clean it up further. Are \\n or \n\n ever valid diffs?
-        # Can these be cleanly converted to dicts, for easier compare?
+        # TODO(MarshM) Are \\n or \n\n ever valid diffs?
         def _sanitize_diff_str(str):
             return str.replace('\\n', '\n').replace('\n\n', '\n').split('\n')
 
@@ -532,20 +846,17 @@ class Armada(object):
             pretty_diff = '\n'.join(diff_msg)
             LOG.debug(pretty_diff)
 
-        source = _sanitize_diff_str(installed_values)
-        target = _sanitize_diff_str(yaml.safe_dump(target_values))
-        values_diff = list(difflib.unified_diff(source, target, n=0))
+        diff = values_diff(yaml.safe_load(installed_values), target_values)
+        values_changed = any(diff.values())
 
-        if len(values_diff) > 0:
+        if values_changed:
             LOG.info("Found diff in values (%s)", chart_release)
-            diff_msg = []
-            for line in values_diff:
-                diff_msg.append(line)
-            msg['diff'].append({'values': diff_msg})
+            msg['diff'].append({'values': diff})
 
-            pretty_diff = '\n'.join(diff_msg)
-            LOG.debug(pretty_diff)
+            for kind, paths in diff.items():
+                for path, value in paths.items():
+                    LOG.debug('%s %s: %s', kind, path, value)
 
-        result = (len(chart_diff) > 0) or (len(values_diff) > 0)
+        result = (len(chart_diff) > 0) or values_changed
 
         return result
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import os
 import yaml
 
@@ -25,11 +26,35 @@ from oslo_config import cfg
 from oslo_log import log as logging
 
 from armada.exceptions import chartbuilder_exceptions
+from armada.utils import cache
+from armada.utils import source
 
 LOG = logging.getLogger(__name__)
 
 CONF = cfg.CONF
 
+# Bump when the way charts are built changes, to invalidate cached charts
+CHART_CACHE_VERSION = b'1'
+
+# Version control metadata, left out of the cache key of chart sources
+VCS_METADATA = ('.git', '.hg', '.svn')
+
+
+def _dependency_key(chart):
+    '''Return the key of a dependency chart in the memo of built
+    dependencies: its source path and subpath, and those of its own
+    dependencies. None if the chart sources have not been fetched.
+    '''
+    source_dir = chart.get('source_dir')
+    if not source_dir:
+        return None
+
+    dep_keys = tuple(_dependency_key(dep.get('chart', {}))
+                     for dep in chart.get('dependencies', []))
+    if None in dep_keys:
+        return None
+    return (tuple(source_dir), dep_keys)
+
 
 class ChartBuilder(object):
     '''
@@ -37,15 +62,25 @@ class ChartBuilder(object):
     into proper ``protoc`` Helm charts that can be pushed to Tiller.
     '''
 
-    def __init__(self, chart):
+    def __init__(self, chart, dependency_charts=None):
         '''Initialize the :class:`ChartBuilder` class.
 
         :param dict chart: The document containing all intentions to pass to
                            Tiller.
+        :param dict dependency_charts: Memo of built dependency charts to
+                                       share between the ChartBuilders of a
+                                       run, so that a dependency used by many
+                                       charts is only built once.
         '''
 
         # cache for generated protoc chart object
         self._helm_chart = None
+        self._cache_key = None
+
+        # built dependency charts, keyed by source path and subpath
+        if dependency_charts is None:
+            dependency_charts = {}
+        self.dependency_charts = dependency_charts
 
         # store chart schema
         self.chart = chart
@@ -230,6 +265,97 @@ class ChartBuilder(object):
 
         return templates
 
+    def get_cache_key(self):
+        '''Return the key of this chart in the built chart cache.
+
+        The key of a chart from a git source is the SHA of the git tree of
+        its subpath, as git checkouts are made anew on every run. Otherwise
+        the key covers the relative path, size and modification time of
+        every file under the source directory, version control metadata
+        aside, so that any change to the chart sources yields a new key
+        without having to read the files. The key also covers the keys of
+        all dependencies.
+
+        :returns: Hex digest, or None if the source directory could not be
+                  inspected.
+        '''
+        if self._cache_key:
+            return self._cache_key
+
+        if not os.path.isdir(self.source_directory):
+            return None
+
+        digest = hashlib.sha256(CHART_CACHE_VERSION)
+        tree_sha = None
+        if self.chart.get('source', {}).get('type') == 'git':
+            tree_sha = source.git_tree_sha(*self.chart['source_dir'])
+
+        if tree_sha:
+            digest.update(b'git\0' + tree_sha.encode('utf-8'))
+        else:
+            try:
+                self._update_stat_digest(digest)
+            except OSError as e:
+                LOG.debug('Not caching chart in %s: %s',
+                          self.source_directory, e)
+                return None
+
+        for dep in self.chart.get('dependencies', []):
+            dep_key = ChartBuilder(dep.get('chart', {})).get_cache_key()
+            if dep_key is None:
+                return None
+            digest.update(b'dependency\0' + dep_key.encode('utf-8'))
+
+        self._cache_key = digest.hexdigest()
+        return self._cache_key
+
+    def _update_stat_digest(self, digest):
+        '''Update ``digest`` with the relative path, size and modification
+        time of the files under the source directory.'''
+        for root, dirs, files in os.walk(self.source_directory):
+            dirs[:] = sorted(d for d in dirs if d not in VCS_METADATA)
+            for name in sorted(files):
+                if name in VCS_METADATA:
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                digest.update('{}\0{}\0{}\n'.format(
+                    os.path.relpath(path, self.source_directory),
+                    stat.st_size, stat.st_mtime_ns).encode(
+                        'utf-8', 'surrogateescape'))
+
+    def _load_cached_chart(self):
+        '''Return the chart from the built chart cache, or None.'''
+        key = self.get_cache_key()
+        if key is None:
+            return None
+
+        data = cache.read_entry(CONF.chart_cache_dir, key)
+        if data is None:
+            return None
+
+        try:
+            return Chart.FromString(data)
+        except Exception:
+            LOG.warn('Ignoring corrupt cached chart %s', key)
+            return None
+
+    def _store_cached_chart(self, helm_chart):
+        '''Store ``helm_chart`` in the built chart cache.'''
+        key = self.get_cache_key()
+        if key is None:
+            return
+
+        try:
+            cache.write_entry(CONF.chart_cache_dir, key,
+                              helm_chart.SerializeToString())
+            cache.evict(CONF.chart_cache_dir,
+                        CONF.chart_cache_max_size * 1024 * 1024,
+                        keep=(key,))
+        except (IOError, OSError):
+            LOG.exception('Failed to cache chart %s',
+                          self.chart.get('chart_name'))
+
     def get_helm_chart(self):
         '''Return a Helm chart object.
 
@@ -239,17 +365,39 @@ class ChartBuilder(object):
         if self._helm_chart:
             return self._helm_chart
 
+        chart_name = self.chart.get('chart_name', None)
+        if CONF.chart_cache_dir:
+            helm_chart = self._load_cached_chart()
+            if helm_chart is not None:
+                LOG.info('Using cached build of chart %s.', chart_name)
+                self._helm_chart = helm_chart
+                return helm_chart
+
         dependencies = []
         chart_dependencies = self.chart.get('dependencies', [])
-        chart_name = self.chart.get('chart_name', None)
         chart_release = self.chart.get('release', None)
         for dep in chart_dependencies:
             dep_chart = dep.get('chart', {})
             dep_chart_name = dep_chart.get('chart_name', None)
-            LOG.info("Building dependency chart %s for release %s.",
-                     dep_chart_name, chart_release)
             try:
-                dependencies.append(ChartBuilder(dep_chart).get_helm_chart())
+                key = _dependency_key(dep_chart)
+                dep_helm_chart = self.dependency_charts.get(key)
+                if dep_helm_chart is None:
+                    LOG.info("Building dependency chart %s for release %s.",
+                             dep_chart_name, chart_release)
+                    dep_helm_chart = ChartBuilder(
+                        dep_chart,
+                        dependency_charts=self.dependency_charts
+                    ).get_helm_chart()
+                    if key is not None:
+                        # concurrent builders may race on the same key,
+                        # keep whichever was stored first
+                        dep_helm_chart = self.dependency_charts.setdefault(
+                            key, dep_helm_chart)
+                else:
+                    LOG.info("Using already built dependency chart %s for "
+                             "release %s.", dep_chart_name, chart_release)
+                dependencies.append(dep_helm_chart)
             except Exception:
                 raise chartbuilder_exceptions.DependencyException(chart_name)
 
@@ -264,6 +412,9 @@ class ChartBuilder(object):
             raise chartbuilder_exceptions.HelmChartBuildException(
                 chart_name, details=e)
 
+        if CONF.chart_cache_dir:
+            self._store_cached_chart(helm_chart)
+
         self._helm_chart = helm_chart
         return helm_chart
 
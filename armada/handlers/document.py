@@ -13,16 +13,19 @@
 # limitations under the License.
 """Module for resolving design references."""
 
+from concurrent import futures
 import urllib.parse
 import re
-import requests
 
+from oslo_config import cfg
 from oslo_log import log as logging
 
 from armada.exceptions.source_exceptions import InvalidPathException
+from armada.utils import http
 from armada.utils.keystone import KeystoneUtils
 
 LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
 
 
 class ReferenceResolver(object):
@@ -33,44 +36,71 @@ class ReferenceResolver(object):
         """Resolve a reference to a design document.
 
         Locate a schema handler based on the URI scheme of the data reference
-        and use that handler to get the data referenced.
+        and use that handler to get the data referenced. References are
+        resolved concurrently, up to ``CONF.reference_resolve_workers`` at a
+        time. ``CONF.reference_timeout`` bounds each attempt of a network
+        request, to connect and between bytes received, not the resolution
+        of a reference: the requests of http(s) references are retried up to
+        ``CONF.http_retries`` times with a backoff.
 
         :param design_ref: A list of URI-formatted reference to a data entity
 
-        :returns: A list of byte arrays
+        :returns: A list of byte arrays, in the order of ``design_ref``
         """
-        data = []
         if isinstance(design_ref, str):
             design_ref = [design_ref]
+        if not design_ref:
+            return []
+
+        # Parse all references up front, so that none is fetched when one of
+        # them is invalid
+        handlers = [cls._get_handler(ref) for ref in design_ref]
+
+        workers = min(len(design_ref), CONF.reference_resolve_workers)
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            # Have to do a little magic to call the classmethod
+            # as a pointer
+            results = [executor.submit(handler.__get__(None, cls), design_uri)
+                       for handler, design_uri in handlers]
 
-        for l in design_ref:
+        data = []
+        for ref, result in zip(design_ref, results):
             try:
-                LOG.debug("Resolving reference %s." % l)
-                design_uri = urllib.parse.urlparse(l)
-
-                # when scheme is a empty string assume it is a local
-                # file path
-                if design_uri.scheme == '':
-                    handler = cls.scheme_handlers.get('file')
-                else:
-                    handler = cls.scheme_handlers.get(design_uri.scheme, None)
-
-                if handler is None:
-                    raise InvalidPathException(
-                        "Invalid reference scheme %s: no handler." %
-                        design_uri.scheme)
-                else:
-                    # Have to do a little magic to call the classmethod
-                    # as a pointer
-                    data.append(handler.__get__(None, cls)(design_uri))
+                data.append(result.result())
             except ValueError:
                 raise InvalidPathException(
                     "Cannot resolve design reference %s: unable "
                     "to parse as valid URI."
-                    % l)
+                    % ref)
 
         return data
 
+    @classmethod
+    def _get_handler(cls, ref):
+        """Return the handler for the reference ``ref`` and its parsed URI."""
+        try:
+            LOG.debug("Resolving reference %s." % ref)
+            design_uri = urllib.parse.urlparse(ref)
+
+            # when scheme is a empty string assume it is a local
+            # file path
+            if design_uri.scheme == '':
+                handler = cls.scheme_handlers.get('file')
+            else:
+                handler = cls.scheme_handlers.get(design_uri.scheme, None)
+
+            if handler is None:
+                raise InvalidPathException(
+                    "Invalid reference scheme %s: no handler." %
+                    design_uri.scheme)
+
+            return handler, design_uri
+        except ValueError:
+            raise InvalidPathException(
+                "Cannot resolve design reference %s: unable "
+                "to parse as valid URI."
+                % ref)
+
     @classmethod
     def resolve_reference_http(cls, design_uri):
         """Retrieve design documents from http/https endpoints.
@@ -81,13 +111,15 @@ class ReferenceResolver(object):
         :param design_uri: Tuple as returned by urllib.parse
                             for the design reference
         """
+        session = http.get_session()
         if design_uri.username is not None and design_uri.password is not None:
-            response = requests.get(
+            response = session.get(
                 design_uri.geturl(),
                 auth=(design_uri.username, design_uri.password),
-                timeout=30)
+                timeout=CONF.reference_timeout)
         else:
-            response = requests.get(design_uri.geturl(), timeout=30)
+            response = session.get(design_uri.geturl(),
+                                   timeout=CONF.reference_timeout)
             if response.status_code >= 400:
                 raise InvalidPathException(
                     "Error received for HTTP reference: %d"
@@ -125,7 +157,7 @@ class ReferenceResolver(object):
             (new_scheme, design_uri.netloc, design_uri.path, design_uri.params,
              design_uri.query, design_uri.fragment))
         LOG.debug("Calling Keystone session for url %s" % str(url))
-        resp = ks_sess.get(url)
+        resp = ks_sess.get(url, timeout=CONF.reference_timeout)
         if resp.status_code >= 400:
             raise InvalidPathException(
                 "Received error code for reference %s: %s - %s" %
@@ -0,0 +1,170 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from oslo_log import log as logging
+
+from armada.const import DEFAULT_K8S_TIMEOUT
+
+LOG = logging.getLogger(__name__)
+
+# HTTP status of a watch whose resource version is too old to resume from
+STATUS_GONE = 410
+
+# Time in seconds to wait before retrying a failed list or watch
+RETRY_SLEEP = 1
+
+
+class Informer(object):
+    '''
+    In-memory cache of the Kubernetes objects returned by ``list_func``,
+    kept up to date by a long-lived watch.
+
+    The objects are listed once, then watched from the resource version of
+    that list. Whenever the watch ends it is resumed from the last resource
+    version seen, and the objects are only listed again if that version has
+    expired. Threads waiting on the cache are woken up on every change.
+    '''
+
+    def __init__(self, list_func, namespace=None, label_selector='',
+                 watch_timeout=DEFAULT_K8S_TIMEOUT, condition=None):
+        '''
+        :param list_func: Kubernetes API list function of the objects, such
+            as ``CoreV1Api.list_namespaced_pod``.
+        :param namespace: namespace passed to ``list_func``, None for a
+            function listing across all namespaces.
+        :param label_selector: optional label selector of the objects.
+        :param watch_timeout: time in seconds after which each watch request
+            is ended and resumed, bounding how long ``stop`` takes.
+        :param condition: optional ``threading.Condition`` notified on
+            changes, to share between informers so that a waiter is woken up
+            by a change to any of them. It must use a reentrant lock.
+        '''
+        self.list_func = list_func
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.watch_timeout = watch_timeout
+
+        self._objects = {}
+        self._resource_version = None
+        self._condition = condition or threading.Condition()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._watch = None
+
+    def __repr__(self):
+        return '<Informer %s namespace=%s label_selector=%s>' % (
+            getattr(self.list_func, '__name__', self.list_func),
+            self.namespace, self.label_selector)
+
+    def start(self):
+        '''
+        List the objects and start watching them in the background, unless
+        already started. Errors of the initial list are raised.
+        '''
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._list()
+            self._thread = threading.Thread(
+                target=self._run, name=repr(self), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        '''Stop watching the objects, the cache is not updated anymore.'''
+        with self._start_lock:
+            self._stopped.set()
+            if self._watch is not None:
+                self._watch.stop()
+            self._thread = None
+
+    def list(self):
+        '''Return the cached objects.'''
+        with self._condition:
+            return list(self._objects.values())
+
+    def _kwargs(self):
+        kwargs = {}
+        if self.namespace:
+            kwargs['namespace'] = self.namespace
+        if self.label_selector:
+            kwargs['label_selector'] = self.label_selector
+        return kwargs
+
+    @staticmethod
+    def _key(obj):
+        return (obj.metadata.namespace, obj.metadata.name)
+
+    def _list(self):
+        LOG.debug('Listing objects for %s', self)
+        response = self.list_func(**self._kwargs())
+        objects = {self._key(obj): obj for obj in response.items}
+        with self._condition:
+            self._objects = objects
+            self._resource_version = response.metadata.resource_version
+            self._condition.notify_all()
+
+    def _run(self):
+        relist = False
+        while not self._stopped.is_set():
+            try:
+                if relist:
+                    self._list()
+                    relist = False
+                self._watch_once()
+            except ApiException as e:
+                if e.status == STATUS_GONE:
+                    LOG.debug('Resource version %s of %s expired, listing '
+                              'again', self._resource_version, self)
+                    relist = True
+                    continue
+                LOG.warn('Watch of %s failed, retrying: %s', self, e)
+                self._stopped.wait(RETRY_SLEEP)
+            except Exception:
+                LOG.exception('Watch of %s failed, retrying.', self)
+                self._stopped.wait(RETRY_SLEEP)
+
+    def _watch_once(self):
+        w = watch.Watch()
+        self._watch = w
+        for event in w.stream(self.list_func,
+                              resource_version=self._resource_version,
+                              timeout_seconds=self.watch_timeout,
+                              **self._kwargs()):
+            if self._stopped.is_set():
+                w.stop()
+                return
+
+            event_type = event['type'].upper()
+            if event_type == 'ERROR':
+                status = event.get('raw_object') or {}
+                raise ApiException(status=status.get('code'),
+                                   reason=status.get('message'))
+
+            obj = event['object']
+            with self._condition:
+                if event_type == 'DELETED':
+                    self._objects.pop(self._key(obj), None)
+                elif event_type in {'ADDED', 'MODIFIED'}:
+                    self._objects[self._key(obj)] = obj
+                else:
+                    LOG.debug('Ignoring %s event for %s', event_type, self)
+                    continue
+                self._resource_version = obj.metadata.resource_version
+                self._condition.notify_all()
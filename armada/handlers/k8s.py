@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
+from collections import Counter
+import threading
 import time
 
 from kubernetes import client
@@ -23,12 +24,27 @@ from oslo_config import cfg
 from oslo_log import log as logging
 
 from armada.const import DEFAULT_K8S_TIMEOUT
+from armada.handlers.informer import Informer
 from armada.utils.release import label_selectors
 from armada.exceptions import k8s_exceptions as exceptions
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# Kinds of resources waited on, and the kind of the controller owning the
+# pods of each workload kind
+WORKLOAD_KINDS = {
+    'deployment': 'Deployment',
+    'statefulset': 'StatefulSet',
+    'daemonset': 'DaemonSet',
+    'job': 'Job',
+}
+WAIT_KINDS = ('pod',) + tuple(sorted(WORKLOAD_KINDS))
+
+# Labels conventionally holding the name of the release of a resource, by
+# Helm and by the OpenStack-Helm toolkit
+RELEASE_LABELS = ('release', 'release_group')
+
 
 class K8s(object):
     '''
@@ -49,6 +65,14 @@ class K8s(object):
         self.batch_v1beta1_api = client.BatchV1beta1Api()
         self.extension_api = client.ExtensionsV1beta1Api()
 
+        self.apps_api = client.AppsV1Api()
+
+        self._informers = {}
+        self._informers_lock = threading.Lock()
+        # Shared by the informers, so a wait spanning several of them is
+        # woken up by a change to any
+        self._informer_condition = threading.Condition()
+
     def delete_job_action(self, name, namespace="default",
                           propagation_policy='Foreground',
                           timeout=DEFAULT_K8S_TIMEOUT):
@@ -227,58 +251,83 @@ class K8s(object):
 
         return self.client.delete_namespaced_pod(name, namespace, body)
 
-    def wait_for_pod_redeployment(self, old_pod_name, namespace):
+    def wait_for_pods_redeployment(self, old_pods, namespace,
+                                   label_selector='',
+                                   timeout=DEFAULT_K8S_TIMEOUT,
+                                   controller=None):
         '''
-        :param old_pod_name - name of pods
-        :param namespace - kubernetes namespace
+        Wait until every pod of ``old_pods``, which were just deleted, is
+        replaced by a new ready pod of the same controller, on the same node
+        for the pods of a DaemonSet. All the pods are tracked at once over
+        the pod cache of ``label_selector`` in ``namespace``.
+
+        Old pods without a controller, such as pods orphaned by the deletion
+        of their DaemonSet, are expected to be replaced by pods of
+        ``controller`` if given. Otherwise any new ready pod on their node
+        replaces them.
+
+        :param old_pods: list of the deleted ``V1Pod``
+        :param namespace: kubernetes namespace of the pods
+        :param label_selector: label selector matching the old and new pods
+        :param timeout: time to wait for the new pods
+        :param controller: optional ``(kind, name)`` of the controller
+            replacing the old pods without controller
+        :raises KubernetesWatchTimeoutException: if some pods are not
+            replaced in time
         '''
-
-        base_pod_pattern = re.compile('^(.+)-[a-zA-Z0-9]+$')
-
-        if not base_pod_pattern.match(old_pod_name):
-            LOG.error('Could not identify new pod after purging %s',
-                      old_pod_name)
+        informer = self.get_informer('pod', namespace, label_selector)
+        old_uids = {pod.metadata.uid for pod in old_pods}
+
+        expected = Counter()
+        for pod in old_pods:
+            key = self._replacement_key(pod, controller)
+            if key is None:
+                LOG.warn('Pod %s has no controller, waiting for any new pod '
+                         'on its node.', pod.metadata.name)
+                key = ('Node', pod.spec.node_name)
+            expected[key] += 1
+        if not expected:
             return
 
-        pod_base_name = base_pod_pattern.match(old_pod_name).group(1)
-
-        new_pod_name = ''
-
-        w = watch.Watch()
-        for event in w.stream(self.client.list_namespaced_pod, namespace):
-            event_name = event['object'].metadata.name
-            event_match = base_pod_pattern.match(event_name)
-            if not event_match or not event_match.group(1) == pod_base_name:
-                continue
-
-            pod_conditions = event['object'].status.conditions
-            # wait for new pod deployment
-            if event['type'] == 'ADDED' and not pod_conditions:
-                new_pod_name = event_name
-            elif new_pod_name:
-                for condition in pod_conditions:
-                    if (condition.type == 'Ready' and
-                            condition.status == 'True'):
-                        LOG.info('New pod %s deployed', new_pod_name)
-                        w.stop()
-
-    def wait_get_completed_podphase(self, release,
-                                    timeout=DEFAULT_K8S_TIMEOUT):
+        def _missing():
+            replaced = Counter()
+            for pod in informer.list():
+                if (pod.metadata.uid in old_uids or
+                        not self._is_pod_ready(pod)):
+                    continue
+                # A pod on no particular node is replaced by any new pod
+                replaced.update([self._replacement_key(pod),
+                                 ('Node', pod.spec.node_name),
+                                 ('Node', None)])
+            return sorted('%s/%s' % key[:2] for key, count in expected.items()
+                          if replaced[key] < count)
+
+        LOG.debug('Waiting for the redeployment of pods %s in namespace=%s, '
+                  'timeout=%s', sorted(p.metadata.name for p in old_pods),
+                  namespace, timeout)
+        if not self._wait_for(lambda: not _missing(), timeout):
+            reason = ('Timed out waiting for pods of %s to be redeployed in '
+                      'namespace=%s' % (_missing(), namespace))
+            LOG.error(reason)
+            raise exceptions.KubernetesWatchTimeoutException(reason)
+
+        LOG.info('New pods of %s deployed',
+                 sorted('%s/%s' % key[:2] for key in expected))
+
+    @classmethod
+    def _replacement_key(cls, pod, controller=None):
         '''
-        :param release - part of namespace
-        :param timeout - time before disconnecting stream
+        Return what a pod and its replacement have in common: the kind and
+        name of their controller, ``controller`` if the pod has none, and
+        their node for a DaemonSet. None for a pod without controller.
         '''
-
-        w = watch.Watch()
-        for event in w.stream(self.client.list_pod_for_all_namespaces,
-                              timeout_seconds=timeout):
-            pod_name = event['object'].metadata.name
-
-            if release in pod_name:
-                pod_state = event['object'].status.phase
-                if pod_state == 'Succeeded':
-                    w.stop()
-                    break
+        controller = cls._get_controller(pod) or controller
+        if controller is None:
+            return None
+        controller = tuple(controller)
+        if controller[0] == 'DaemonSet':
+            return controller + (pod.spec.node_name,)
+        return controller
 
     def wait_until_ready(self,
                          release=None,
@@ -286,30 +335,45 @@ class K8s(object):
                          labels='',
                          timeout=DEFAULT_K8S_TIMEOUT,
                          k8s_wait_attempts=1,
-                         k8s_wait_attempt_sleep=1):
+                         k8s_wait_attempt_sleep=1,
+                         resources=None):
         '''
-        Wait until all pods become ready given the filters provided by
-        ``release``, ``labels`` and ``namespace``.
+        Wait until all workloads and pods become ready given the filters
+        provided by ``release``, ``resources``, ``labels`` and
+        ``namespace``.
+
+        Deployments, StatefulSets, DaemonSets and Jobs are selected when
+        their labels or the labels of their pod template match, and their
+        readiness is read from their status. Pods are only checked one by
+        one when they are not managed by a selected workload. All of them
+        are looked up in the caches of the namespace, shared by all waits on
+        that namespace, rather than watched for each wait.
+
+        The wait is limited to the resources of the release when they are
+        known, otherwise to the resources not labelled as part of another
+        release, so that unrelated pods of a shared namespace are ignored.
 
         :param release: chart release
         :param namespace: the namespace used to filter which pods to wait on
         :param labels: the labels used to filter which pods to wait on
-        :param timeout: time before disconnecting ``Watch`` stream
+        :param timeout: time to wait for the pods to become ready
         :param k8s_wait_attempts: The number of times to attempt waiting
             for pods to become ready (minimum 1).
         :param k8s_wait_attempt_sleep: The time in seconds to sleep
             between attempts (minimum 1).
+        :param resources: set of ``(kind, name)`` of the resources in the
+            manifest of ``release``, see
+            :func:`armada.utils.release.manifest_resources`.
         '''
-        # NOTE(MarshM) 'release' is currently unused
         label_selector = label_selectors(labels) if labels else ''
 
         wait_attempts = (k8s_wait_attempts if k8s_wait_attempts >= 1 else 1)
         sleep_time = (k8s_wait_attempt_sleep if k8s_wait_attempt_sleep >= 1
                       else 1)
 
-        LOG.debug("Wait on namespace=(%s) labels=(%s) for %s sec "
-                  "(k8s wait %s times, sleep %ss)",
-                  namespace, label_selector, timeout,
+        LOG.debug("Wait on release=(%s) namespace=(%s) labels=(%s) for %s "
+                  "sec (k8s wait %s times, sleep %ss)",
+                  release, namespace, label_selector, timeout,
                   wait_attempts, sleep_time)
 
         if not namespace:
@@ -320,6 +384,51 @@ class K8s(object):
             LOG.warn('"label_selector" not specified, waiting with no labels '
                      'may cause unintended consequences.')
 
+        informers = [(kind, self.get_informer(kind, namespace))
+                     for kind in WAIT_KINDS]
+        labels = labels or {}
+
+        def _in_release(kind, obj):
+            if resources is not None:
+                return ((WORKLOAD_KINDS.get(kind, 'Pod'), obj.metadata.name)
+                        in resources)
+            if release:
+                obj_labels = obj.metadata.labels or {}
+                return all(obj_labels.get(label, release) == release
+                           for label in RELEASE_LABELS)
+            return True
+
+        def _selected():
+            '''Return the (kind, object) pairs to wait on.'''
+            workloads = []
+            for kind, informer in informers:
+                if kind == 'pod':
+                    continue
+                workloads.extend(
+                    (kind, obj) for obj in informer.list()
+                    if _in_release(kind, obj) and (
+                        self._match_labels(obj, labels) or
+                        self._match_labels(obj.spec.template, labels)))
+
+            managed = set()
+            for kind, obj in workloads:
+                managed.add((WORKLOAD_KINDS[kind], obj.metadata.name))
+
+            pods = [('pod', pod) for pod in dict(informers)['pod'].list()
+                    if self._match_labels(pod, labels) and
+                    self._get_controller(pod) not in managed and
+                    _in_release('pod', pod)]
+            return workloads + pods
+
+        def _unready():
+            return ['%s/%s' % (kind, obj.metadata.name)
+                    for kind, obj in _selected()
+                    if not self._is_ready(kind, obj)]
+
+        def _versions():
+            return {(kind, obj.metadata.name): obj.metadata.resource_version
+                    for kind, obj in _selected()}
+
         deadline = time.time() + timeout
 
         # NOTE(mark-burnett): Attempt to wait multiple times without
@@ -327,112 +436,197 @@ class K8s(object):
 
         successes = 0
         while successes < wait_attempts:
-            deadline_remaining = int(round(deadline - time.time()))
+            deadline_remaining = deadline - time.time()
             if deadline_remaining <= 0:
                 return False
-            timed_out, modified_pods, unready_pods = self._wait_one_time(
-                namespace=namespace, label_selector=label_selector,
-                timeout=deadline_remaining)
 
-            if timed_out:
-                LOG.info('Timed out waiting for pods: %s',
-                         sorted(unready_pods))
+            versions = _versions()
+            if not self._wait_for(lambda: not _unready(),
+                                  deadline_remaining):
+                LOG.info('Timed out waiting for: %s', sorted(_unready()))
                 raise exceptions.KubernetesWatchTimeoutException(
-                    'Timed out while waiting on namespace=(%s) labels=(%s)' %
-                    (namespace, label_selector))
-                return False
-
-            if modified_pods:
+                    'Timed out while waiting on release=(%s) namespace=(%s) '
+                    'labels=(%s)' % (release, namespace, label_selector))
+
+            new_versions = _versions()
+            modified = {'%s/%s' % key
+                        for key, version in new_versions.items()
+                        if versions.get(key) != version}
+            modified.update('%s/%s' % key
+                            for key in set(versions) - set(new_versions))
+            if modified:
                 successes = 0
-                LOG.debug('Continuing to wait, found modified pods: %s',
-                          sorted(modified_pods))
+                LOG.debug('Continuing to wait, found modified resources: %s',
+                          sorted(modified))
             else:
                 successes += 1
-                LOG.debug('Found no modified pods this attempt. successes=%d',
-                          successes)
+                LOG.debug('Found no modified resources this attempt. '
+                          'successes=%d', successes)
 
             time.sleep(sleep_time)
 
         return True
 
-    def _wait_one_time(self, namespace, label_selector, timeout=100):
-        LOG.debug('Starting to wait: namespace=%s, label_selector=(%s), '
-                  'timeout=%s', namespace, label_selector, timeout)
-        ready_pods = {}
-        modified_pods = set()
-        w = watch.Watch()
-        first_event = True
-
-        # Watch across specific namespace, or all
-        kwargs = {
-            'label_selector': label_selector,
-            'timeout_seconds': timeout,
-        }
-        if namespace:
-            func_to_call = self.client.list_namespaced_pod
-            kwargs['namespace'] = namespace
-        else:
-            func_to_call = self.client.list_pod_for_all_namespaces
-
-        for event in w.stream(func_to_call, **kwargs):
-            if first_event:
-                pod_list = func_to_call(**kwargs)
-                for pod in pod_list.items:
-                    LOG.debug('Setting up to wait for pod %s namespace=%s',
-                              pod.metadata.name, pod.metadata.namespace)
-                    ready_pods[pod.metadata.name] = False
-                first_event = False
-
-            event_type = event['type'].upper()
-            pod_name = event['object'].metadata.name
-            LOG.debug('Watch event for pod %s namespace=%s label_selector=%s',
-                      pod_name, namespace, label_selector)
-
-            if event_type in {'ADDED', 'MODIFIED'}:
-                status = event['object'].status
-                pod_phase = status.phase
-
-                pod_ready = True
-                if (pod_phase == 'Succeeded' or
-                    (pod_phase == 'Running' and
-                        self._get_pod_condition(status.conditions,
-                                                'Ready') == 'True')):
-                    LOG.debug('Pod %s is ready!', pod_name)
-                else:
-                    pod_ready = False
-                    LOG.debug('Pod %s not ready: conditions:\n%s\n'
-                              'container_statuses:\n%s', pod_name,
-                              status.conditions, status.container_statuses)
-
-                ready_pods[pod_name] = pod_ready
-
-                if event_type == 'MODIFIED':
-                    modified_pods.add(pod_name)
-
-            elif event_type == 'DELETED':
-                LOG.debug('Pod %s: removed from tracking', pod_name)
-                ready_pods.pop(pod_name)
-
-            elif event_type == 'ERROR':
-                LOG.error('Pod %s: Got error event %s',
-                          pod_name, event['object'].to_dict())
-                raise exceptions.KubernetesErrorEventException(
-                    'Got error event for pod: %s' % event['object'])
+    def _wait_for(self, predicate, timeout):
+        '''
+        Wait until ``predicate()`` is true, re-evaluating it whenever any of
+        the cached resources changes.
 
-            else:
-                LOG.error('Unrecognized event type (%s) for pod: %s',
-                          event_type, event['object'])
-                raise exceptions.KubernetesUnknownStreamingEventTypeException(
-                    'Got unknown event type (%s) for pod: %s'
-                    % (event_type, event['object']))
-
-            if all(ready_pods.values()):
-                return (False, modified_pods, [])
-
-        # NOTE(mark-burnett): This path is reachable if there are no pods
-        # (unlikely) or in the case of the watch timing out.
-        return (not all(ready_pods.values()), modified_pods,
-                [name for name, ready in ready_pods.items() if not ready])
+        :returns: True if the predicate was met, False on timeout.
+        '''
+        deadline = time.time() + timeout
+        with self._informer_condition:
+            while not predicate():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._informer_condition.wait(remaining)
+            return True
+
+    def get_informer(self, kind, namespace='', label_selector=''):
+        '''
+        Return the started cache of the resources of ``kind`` in
+        ``namespace``, shared by every wait on this namespace and labels.
+
+        :param kind: one of ``pod``, ``deployment``, ``statefulset``,
+            ``daemonset`` and ``job``.
+        :param namespace: namespace of the resources, all namespaces if
+            empty.
+        :param label_selector: optional label selector of the resources.
+        '''
+        key = (kind, namespace, label_selector)
+        with self._informers_lock:
+            informer = self._informers.get(key)
+            if informer is None:
+                namespaced, all_namespaces = self._list_funcs(kind)
+                informer = Informer(
+                    namespaced if namespace else all_namespaces,
+                    namespace=namespace or None,
+                    label_selector=label_selector,
+                    condition=self._informer_condition)
+                self._informers[key] = informer
+        informer.start()
+        return informer
+
+    def stop_informers(self):
+        '''Stop watching the resources of all the cached namespaces.'''
+        with self._informers_lock:
+            informers = list(self._informers.values())
+            self._informers.clear()
+        for informer in informers:
+            informer.stop()
+
+    def _list_funcs(self, kind):
+        '''
+        Return the functions listing the resources of ``kind`` in a
+        namespace and across all namespaces.
+        '''
+        return {
+            'pod': (self.client.list_namespaced_pod,
+                    self.client.list_pod_for_all_namespaces),
+            'deployment': (self.apps_api.list_namespaced_deployment,
+                           self.apps_api.list_deployment_for_all_namespaces),
+            'statefulset': (
+                self.apps_api.list_namespaced_stateful_set,
+                self.apps_api.list_stateful_set_for_all_namespaces),
+            'daemonset': (self.apps_api.list_namespaced_daemon_set,
+                          self.apps_api.list_daemon_set_for_all_namespaces),
+            'job': (self.batch_api.list_namespaced_job,
+                    self.batch_api.list_job_for_all_namespaces),
+        }[kind]
+
+    @staticmethod
+    def _match_labels(obj, labels):
+        obj_labels = (obj.metadata.labels if obj and obj.metadata else
+                      None) or {}
+        return all(obj_labels.get(k) == str(v) for k, v in labels.items())
+
+    @staticmethod
+    def _get_controller(pod):
+        '''
+        Return the ``(kind, name)`` of the workload managing ``pod``. Pods of
+        a Deployment are owned by one of its ReplicaSets, named after the
+        Deployment and the pod template hash.
+        '''
+        for ref in pod.metadata.owner_references or []:
+            if not ref.controller:
+                continue
+            pod_labels = pod.metadata.labels or {}
+            suffix = '-%s' % pod_labels.get('pod-template-hash')
+            if ref.kind == 'ReplicaSet' and ref.name.endswith(suffix):
+                return ('Deployment', ref.name[:-len(suffix)])
+            return (ref.kind, ref.name)
+        return None
+
+    def _is_ready(self, kind, obj):
+        return {
+            'pod': self._is_pod_ready,
+            'deployment': self._is_deployment_ready,
+            'statefulset': self._is_statefulset_ready,
+            'daemonset': self._is_daemonset_ready,
+            'job': self._is_job_ready,
+        }[kind](obj)
+
+    def _is_pod_ready(self, pod):
+        status = pod.status
+        if status.phase == 'Succeeded':
+            return True
+        return (status.phase == 'Running' and
+                self._get_pod_condition(status.conditions or [],
+                                        'Ready') == 'True')
+
+    @staticmethod
+    def _is_observed(obj):
+        '''Whether the controller has seen the latest spec of ``obj``.'''
+        return ((obj.status.observed_generation or 0) >=
+                (obj.metadata.generation or 0))
+
+    def _is_deployment_ready(self, deployment):
+        status = deployment.status
+        replicas = deployment.spec.replicas
+        replicas = 1 if replicas is None else replicas
+        updated = status.updated_replicas or 0
+        # Old replicas are still around until the total matches the updated
+        return (self._is_observed(deployment) and
+                updated >= replicas and
+                (status.replicas or 0) <= updated and
+                (status.ready_replicas or 0) >= updated)
+
+    def _is_statefulset_ready(self, statefulset):
+        spec = statefulset.spec
+        status = statefulset.status
+        replicas = 1 if spec.replicas is None else spec.replicas
+
+        expected_updated = replicas
+        strategy = spec.update_strategy
+        if strategy and strategy.type == 'OnDelete':
+            expected_updated = 0
+        elif strategy and strategy.rolling_update:
+            # Pods below the partition are left at the current revision
+            expected_updated -= strategy.rolling_update.partition or 0
+
+        return (self._is_observed(statefulset) and
+                (status.updated_replicas or 0) >= expected_updated and
+                (status.ready_replicas or 0) >= replicas)
+
+    def _is_daemonset_ready(self, daemonset):
+        status = daemonset.status
+        desired = status.desired_number_scheduled or 0
+
+        strategy = daemonset.spec.update_strategy
+        updated = True
+        if not strategy or strategy.type != 'OnDelete':
+            updated = (status.updated_number_scheduled or 0) >= desired
+
+        return (self._is_observed(daemonset) and updated and
+                (status.number_ready or 0) >= desired)
+
+    @staticmethod
+    def _is_job_ready(job):
+        completions = job.spec.completions
+        if completions is None:
+            completions = 1
+        return (job.status.succeeded or 0) >= completions
 
     def _get_pod_condition(self, pod_conditions, condition_type):
         for pc in pod_conditions:
@@ -0,0 +1,152 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from concurrent import futures
+
+from hapi.release.info_pb2 import Info
+from hapi.release.status_pb2 import Status
+from hapi.release.test_run_pb2 import TestRun
+from hapi.services.tiller_pb2 import GetReleaseStatusResponse
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from armada.const import DEFAULT_TEST_TIMEOUT
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+# Prefix of the messages streamed by Tiller for each completed test pod, used
+# to tell the outcome of a test when Tiller does not set its status
+TEST_MESSAGE_PREFIXES = {
+    'PASSED': TestRun.SUCCESS,
+    'FAILED': TestRun.FAILURE,
+}
+
+
+def parse_test_response(resp):
+    '''
+    Return the ``TestRun`` of a completed test pod from a response of the
+    ``RunReleaseTest`` stream, or None for a progress or error message.
+
+    Tiller reports each test pod as ``RUNNING: <pod>`` then as
+    ``PASSED: <pod>`` or ``FAILED: <pod>, <details>``.
+    '''
+    prefix, sep, rest = resp.msg.partition(':')
+    status = resp.status
+    if status not in (TestRun.SUCCESS, TestRun.FAILURE):
+        if status != TestRun.UNKNOWN or not sep:
+            return None
+        # Tiller releases before 2.9 only set the message
+        status = TEST_MESSAGE_PREFIXES.get(prefix.strip())
+        if status is None:
+            return None
+    name = rest.split(',', 1)[0].strip()
+    return TestRun(name=name, status=status, info=resp.msg)
+
+
+def add_test_responses(release, test_suite, responses):
+    '''
+    Add to ``test_suite`` the results of the tests of ``release`` found in
+    ``responses`` of the ``RunReleaseTest`` stream, logging each response.
+    '''
+    for resp in responses:
+        LOG.info('Test %s: %s', release, resp.msg)
+        test_run = parse_test_response(resp)
+        if test_run is not None:
+            test_suite.results.extend([test_run])
+
+
+def test_suite_status(release, test_suite):
+    '''
+    Return the status of ``release`` holding ``test_suite`` as its last test
+    suite run, as returned by ``Tiller.testing_release``, or False if the
+    test suite has no result, the release having no test.
+    '''
+    if not test_suite.results:
+        LOG.info('No test found')
+        return False
+    return GetReleaseStatusResponse(
+        name=release,
+        info=Info(status=Status(last_test_suite_run=test_suite)))
+
+
+def test_passed(release_status):
+    '''
+    Return whether all the tests of the last test suite run passed, given
+    the status of a release as returned by ``Tiller.testing_release``.
+    '''
+    test_suite = release_status.info.status.last_test_suite_run
+    return (len(test_suite.results) > 0 and
+            all(r.status == TestRun.SUCCESS for r in test_suite.results))
+
+
+def run_tests(tiller, tests, max_workers=None):
+    '''
+    Run the tests of several releases concurrently.
+
+    Each release is tested by ``Tiller.testing_release`` within its own
+    timeout, on a pool of at most ``max_workers`` threads.
+
+    :param tiller: :class:`armada.handlers.tiller.Tiller` to test with.
+    :param tests: list of ``(release_name, timeout)`` tuples, a timeout of
+        None meaning ``DEFAULT_TEST_TIMEOUT``.
+    :param int max_workers: optional, maximum number of releases tested at
+        once, ``CONF.release_test_workers`` by default.
+    :returns: Tuple of ``(results, errors)``: an OrderedDict of ``passed``,
+        ``skipped`` (no test found) and ``failed`` lists of release names,
+        in the order of ``tests``, and a dict of release name to the
+        exception raised while testing it. Releases which raised are listed
+        as ``failed`` too.
+    '''
+    results = OrderedDict(
+        (outcome, []) for outcome in ('passed', 'skipped', 'failed'))
+    errors = OrderedDict()
+    if not tests:
+        return results, errors
+
+    if max_workers is None:
+        max_workers = CONF.release_test_workers
+    max_workers = max(1, min(max_workers, len(tests)))
+    LOG.info('Testing %s releases with %s workers.', len(tests), max_workers)
+
+    def _test(release_name, timeout):
+        LOG.info('RUNNING: %s tests', release_name)
+        resp = tiller.testing_release(
+            release_name, timeout=timeout or DEFAULT_TEST_TIMEOUT)
+        if not resp:
+            LOG.info('No test found for %s - SKIPPING', release_name)
+            return 'skipped'
+        if test_passed(resp):
+            LOG.info('PASSED: %s', release_name)
+            return 'passed'
+        LOG.info('FAILED: %s', release_name)
+        return 'failed'
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        test_futures = [(release_name, executor.submit(_test, release_name,
+                                                       timeout))
+                        for release_name, timeout in tests]
+
+        for release_name, future in test_futures:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                LOG.exception('Testing release %s failed.', release_name)
+                errors[release_name] = e
+                outcome = 'failed'
+            results[outcome].append(release_name)
+
+    LOG.info('Test results: %s', dict(results))
+    return results, errors
@@ -12,10 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import namedtuple
+
 import grpc
 import yaml
 
 from hapi.chart.config_pb2 import Config
+from hapi.release.test_suite_pb2 import TestSuite
 from hapi.services.tiller_pb2 import GetReleaseContentRequest
 from hapi.services.tiller_pb2 import GetReleaseStatusRequest
 from hapi.services.tiller_pb2 import GetVersionRequest
@@ -28,9 +31,14 @@ from hapi.services.tiller_pb2 import UpdateReleaseRequest
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from armada.const import DEFAULT_TEST_TIMEOUT
 from armada.const import STATUS_DEPLOYED, STATUS_FAILED
 from armada.exceptions import tiller_exceptions as ex
 from armada.handlers.k8s import K8s
+from armada.handlers.test import add_test_responses
+from armada.handlers.test import test_suite_status
+from armada.utils.release import release_digest
+from armada.utils.release import manifest_resources
 from armada.utils.release import release_prefix
 from armada.utils.release import label_selectors
 
@@ -42,9 +50,9 @@ RUNTEST_SUCCESS = 9
 
 # the standard gRPC max message size is 4MB
 # this expansion comes at a performance penalty
-# but until proper paging is supported, we need
-# to support a larger payload as the current
-# limit is exhausted with just 10 releases
+# but a single page of releases, or a single release
+# (including its chart and templates), can still exceed
+# it, so we need to support a larger payload
 MAX_MESSAGE_LENGTH = 429496729
 
 CONF = cfg.CONF
@@ -52,13 +60,105 @@ LOG = logging.getLogger(__name__)
 
 
 class TillerResult(object):
-    '''Object to hold Tiller results for Armada.'''
-    def __init__(self, release, namespace, status, description, version):
+    '''Object to hold Tiller results for Armada.
+
+    ``resources`` is the set of ``(kind, name)`` of the resources in the
+    release manifest, None if unknown.
+    '''
+    def __init__(self, release, namespace, status, description, version,
+                 resources=None):
         self.release = release
         self.namespace = namespace
         self.status = status
         self.description = description
         self.version = version
+        self.resources = resources
+
+    @classmethod
+    def from_release(cls, release):
+        '''Build the result of an install or update from a hapi Release.'''
+        return cls(
+            release.name,
+            release.namespace,
+            release.info.status.Code.Name(release.info.status.code),
+            release.info.Description,
+            release.version,
+            resources=manifest_resources(release.manifest))
+
+
+# Compact description of a release, as known to Tiller. ``checksum`` is the
+# ``release_digest`` of the release's chart and values.
+ReleaseIndexEntry = namedtuple(
+    'ReleaseIndexEntry',
+    ['name', 'version', 'namespace', 'status', 'checksum'])
+
+
+def list_releases_request(offset=''):
+    '''
+    Return the request of a page of ``RELEASE_LIMIT`` releases from
+    ``offset``, latest released first.
+    '''
+    # NOTE(MarshM): `Helm List` defaults to returning Deployed and
+    # Failed, but this might not be a desireable ListReleasesRequest
+    # default.
+    return ListReleasesRequest(limit=RELEASE_LIMIT,
+                               offset=offset,
+                               status_codes=[STATUS_DEPLOYED,
+                                             STATUS_FAILED],
+                               sort_by='LAST_RELEASED',
+                               sort_order='DESC')
+
+
+def install_release_request(chart, release, namespace, dry_run=False,
+                            values=None, wait=False, timeout=None):
+    '''
+    Return the request installing ``chart`` as ``release`` in ``namespace``,
+    with the raw YAML ``values``.
+    '''
+    LOG.debug('Helm install release%s: wait=%s, timeout=%s',
+              (' (dry run)' if dry_run else ''), wait, timeout)
+    return InstallReleaseRequest(
+        chart=chart,
+        dry_run=dry_run,
+        values=Config(raw=values or ''),
+        name=release,
+        namespace=namespace,
+        wait=wait,
+        timeout=timeout)
+
+
+def update_release_request(chart, release, dry_run=False,
+                           disable_hooks=False, values=None, wait=False,
+                           timeout=None):
+    '''
+    Return the request updating ``release`` to ``chart``, with the raw YAML
+    ``values``.
+    '''
+    LOG.debug('Helm update release%s: wait=%s, timeout=%s',
+              (' (dry run)' if dry_run else ''), wait, timeout)
+    return UpdateReleaseRequest(
+        chart=chart,
+        dry_run=dry_run,
+        disable_hooks=disable_hooks,
+        values=Config(raw=values or ''),
+        name=release,
+        wait=wait,
+        timeout=timeout)
+
+
+def run_release_test_request(release, timeout=DEFAULT_TEST_TIMEOUT,
+                             cleanup=True):
+    '''Return the request running the tests of ``release``.'''
+    LOG.debug("Helm test release %s, timeout=%s", release, timeout)
+    return TestReleaseRequest(name=release, timeout=timeout, cleanup=cleanup)
+
+
+def uninstall_release_request(release, disable_hooks=False, purge=True):
+    '''Return the request uninstalling ``release``.'''
+    LOG.info("Uninstall %s release with disable_hooks=%s, "
+             "purge=%s flags", release, disable_hooks, purge)
+    return UninstallReleaseRequest(
+        name=release, disable_hooks=disable_hooks, purge=purge)
 
 
 class Tiller(object):
@@ -173,31 +273,52 @@ class Tiller(object):
     def list_releases(self):
         '''
         List Helm Releases
+
+        Returns a list of all releases, see ``iter_releases``.
+        '''
+        return list(self.iter_releases())
+
+    def iter_releases(self):
+        '''
+        Iterate over Helm Releases, one page of ``RELEASE_LIMIT`` releases at
+        a time.
+
+        Follows the ``next`` offset returned by Tiller until all releases have
+        been listed, so that no more than a page of releases is held in
+        memory at once.
         '''
         # TODO(MarshM possibly combine list_releases() with list_charts()
         # since they do the same thing, grouping output differently
-        releases = []
         stub = ReleaseServiceStub(self.channel)
-        # TODO(mark-burnett): Since we're limiting page size, we need to
-        # iterate through all the pages when collecting this list.
-        # NOTE(MarshM): `Helm List` defaults to returning Deployed and Failed,
-        # but this might not be a desireable ListReleasesRequest default.
-        req = ListReleasesRequest(limit=RELEASE_LIMIT,
-                                  status_codes=[STATUS_DEPLOYED,
-                                                STATUS_FAILED],
-                                  sort_by='LAST_RELEASED',
-                                  sort_order='DESC')
-
-        LOG.debug('Tiller ListReleases() with timeout=%s', self.timeout)
-        release_list = stub.ListReleases(req, self.timeout,
-                                         metadata=self.metadata)
-
-        for y in release_list:
-            # TODO(MarshM) this log is too noisy, fix later
-            # LOG.debug('Found release: %s', y.releases
-            releases.extend(y.releases)
-
-        return releases
+        offset = ''
+        seen_offsets = set()
+
+        while True:
+            req = list_releases_request(offset)
+
+            LOG.debug('Tiller ListReleases() with timeout=%s, offset=%s',
+                      self.timeout, offset)
+            release_list = stub.ListReleases(req, self.timeout,
+                                             metadata=self.metadata)
+
+            next_offset = ''
+            for y in release_list:
+                # TODO(MarshM) this log is too noisy, fix later
+                # LOG.debug('Found release: %s', y.releases
+                for release in y.releases:
+                    yield release
+                next_offset = y.next or next_offset
+
+            if not next_offset:
+                return
+
+            if next_offset in seen_offsets:
+                LOG.warn('Tiller ListReleases() returned offset %s more than '
+                         'once, stopping release listing.', next_offset)
+                return
+
+            seen_offsets.add(next_offset)
+            offset = next_offset
 
     def get_chart_templates(self, template_name, name, release_name, namespace,
                             chart, disable_hooks, values):
@@ -293,7 +414,7 @@ class Tiller(object):
         '''
         LOG.debug('Getting known releases from Tiller...')
         charts = []
-        for latest_release in self.list_releases():
+        for latest_release in self.iter_releases():
             try:
                 release = (
                     latest_release.name, latest_release.version,
@@ -309,6 +430,38 @@ class Tiller(object):
                 continue
         return charts
 
+    def get_release_index(self):
+        '''
+        Build a compact index of the latest releases.
+
+        Unlike ``list_charts``, the chart and values of each release are not
+        kept; only a checksum of them is. Use ``get_release_content`` to fetch
+        the full content of the releases that actually need it.
+
+        :returns: List of :class:`ReleaseIndexEntry`.
+        '''
+        LOG.debug('Building release index from Tiller...')
+        index = []
+        for latest_release in self.iter_releases():
+            try:
+                entry = ReleaseIndexEntry(
+                    latest_release.name,
+                    latest_release.version,
+                    latest_release.namespace,
+                    latest_release.info.status.Code.Name(
+                        latest_release.info.status.code),
+                    release_digest(
+                        latest_release.chart,
+                        yaml.safe_load(latest_release.config.raw)))
+                index.append(entry)
+                LOG.debug('Found release %s, version %s, status: %s',
+                          entry.name, entry.version, entry.status)
+            except (AttributeError, IndexError, yaml.YAMLError) as e:
+                LOG.debug('%s while getting releases: %s, ex=%s',
+                          e.__class__.__name__, latest_release, e)
+                continue
+        return index
+
     def update_release(self, chart, release, namespace,
                        dry_run=False,
                        pre_actions=None,
@@ -323,43 +476,21 @@ class Tiller(object):
 
         rel_timeout = self.timeout if not timeout else timeout
 
-        LOG.debug('Helm update release%s: wait=%s, timeout=%s',
-                  (' (dry run)' if dry_run else ''),
-                  wait, timeout)
-
-        if values is None:
-            values = Config(raw='')
-        else:
-            values = Config(raw=values)
+        release_request = update_release_request(
+            chart, release, dry_run=dry_run, disable_hooks=disable_hooks,
+            values=values, wait=wait, timeout=timeout)
 
         self._pre_update_actions(pre_actions, release, namespace, chart,
-                                 disable_hooks, values, timeout)
+                                 disable_hooks, release_request.values,
+                                 timeout)
 
-        # build release install request
         try:
             stub = ReleaseServiceStub(self.channel)
-            release_request = UpdateReleaseRequest(
-                chart=chart,
-                dry_run=dry_run,
-                disable_hooks=disable_hooks,
-                values=values,
-                name=release,
-                wait=wait,
-                timeout=timeout)
-
             update_msg = stub.UpdateRelease(
                 release_request, rel_timeout + GRPC_EPSILON,
                 metadata=self.metadata)
 
-            tiller_result = TillerResult(
-                update_msg.release.name,
-                update_msg.release.namespace,
-                update_msg.release.info.status.Code.Name(
-                    update_msg.release.info.status.code),
-                update_msg.release.info.Description,
-                update_msg.release.version)
-
-            return tiller_result
+            return TillerResult.from_release(update_msg.release)
         except Exception:
             LOG.exception('Error while updating release %s', release)
             status = self.get_release_status(release)
@@ -378,79 +509,51 @@ class Tiller(object):
 
         rel_timeout = self.timeout if not timeout else timeout
 
-        LOG.debug('Helm install release%s: wait=%s, timeout=%s',
-                  (' (dry run)' if dry_run else ''),
-                  wait, timeout)
-
-        if values is None:
-            values = Config(raw='')
-        else:
-            values = Config(raw=values)
-
-        # build release install request
         try:
             stub = ReleaseServiceStub(self.channel)
-            release_request = InstallReleaseRequest(
-                chart=chart,
-                dry_run=dry_run,
-                values=values,
-                name=release,
-                namespace=namespace,
-                wait=wait,
-                timeout=timeout)
+            release_request = install_release_request(
+                chart, release, namespace, dry_run=dry_run, values=values,
+                wait=wait, timeout=timeout)
 
             install_msg = stub.InstallRelease(
                 release_request, rel_timeout + GRPC_EPSILON,
                 metadata=self.metadata)
 
-            tiller_result = TillerResult(
-                install_msg.release.name,
-                install_msg.release.namespace,
-                install_msg.release.info.status.Code.Name(
-                    install_msg.release.info.status.code),
-                install_msg.release.info.Description,
-                install_msg.release.version)
-
-            return tiller_result
+            return TillerResult.from_release(install_msg.release)
         except Exception:
             LOG.exception('Error while installing release %s', release)
             status = self.get_release_status(release)
             raise ex.ReleaseException(release, status, 'Install')
 
-    def testing_release(self, release, timeout=300, cleanup=True):
+    def testing_release(self, release, timeout=DEFAULT_TEST_TIMEOUT,
+                        cleanup=True):
         '''
         :param release - name of release to test
         :param timeout - runtime before exiting
         :param cleanup - removes testing pod created
 
-        :returns - results of test pod
+        :returns - status of the release holding the results of its test
+            suite run, as streamed by Tiller while running the tests, or
+            False if the release has no test
         '''
 
-        LOG.debug("Helm test release %s, timeout=%s", release, timeout)
-
         try:
-
             stub = ReleaseServiceStub(self.channel)
+            release_request = run_release_test_request(
+                release, timeout=timeout, cleanup=cleanup)
 
-            release_request = TestReleaseRequest(
-                name=release, timeout=timeout, cleanup=cleanup)
-
-            content = self.get_release_content(release)
+            test_suite = TestSuite()
+            test_suite.started_at.GetCurrentTime()
 
-            if not len(content.release.hooks):
-                LOG.info('No test found')
-                return False
+            # Tiller streams the progress of each test pod until they have
+            # all completed, the stream is the only source of test results
+            add_test_responses(release, test_suite, stub.RunReleaseTest(
+                release_request, timeout + GRPC_EPSILON,
+                metadata=self.metadata))
 
-            if content.release.hooks[0].events[0] == RUNTEST_SUCCESS:
-                test = stub.RunReleaseTest(
-                    release_request, self.timeout, metadata=self.metadata)
+            test_suite.completed_at.GetCurrentTime()
 
-                if test.running():
-                    self.k8s.wait_get_completed_podphase(release)
-
-                test.cancel()
-
-                return self.get_release_status(release)
+            return test_suite_status(release, test_suite)
 
         except Exception:
             LOG.exception('Error while testing release %s', release)
@@ -527,13 +630,10 @@ class Tiller(object):
         deletes a Helm chart from Tiller
         '''
 
-        # build release install request
         try:
             stub = ReleaseServiceStub(self.channel)
-            LOG.info("Uninstall %s release with disable_hooks=%s, "
-                     "purge=%s flags", release, disable_hooks, purge)
-            release_request = UninstallReleaseRequest(
-                name=release, disable_hooks=disable_hooks, purge=purge)
+            release_request = uninstall_release_request(
+                release, disable_hooks=disable_hooks, purge=purge)
 
             return stub.UninstallRelease(
                 release_request, self.timeout, metadata=self.metadata)
@@ -543,10 +643,11 @@ class Tiller(object):
             status = self.get_release_status(release)
             raise ex.ReleaseException(release, status, 'Delete')
 
-    def chart_cleanup(self, prefix, charts):
+    def chart_cleanup(self, prefix, charts, known_releases=None):
         '''
         :params charts - list of yaml charts
-        :params known_release - list of releases in tiller
+        :params known_releases - list of releases in tiller, as returned by
+            ``get_release_index``. Listed from Tiller if not provided.
 
         :result - will remove any chart that is not present in yaml
         '''
@@ -557,7 +658,10 @@ class Tiller(object):
                 valid_charts.append(release_prefix(
                     prefix, chart.get('chart').get('name')))
 
-        actual_charts = [x.name for x in self.list_releases()]
+        if known_releases is None:
+            known_releases = self.get_release_index()
+
+        actual_charts = [x.name for x in known_releases]
         chart_diff = list(set(actual_charts) - set(valid_charts))
 
         for chart in chart_diff:
@@ -567,13 +671,15 @@ class Tiller(object):
 
     def delete_resources(self, release_name, resource_name, resource_type,
                          resource_labels, namespace, wait=False,
-                         timeout=TILLER_TIMEOUT):
+                         timeout=TILLER_TIMEOUT, controller=None):
         '''
         :params release_name - release name the specified resource is under
         :params resource_name - name of specific resource
         :params resource_type - type of resource e.g. job, pod, etc.
         :params resource_labels - labels by which to identify the resource
         :params namespace - namespace of the resource
+        :params controller - (kind, name) of the controller redeploying the
+            deleted pods which have lost their owner, when waiting for them
 
         Apply deletion logic based on type of resource
         '''
@@ -618,8 +724,11 @@ class Tiller(object):
                 LOG.info("Deleting pod %s in namespace: %s",
                          pod_name, namespace)
                 self.k8s.delete_namespace_pod(pod_name, namespace)
-                if wait:
-                    self.k8s.wait_for_pod_redeployment(pod_name, namespace)
+            if wait and release_pods.items:
+                self.k8s.wait_for_pods_redeployment(
+                    release_pods.items, namespace,
+                    label_selector=label_selector, timeout=timeout,
+                    controller=controller)
             handled = True
 
         if not handled:
@@ -665,10 +774,12 @@ class Tiller(object):
                     self.k8s.create_daemon_action(
                         namespace=namespace, template=template)
 
-                    # delete pods
+                    # delete pods, orphaned unless already adopted by the
+                    # new daemonset
                     self.delete_resources(
                         release_name, name, 'pod', resource_labels, namespace,
-                        wait=True, timeout=timeout)
+                        wait=True, timeout=timeout,
+                        controller=('DaemonSet', ds_name))
 
         else:
             LOG.error("Unable to exectue name: % type: %s", name, action_type)
@@ -0,0 +1,346 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import functools
+
+from hapi.release.test_suite_pb2 import TestSuite
+from hapi.services.tiller_pb2 import GetReleaseContentRequest
+from hapi.services.tiller_pb2 import GetReleaseStatusRequest
+from hapi.services.tiller_pb2 import GetVersionRequest
+from hapi.services.tiller_pb2_grpc import ReleaseServiceStub
+from oslo_log import log as logging
+
+from armada.const import DEFAULT_TEST_TIMEOUT
+from armada.exceptions import tiller_exceptions as ex
+from armada.handlers.test import add_test_responses
+from armada.handlers.test import test_suite_status
+from armada.handlers.tiller import GRPC_EPSILON
+from armada.handlers.tiller import install_release_request
+from armada.handlers.tiller import list_releases_request
+from armada.handlers.tiller import run_release_test_request
+from armada.handlers.tiller import Tiller
+from armada.handlers.tiller import TillerResult
+from armada.handlers.tiller import uninstall_release_request
+from armada.handlers.tiller import update_release_request
+
+LOG = logging.getLogger(__name__)
+
+# Marks the end of a response stream
+_END = object()
+
+
+def _wrap_future(call, loop):
+    '''
+    Return an asyncio future of the result of the gRPC future ``call``.
+    Cancelling the asyncio future cancels the call.
+    '''
+    future = loop.create_future()
+
+    def _copy_result(call):
+        if future.done():
+            return
+        try:
+            future.set_result(call.result())
+        except Exception as e:
+            future.set_exception(e)
+
+    def _cancel_call(future):
+        if future.cancelled():
+            call.cancel()
+
+    call.add_done_callback(
+        lambda call: loop.call_soon_threadsafe(_copy_result, call))
+    future.add_done_callback(_cancel_call)
+    return future
+
+
+class AsyncTiller(object):
+    '''
+    Asyncio variant of :class:`armada.handlers.tiller.Tiller` for the Tiller
+    release operations, which are coroutines.
+
+    All the requests are made through a single stub over the channel of the
+    wrapped ``Tiller``, so that many release operations can be in flight at
+    once over one HTTP/2 connection. Unary requests do not hold a thread
+    while in flight. The responses of a streaming request are read on the
+    default executor of the event loop, as gRPC does not provide
+    asynchronous iteration of a stream.
+    '''
+
+    def __init__(self, tiller=None, loop=None, **kwargs):
+        '''
+        :param tiller: optional :class:`Tiller` to share the channel,
+            timeout and Kubernetes client of, one created from ``kwargs``
+            otherwise.
+        :param loop: optional event loop, the current one by default.
+        '''
+        self.tiller = tiller or Tiller(**kwargs)
+        self.loop = loop or asyncio.get_event_loop()
+        self.stub = ReleaseServiceStub(self.tiller.channel)
+
+    @property
+    def metadata(self):
+        return self.tiller.metadata
+
+    @property
+    def timeout(self):
+        return self.tiller.timeout
+
+    def _call(self, method, request, timeout):
+        return _wrap_future(
+            method.future(request, timeout, metadata=self.metadata),
+            self.loop)
+
+    async def _stream_responses(self, method, request, timeout):
+        '''Return the list of responses of a streaming request.'''
+        stream = method(request, timeout, metadata=self.metadata)
+        responses = []
+        try:
+            while True:
+                resp = await self.loop.run_in_executor(
+                    None, next, stream, _END)
+                if resp is _END:
+                    return responses
+                responses.append(resp)
+        except asyncio.CancelledError:
+            stream.cancel()
+            raise
+
+    async def list_releases(self):
+        '''
+        List Helm Releases
+
+        Returns a list of all releases, following the pages of releases
+        returned by Tiller as ``Tiller.iter_releases`` does.
+        '''
+        releases = []
+        offset = ''
+        seen_offsets = set()
+
+        while True:
+            LOG.debug('Tiller ListReleases() with timeout=%s, offset=%s',
+                      self.timeout, offset)
+            release_list = await self._stream_responses(
+                self.stub.ListReleases, list_releases_request(offset),
+                self.timeout)
+
+            next_offset = ''
+            for y in release_list:
+                releases.extend(y.releases)
+                next_offset = y.next or next_offset
+
+            if not next_offset:
+                return releases
+
+            if next_offset in seen_offsets:
+                LOG.warn('Tiller ListReleases() returned offset %s more than '
+                         'once, stopping release listing.', next_offset)
+                return releases
+
+            seen_offsets.add(next_offset)
+            offset = next_offset
+
+    async def update_release(self, chart, release, namespace,
+                             dry_run=False,
+                             pre_actions=None,
+                             post_actions=None,
+                             disable_hooks=False,
+                             values=None,
+                             wait=False,
+                             timeout=None):
+        '''
+        Update a Helm Release
+
+        The pre and post update actions act on Kubernetes through the
+        blocking client of the wrapped ``Tiller``, and are run on the default
+        executor of the event loop.
+        '''
+
+        rel_timeout = self.timeout if not timeout else timeout
+
+        release_request = update_release_request(
+            chart, release, dry_run=dry_run, disable_hooks=disable_hooks,
+            values=values, wait=wait, timeout=timeout)
+
+        await self.loop.run_in_executor(None, functools.partial(
+            self.tiller._pre_update_actions, pre_actions or {}, release,
+            namespace, chart, disable_hooks, release_request.values, timeout))
+
+        try:
+            update_msg = await self._call(
+                self.stub.UpdateRelease, release_request,
+                rel_timeout + GRPC_EPSILON)
+        except asyncio.CancelledError:
+            # Not an error of the request, on Python < 3.8 where it is an
+            # Exception
+            raise
+        except Exception:
+            LOG.exception('Error while updating release %s', release)
+            status = await self.get_release_status(release)
+            raise ex.ReleaseException(release, status, 'Upgrade')
+
+        await self.loop.run_in_executor(None, functools.partial(
+            self.tiller._post_update_actions, post_actions or {}, namespace))
+
+        return TillerResult.from_release(update_msg.release)
+
+    async def install_release(self, chart, release, namespace,
+                              dry_run=False,
+                              values=None,
+                              wait=False,
+                              timeout=None):
+        '''
+        Create a Helm Release
+        '''
+
+        rel_timeout = self.timeout if not timeout else timeout
+
+        try:
+            release_request = install_release_request(
+                chart, release, namespace, dry_run=dry_run, values=values,
+                wait=wait, timeout=timeout)
+
+            install_msg = await self._call(
+                self.stub.InstallRelease, release_request,
+                rel_timeout + GRPC_EPSILON)
+
+            return TillerResult.from_release(install_msg.release)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOG.exception('Error while installing release %s', release)
+            status = await self.get_release_status(release)
+            raise ex.ReleaseException(release, status, 'Install')
+
+    async def testing_release(self, release, timeout=DEFAULT_TEST_TIMEOUT,
+                              cleanup=True):
+        '''
+        :param release - name of release to test
+        :param timeout - runtime before exiting
+        :param cleanup - removes testing pod created
+
+        :returns - status of the release holding the results of its test
+            suite run, or False if the release has no test, as
+            ``Tiller.testing_release`` does
+        '''
+
+        try:
+            release_request = run_release_test_request(
+                release, timeout=timeout, cleanup=cleanup)
+
+            test_suite = TestSuite()
+            test_suite.started_at.GetCurrentTime()
+
+            responses = await self._stream_responses(
+                self.stub.RunReleaseTest, release_request,
+                timeout + GRPC_EPSILON)
+            add_test_responses(release, test_suite, responses)
+
+            test_suite.completed_at.GetCurrentTime()
+
+            return test_suite_status(release, test_suite)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOG.exception('Error while testing release %s', release)
+            status = await self.get_release_status(release)
+            raise ex.ReleaseException(release, status, 'Test')
+
+    async def get_release_status(self, release, version=0):
+        '''
+        :param release - name of release to test
+        :param version - version of release status
+        '''
+
+        LOG.debug('Helm getting release status for release=%s, version=%s',
+                  release, version)
+        try:
+            status_request = GetReleaseStatusRequest(
+                name=release, version=version)
+
+            release_status = await self._call(
+                self.stub.GetReleaseStatus, status_request, self.timeout)
+            LOG.debug('GetReleaseStatus= %s', release_status)
+            return release_status
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            raise ex.GetReleaseStatusException(release, version)
+
+    async def get_release_content(self, release, version=0):
+        '''
+        :param release - name of release to test
+        :param version - version of release status
+        '''
+
+        LOG.debug('Helm getting release content for release=%s, version=%s',
+                  release, version)
+        try:
+            status_request = GetReleaseContentRequest(
+                name=release, version=version)
+
+            release_content = await self._call(
+                self.stub.GetReleaseContent, status_request, self.timeout)
+            LOG.debug('GetReleaseContent= %s', release_content)
+            return release_content
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            raise ex.GetReleaseContentException(release, version)
+
+    async def tiller_version(self):
+        '''
+        :returns - Tiller version
+        '''
+        try:
+            LOG.debug('Getting Tiller version, with timeout=%s', self.timeout)
+            tiller_version = await self._call(
+                self.stub.GetVersion, GetVersionRequest(), self.timeout)
+
+            tiller_version = getattr(tiller_version.Version, 'sem_ver', None)
+            LOG.debug('Got Tiller version %s', tiller_version)
+            return tiller_version
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOG.debug('Failed to get Tiller version')
+            raise ex.TillerVersionException()
+
+    async def uninstall_release(self, release, disable_hooks=False,
+                                purge=True):
+        '''
+        :params - release - Helm chart release name
+        :params - purge - deep delete of chart
+
+        deletes a Helm chart from Tiller
+        '''
+
+        try:
+            release_request = uninstall_release_request(
+                release, disable_hooks=disable_hooks, purge=purge)
+
+            return await self._call(
+                self.stub.UninstallRelease, release_request, self.timeout)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            LOG.exception('Error while uninstalling release %s', release)
+            status = await self.get_release_status(release)
+            raise ex.ReleaseException(release, status, 'Delete')
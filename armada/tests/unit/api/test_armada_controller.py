@@ -14,6 +14,7 @@
 
 import json
 import mock
+import yaml
 
 from oslo_config import cfg
 
@@ -21,6 +22,7 @@ from armada.api.controller import armada as armada_api
 from armada.common.policies import base as policy_base
 from armada.tests import test_utils
 from armada.tests.unit.api import base
+from armada.utils.release import values_diff
 
 CONF = cfg.CONF
 
@@ -40,6 +42,7 @@ class ArmadaControllerTest(base.BaseControllerTest):
                    'enable_chart_cleanup': 'false',
                    'skip_pre_flight': 'false',
                    'dry_run': 'false',
+                   'show_diff': 'false',
                    'wait': 'false',
                    'timeout': '100'}
 
@@ -48,6 +51,7 @@ class ArmadaControllerTest(base.BaseControllerTest):
             'disable_update_post': False,
             'enable_chart_cleanup': False,
             'dry_run': False,
+            'show_diff': False,
             'force_wait': False,
             'timeout': 100,
             'tiller_host': None,
@@ -81,6 +85,28 @@ class ArmadaControllerTest(base.BaseControllerTest):
                                        **expected_armada_options)
         mock_armada.return_value.sync.assert_called()
 
+    @mock.patch.object(armada_api, 'Armada')
+    def test_armada_apply_values_diff(self, mock_armada):
+        """Tests that values diffs of any YAML value are returned."""
+        rules = {'armada:create_endpoints': '@'}
+        self.policy.set_rules(rules)
+
+        diff = values_diff(yaml.safe_load('a: 2018-01-01'),
+                           {'a': '2018-01-02'})
+        mock_armada.return_value.sync.return_value = \
+            {'diff': [{'values': diff}], 'install': [], 'upgrade': []}
+
+        result = self.app.simulate_post(
+            path='/api/v1.0/apply', body='---\nfoo: bar',
+            headers={'Content-Type': 'application/x-yaml'},
+            params={'show_diff': 'true'})
+
+        self.assertEqual(200, result.status_code)
+        self.assertEqual(
+            {'changed': {'a': {'from': '2018-01-01', 'to': '2018-01-02'}},
+             'added': {}, 'removed': {}},
+            result.json['message']['diff'][0]['values'])
+
     def test_armada_apply_no_href(self):
         """Tests /api/v1.0/apply returns 400 when hrefs list is empty."""
         rules = {'armada:create_endpoints': '@'}
@@ -18,6 +18,8 @@ import yaml
 
 import mock
 
+from hapi.release.test_run_pb2 import TestRun
+
 from armada.api.controller import test
 from armada.common.policies import base as policy_base
 from armada.exceptions import manifest_exceptions
@@ -52,6 +54,47 @@ class TestReleasesManifestControllerTest(base.BaseControllerTest):
             documents, target_manifest=None)
         self.assertTrue(mock_tiller.called)
 
+    @mock.patch.object(test, 'run_tests')
+    @mock.patch.object(test, 'Manifest')
+    @mock.patch.object(test, 'Tiller')
+    def test_test_controller_with_manifest_results(
+            self, mock_tiller, mock_manifest, mock_run_tests):
+        rules = {'armada:tests_manifest': '@'}
+        self.policy.set_rules(rules)
+
+        mock_manifest.return_value.get_manifest.return_value = {
+            'armada': {
+                'release_prefix': 'armada',
+                'chart_groups': [{'chart_group': [
+                    {'chart': {'release': 'a'}},
+                    {'chart': {'release': 'b'}},
+                    {'chart': {'release': 'c'}}]}]}}
+        mock_tiller.return_value.get_release_index.return_value = [
+            mock.Mock(), mock.Mock()]
+        index = mock_tiller.return_value.get_release_index.return_value
+        index[0].name = 'armada-a'
+        index[1].name = 'armada-c'
+        mock_run_tests.return_value = (
+            {'passed': ['armada-a'], 'skipped': [], 'failed': ['armada-c']},
+            {})
+
+        manifest_path = os.path.join(os.getcwd(), 'examples',
+                                     'keystone-manifest.yaml')
+        with open(manifest_path, 'r') as f:
+            payload = f.read()
+
+        resp = self.app.simulate_post('/api/v1.0/tests', body=payload)
+        self.assertEqual(200, resp.status_code)
+
+        # Releases not deployed are skipped, the others tested together
+        mock_run_tests.assert_called_once_with(
+            mock_tiller.return_value,
+            [('armada-a', None), ('armada-c', None)])
+        self.assertEqual(
+            {'tests': {'passed': ['armada-a'], 'skipped': ['armada-b'],
+                       'failed': ['armada-c']}},
+            json.loads(resp.text))
+
 
 class TestReleasesReleaseNameControllerTest(base.BaseControllerTest):
 
@@ -62,8 +105,8 @@ class TestReleasesReleaseNameControllerTest(base.BaseControllerTest):
 
         testing_release = mock_tiller.return_value.testing_release
         testing_release.return_value = mock.Mock(
-            **{'info.status.last_test_suite_run.result': [
-                mock.Mock(status='PASSED')]})
+            **{'info.status.last_test_suite_run.results': [
+                mock.Mock(status=TestRun.SUCCESS)]})
 
         resp = self.app.simulate_get('/api/v1.0/test/fake-release')
         self.assertEqual(200, resp.status_code)
@@ -77,8 +120,8 @@ class TestReleasesReleaseNameControllerTest(base.BaseControllerTest):
 
         testing_release = mock_tiller.return_value.testing_release
         testing_release.return_value = mock.Mock(
-            **{'info.status.last_test_suite_run.result': [
-                mock.Mock(status='FAILED')]})
+            **{'info.status.last_test_suite_run.results': [
+                mock.Mock(status=TestRun.FAILURE)]})
 
         resp = self.app.simulate_get('/api/v1.0/test/fake-release')
         self.assertEqual(200, resp.status_code)
@@ -81,7 +81,7 @@ class TillerControllerTest(base.BaseControllerTest):
             fake_release.configure_mock(name=name)
             return fake_release
 
-        mock_tiller.return_value.list_releases.return_value = [
+        mock_tiller.return_value.iter_releases.return_value = [
             _get_fake_release('foo', 'bar'), _get_fake_release('baz', 'qux')
         ]
 
@@ -94,7 +94,7 @@ class TillerControllerTest(base.BaseControllerTest):
         mock_tiller.assert_called_once_with(
             tiller_host=None, tiller_port=44134,
             tiller_namespace='kube-system')
-        mock_tiller.return_value.list_releases.assert_called_once_with()
+        mock_tiller.return_value.iter_releases.assert_called_once_with()
 
     @mock.patch.object(tiller_controller, 'Tiller')
     def test_tiller_releases_with_params(self, mock_tiller):
@@ -107,7 +107,7 @@ class TillerControllerTest(base.BaseControllerTest):
             fake_release.configure_mock(name=name)
             return fake_release
 
-        mock_tiller.return_value.list_releases.return_value = [
+        mock_tiller.return_value.iter_releases.return_value = [
             _get_fake_release('foo', 'bar'), _get_fake_release('baz', 'qux')
         ]
 
@@ -124,7 +124,7 @@ class TillerControllerTest(base.BaseControllerTest):
         mock_tiller.assert_called_once_with(tiller_host='fake_host',
                                             tiller_port=98765,
                                             tiller_namespace='fake_ns')
-        mock_tiller.return_value.list_releases.assert_called_once_with()
+        mock_tiller.return_value.iter_releases.assert_called_once_with()
 
 
 class TillerControllerNegativeRbacTest(base.BaseControllerTest):
@@ -12,11 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 import mock
 import yaml
 
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.release.test_run_pb2 import TestRun
+
+from armada import exceptions
+from armada.exceptions.armada_exceptions import ChartDeployException
 from armada.handlers import armada
+from armada.handlers import tiller
 from armada.tests.unit import base
+from armada.utils.release import release_digest
 
 
 TEST_YAML = """
@@ -162,12 +172,81 @@ class ArmadaHandlerTestCase(base.ArmadaTestCase):
                                             tiller_port=44134)
         mock_source.git_clone.assert_called_once_with(
             'git://github.com/dummy/armada', 'master', auth_method=None,
-            proxy_server=None)
+            proxy_server=None, subpaths=['chart_1'])
+
+    def _source_chart(self, location, reference=None, subpath='.',
+                      source_type='git'):
+        chart_source = {'type': source_type, 'location': location,
+                        'subpath': subpath}
+        if reference:
+            chart_source['reference'] = reference
+        return {'chart': {'chart_name': subpath, 'source': chart_source}}
+
+    @mock.patch.object(armada, 'source')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_fetch_sources(self, mock_tiller, mock_source):
+        """Test that distinct sources are fetched once and concurrently."""
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        # Both git fetches must be running at the same time to get through
+        barrier = threading.Barrier(2, timeout=5)
+
+        def _git_clone(location, reference, **kwargs):
+            barrier.wait()
+            return '/tmp/{}-{}'.format(location, reference)
+
+        mock_source.git_clone.side_effect = _git_clone
+        mock_source.get_tarball.return_value = '/tmp/tarball'
+
+        charts = [
+            self._source_chart('repo', 'master', 'a'),
+            self._source_chart('repo', subpath='b'),
+            self._source_chart('repo', 'stable', 'c'),
+            self._source_chart('url', subpath='d', source_type='tar'),
+            self._source_chart('url', subpath='e', source_type='tar'),
+            self._source_chart('/path', subpath='f', source_type='local'),
+        ]
+        armada_obj.fetch_sources(charts)
+
+        self.assertEqual(
+            [('/tmp/repo-master', 'a'), ('/tmp/repo-master', 'b'),
+             ('/tmp/repo-stable', 'c'), ('/tmp/tarball', 'd'),
+             ('/tmp/tarball', 'e'), ('/path', 'f')],
+            [ch['chart']['source_dir'] for ch in charts])
+        self.assertEqual(2, mock_source.git_clone.call_count)
+        mock_source.git_clone.assert_any_call(
+            'repo', 'master', auth_method=None, proxy_server=None,
+            subpaths=['a', 'b'])
+        mock_source.get_tarball.assert_called_once_with(
+            'url', verify=False, subpaths=['d', 'e'], checksum=None)
+
+    @mock.patch.object(armada, 'source')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_fetch_sources_failure(self, mock_tiller, mock_source):
+        """Test that fetched sources are cleaned up when a fetch fails."""
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        error = exceptions.source_exceptions.GitException('bad')
+
+        def _git_clone(location, reference, **kwargs):
+            if location == 'bad':
+                raise error
+            return '/tmp/good'
+
+        mock_source.git_clone.side_effect = _git_clone
+        charts = [self._source_chart('good'), self._source_chart('bad')]
+
+        self.assertRaises(exceptions.source_exceptions.GitException,
+                          armada_obj.fetch_sources, charts)
+        mock_source.source_cleanup.assert_called_once_with('/tmp/good')
 
     @mock.patch.object(armada, 'source')
     @mock.patch('armada.handlers.armada.Tiller')
     def test_post_flight_ops(self, mock_tiller, mock_source):
         """Test post-flight operations."""
+        self.override_config('git_cache_dir', '/tmp/git-cache')
         yaml_documents = list(yaml.safe_load_all(TEST_YAML))
         armada_obj = armada.Armada(yaml_documents)
 
@@ -185,6 +264,30 @@ class ArmadaHandlerTestCase(base.ArmadaTestCase):
                     mock_source.source_cleanup.assert_called_with(
                         CHART_SOURCES[counter][0])
 
+        # Git mirrors are evicted once the checkouts have been cleaned up
+        mock_source.evict_git_cache.assert_called_once_with()
+
+    @mock.patch.object(armada, 'source')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_post_flight_ops_dependencies(self, mock_tiller, mock_source):
+        """Test that the checkouts of chart dependencies are cleaned up."""
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        mock_source.git_clone.side_effect = \
+            lambda location, reference, **kwargs: '/tmp/' + location
+        chart = self._source_chart('repo', subpath='a')
+        chart['chart']['dependencies'] = [
+            self._source_chart('other-repo', subpath='b')]
+        armada_obj.fetch_sources([chart] + chart['chart']['dependencies'])
+
+        armada_obj.post_flight_ops()
+
+        self.assertEqual(
+            [mock.call('/tmp/other-repo'), mock.call('/tmp/repo')],
+            mock_source.source_cleanup.call_args_list)
+        self.assertEqual([], armada_obj.source_dirs)
+
     @mock.patch.object(armada.Armada, 'post_flight_ops')
     @mock.patch.object(armada.Armada, 'pre_flight_ops')
     @mock.patch('armada.handlers.armada.ChartBuilder')
@@ -203,7 +306,7 @@ class ArmadaHandlerTestCase(base.ArmadaTestCase):
         chart_2 = charts[1]['chart']
 
         # Mock irrelevant methods called by `armada.sync()`.
-        mock_tiller.list_charts.return_value = []
+        mock_tiller.get_release_index.return_value = []
         mock_chartbuilder.get_source_path.return_value = None
         mock_chartbuilder.get_helm_chart.return_value = None
 
@@ -230,4 +333,227 @@ class ArmadaHandlerTestCase(base.ArmadaTestCase):
                 timeout=10,
                 wait=True)
         ]
-        mock_tiller.return_value.install_release.assert_has_calls(method_calls)
+        # Charts of an un-sequenced ChartGroup are deployed concurrently.
+        mock_tiller.return_value.install_release.assert_has_calls(
+            method_calls, any_order=True)
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_install_failures_are_aggregated(self, mock_tiller,
+                                             mock_chartbuilder,
+                                             mock_pre_flight,
+                                             mock_post_flight):
+        '''Test that one failing chart does not stop the rest of an
+        un-sequenced ChartGroup'''
+
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        def _install_release(chart, release, *args, **kwargs):
+            if release == 'armada-test_chart_1':
+                raise Exception('install failed')
+            return mock.Mock()
+
+        mock_tiller.return_value.get_release_index.return_value = []
+        mock_tiller.return_value.install_release.side_effect = (
+            _install_release)
+
+        self.assertRaisesRegex(
+            ChartDeployException, 'armada-test_chart_1', armada_obj.sync)
+
+        installed = [c[0][1] for c in
+                     mock_tiller.return_value.install_release.call_args_list]
+        self.assertEqual(['armada-test_chart_1', 'armada-test_chart_2'],
+                         sorted(installed))
+        mock_post_flight.assert_not_called()
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_sync_invalid_depends_on(self, mock_tiller, mock_chartbuilder,
+                                     mock_pre_flight, mock_post_flight):
+        '''Test that invalid dependencies fail before deploying anything'''
+
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        charts = armada_obj.manifest['armada']['chart_groups'][0][
+            'chart_group']
+        charts[0]['chart']['depends_on'] = ['test_chart_2']
+        charts[1]['chart']['depends_on'] = ['test_chart_1']
+
+        self.assertRaisesRegex(
+            exceptions.ManifestException, 'cycle', armada_obj.sync)
+        mock_tiller.return_value.install_release.assert_not_called()
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_install_chart_depends_on(self, mock_tiller, mock_chartbuilder,
+                                      mock_pre_flight, mock_post_flight):
+        '''Test that a chart is deployed after the charts it depends on'''
+
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        charts = armada_obj.manifest['armada']['chart_groups'][0][
+            'chart_group']
+        charts[0]['chart']['depends_on'] = ['test_chart_2']
+
+        mock_tiller.return_value.get_release_index.return_value = []
+
+        armada_obj.sync()
+
+        installed = [c[0][1] for c in
+                     mock_tiller.return_value.install_release.call_args_list]
+        self.assertEqual(['armada-test_chart_2', 'armada-test_chart_1'],
+                         installed)
+
+    def _test_upgrade(self, mock_tiller, mock_chartbuilder, checksum,
+                      show_diff=False):
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents, show_diff=show_diff)
+
+        chart = Chart(metadata=Metadata(name='test_chart_1'))
+        mock_chartbuilder.return_value.get_helm_chart.return_value = chart
+        mock_chartbuilder.return_value.dump.return_value = (
+            chart.SerializeToString())
+
+        m_tiller = mock_tiller.return_value
+        m_tiller.get_release_index.return_value = [
+            tiller.ReleaseIndexEntry(
+                'armada-test_chart_1', 1, 'test', 'DEPLOYED', checksum)]
+        m_tiller.get_release_content.return_value.release.chart = Chart()
+        m_tiller.get_release_content.return_value.release.config.raw = ''
+
+        msg = armada_obj.sync()
+
+        m_tiller.get_release_index.assert_called_once_with()
+        self.assertEqual(
+            'armada-test_chart_2',
+            m_tiller.install_release.call_args[0][1])
+        return m_tiller, msg
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_upgrade_unchanged_release(self, mock_tiller, mock_chartbuilder,
+                                       mock_pre_flight, mock_post_flight):
+        '''Test that an unchanged release is neither fetched nor
+        upgraded'''
+        checksum = release_digest(
+            Chart(metadata=Metadata(name='test_chart_1')), {})
+        m_tiller, msg = self._test_upgrade(
+            mock_tiller, mock_chartbuilder, checksum, show_diff=True)
+
+        m_tiller.get_release_content.assert_not_called()
+        m_tiller.update_release.assert_not_called()
+        self.assertEqual([], msg['upgrade'])
+        self.assertEqual([], msg['diff'])
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_upgrade_changed_release(self, mock_tiller, mock_chartbuilder,
+                                     mock_pre_flight, mock_post_flight):
+        '''Test that a changed release is upgraded without fetching its
+        content when no diff is requested'''
+        m_tiller, msg = self._test_upgrade(
+            mock_tiller, mock_chartbuilder, 'outdated')
+
+        m_tiller.get_release_content.assert_not_called()
+        self.assertEqual('armada-test_chart_1',
+                         m_tiller.update_release.call_args[0][1])
+        self.assertEqual(['armada-test_chart_1'], msg['upgrade'])
+        self.assertEqual([], msg['diff'])
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_upgrade_changed_release_show_diff(self, mock_tiller,
+                                               mock_chartbuilder,
+                                               mock_pre_flight,
+                                               mock_post_flight):
+        '''Test that the diff of a changed release is reported when
+        requested'''
+        m_tiller, msg = self._test_upgrade(
+            mock_tiller, mock_chartbuilder, 'outdated', show_diff=True)
+
+        m_tiller.get_release_content.assert_called_once_with(
+            'armada-test_chart_1')
+        self.assertEqual(['armada-test_chart_1'], msg['upgrade'])
+        self.assertNotEqual([], msg['diff'])
+
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_show_diff_values(self, mock_tiller):
+        '''Test that values are compared by key path, ignoring key order
+        and formatting'''
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+        chart = Chart(metadata=Metadata(name='test_chart_1'))
+
+        msg = {'diff': []}
+        self.assertFalse(armada_obj.show_diff(
+            {'release': 'test_chart_1'}, chart, 'b: {c: 2}\na: 1\n',
+            chart.SerializeToString(), {'a': 1, 'b': {'c': 2}}, msg))
+        self.assertEqual([], msg['diff'])
+
+        self.assertTrue(armada_obj.show_diff(
+            {'release': 'test_chart_1'}, chart, 'a: 1\nb: {c: 2}\n',
+            chart.SerializeToString(), {'b': {'c': 3}, 'd': 4}, msg))
+        self.assertEqual([{'values': {
+            'changed': {'b.c': {'from': 2, 'to': 3}},
+            'added': {'d': 4},
+            'removed': {'a': 1}}}], msg['diff'])
+
+    @mock.patch.object(armada.Armada, 'post_flight_ops')
+    @mock.patch.object(armada.Armada, 'pre_flight_ops')
+    @mock.patch('armada.handlers.armada.ChartBuilder')
+    @mock.patch('armada.handlers.armada.Tiller')
+    def test_sequenced_background_test(self, mock_tiller, mock_chartbuilder,
+                                       mock_pre_flight, mock_post_flight):
+        '''Test that background tests do not hold up the next chart of a
+        sequenced ChartGroup'''
+
+        yaml_documents = list(yaml.safe_load_all(TEST_YAML))
+        armada_obj = armada.Armada(yaml_documents)
+
+        chart_group = armada_obj.manifest['armada']['chart_groups'][0]
+        chart_group['sequenced'] = True
+        charts = chart_group['chart_group']
+        charts[0]['chart']['test'] = True
+        charts[0]['chart']['test_in_background'] = True
+
+        m_tiller = mock_tiller.return_value
+        m_tiller.get_release_index.return_value = []
+        test_started = threading.Event()
+        second_installed = threading.Event()
+
+        def _testing_release(release, timeout=None):
+            test_started.set()
+            # The next chart is installed while this test is running
+            self.assertTrue(second_installed.wait(10))
+            return mock.Mock(**{'info.status.last_test_suite_run.results': [
+                mock.Mock(status=TestRun.SUCCESS)]})
+
+        def _install_release(chart, release, *args, **kwargs):
+            if release == 'armada-test_chart_2':
+                self.assertTrue(test_started.wait(10))
+                second_installed.set()
+            return mock.Mock()
+
+        m_tiller.testing_release.side_effect = _testing_release
+        m_tiller.install_release.side_effect = _install_release
+
+        armada_obj.sync()
+
+        m_tiller.testing_release.assert_called_once_with(
+            'armada-test_chart_1', timeout=mock.ANY)
+        self.assertTrue(second_installed.is_set())
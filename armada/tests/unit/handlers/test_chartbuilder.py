@@ -18,16 +18,19 @@ import shutil
 import yaml
 
 import fixtures
+from git import Actor
+from git import Repo
 from hapi.chart.chart_pb2 import Chart
 from hapi.chart.metadata_pb2 import Metadata
 import mock
-import testtools
 
 from armada.handlers.chartbuilder import ChartBuilder
 from armada.exceptions import chartbuilder_exceptions
+from armada.tests.unit import base
+from armada.utils import source
 
 
-class BaseChartBuilderTestCase(testtools.TestCase):
+class BaseChartBuilderTestCase(base.ArmadaTestCase):
     chart_yaml = """
         apiVersion: v1
         description: A sample Helm chart for Kubernetes
@@ -408,6 +411,40 @@ class ChartBuilderTestCase(BaseChartBuilderTestCase):
         self.assertTrue(hasattr(dep_helm_chart, 'values'))
         self.assertEqual(expected_dependency, repr(dep_helm_chart).strip())
 
+    def test_get_helm_chart_shares_dependency_charts(self):
+        dep_chart_dir = self.useFixture(fixtures.TempDir())
+        self._write_temporary_file_contents(dep_chart_dir.path, 'Chart.yaml',
+                                            self.dependency_chart_yaml)
+        dep_ch = yaml.safe_load(self.dependency_chart_stream)
+        dep_ch['chart']['source_dir'] = (dep_chart_dir.path, '')
+
+        charts = []
+        for _ in range(2):
+            chart_dir = self.useFixture(fixtures.TempDir())
+            self._write_temporary_file_contents(chart_dir.path, 'Chart.yaml',
+                                                self.chart_yaml)
+            ch = yaml.safe_load(self.chart_stream)['chart']
+            ch['source_dir'] = (chart_dir.path, '')
+            ch['dependencies'] = [dep_ch]
+            charts.append(ch)
+
+        dependency_charts = {}
+        with mock.patch.object(ChartBuilder, 'get_metadata',
+                               autospec=True,
+                               side_effect=ChartBuilder.get_metadata) as m:
+            helm_charts = [
+                ChartBuilder(
+                    ch, dependency_charts=dependency_charts).get_helm_chart()
+                for ch in charts]
+
+        # Both main charts, and the shared dependency only once
+        self.assertEqual(3, m.call_count)
+        self.assertEqual(1, len(dependency_charts))
+        self.assertEqual(helm_charts[0].dependencies,
+                         helm_charts[1].dependencies)
+        self.assertEqual('dependency-chart',
+                         helm_charts[1].dependencies[0].metadata.name)
+
     def test_dump(self):
         # Validate base case.
         chart_dir = self.useFixture(fixtures.TempDir())
@@ -442,6 +479,106 @@ class ChartBuilderTestCase(BaseChartBuilderTestCase):
         self.assertRegex(repr(chartbuilder.dump()), re)
 
 
+class ChartBuilderCacheTestCase(BaseChartBuilderTestCase):
+
+    def setUp(self):
+        super(ChartBuilderCacheTestCase, self).setUp()
+        self.cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.override_config('chart_cache_dir', self.cache_dir)
+
+        self.chart_dir = self.useFixture(fixtures.TempDir()).path
+        self._write_temporary_file_contents(self.chart_dir, 'Chart.yaml',
+                                            self.chart_yaml)
+        self.chart = yaml.safe_load(self.chart_stream)['chart']
+        self.chart['source_dir'] = (self.chart_dir, '')
+
+    def test_get_helm_chart_uses_cache(self):
+        helm_chart = ChartBuilder(self.chart).get_helm_chart()
+        key = ChartBuilder(self.chart).get_cache_key()
+        self.assertTrue(os.path.isfile(os.path.join(self.cache_dir, key)))
+
+        with mock.patch.object(ChartBuilder, 'get_templates') as m_templates:
+            cached_chart = ChartBuilder(self.chart).get_helm_chart()
+            m_templates.assert_not_called()
+
+        self.assertEqual(helm_chart, cached_chart)
+
+    def test_cache_key_changes_with_sources(self):
+        key = ChartBuilder(self.chart).get_cache_key()
+        self.assertEqual(key, ChartBuilder(self.chart).get_cache_key())
+
+        self._write_temporary_file_contents(self.chart_dir, 'values.yaml',
+                                            self.chart_value)
+        new_key = ChartBuilder(self.chart).get_cache_key()
+        self.assertNotEqual(key, new_key)
+
+        dep_chart_dir = self.useFixture(fixtures.TempDir()).path
+        self._write_temporary_file_contents(dep_chart_dir, 'Chart.yaml',
+                                            self.dependency_chart_yaml)
+        dep_ch = yaml.safe_load(self.dependency_chart_stream)
+        dep_ch['chart']['source_dir'] = (dep_chart_dir, '')
+        self.chart['dependencies'] = [dep_ch]
+        dep_key = ChartBuilder(self.chart).get_cache_key()
+        self.assertNotIn(dep_key, (key, new_key))
+
+        self._write_temporary_file_contents(dep_chart_dir, 'values.yaml',
+                                            self.chart_value)
+        self.assertNotEqual(dep_key, ChartBuilder(self.chart).get_cache_key())
+
+    def test_cache_key_ignores_vcs_metadata(self):
+        key = ChartBuilder(self.chart).get_cache_key()
+
+        self._make_temporary_subdirectory(self.chart_dir, '.git')
+        self._write_temporary_file_contents(
+            os.path.join(self.chart_dir, '.git'), 'HEAD', 'ref')
+        self.assertEqual(key, ChartBuilder(self.chart).get_cache_key())
+
+    def _git_chart(self, git_dir):
+        chart = dict(self.chart, source={'type': 'git'},
+                     source_dir=(git_dir, 'chart'))
+        return ChartBuilder(chart)
+
+    def test_cache_key_of_git_checkouts(self):
+        repo = Repo.init(self.useFixture(fixtures.TempDir()).path)
+        self._make_temporary_subdirectory(repo.working_dir, 'chart')
+        self._write_temporary_file_contents(
+            os.path.join(repo.working_dir, 'chart'), 'Chart.yaml',
+            self.chart_yaml)
+        repo.index.add(['chart/Chart.yaml'])
+        actor = Actor('armada', 'armada@example.com')
+        repo.index.commit('chart', author=actor, committer=actor)
+
+        git_dirs = [source.git_clone(repo.working_dir) for _ in range(2)]
+        for git_dir in git_dirs:
+            self.addCleanup(source.source_cleanup, git_dir)
+
+        # Checkouts of the same commit share their key
+        key = self._git_chart(git_dirs[0]).get_cache_key()
+        self.assertIsNotNone(key)
+        self.assertEqual(key, self._git_chart(git_dirs[1]).get_cache_key())
+
+        # Local changes are not covered by the tree of the commit
+        self._write_temporary_file_contents(
+            os.path.join(git_dirs[1], 'chart'), 'values.yaml',
+            self.chart_value)
+        self.assertNotEqual(key,
+                            self._git_chart(git_dirs[1]).get_cache_key())
+
+    def test_no_cache_key_without_source_dir(self):
+        self.chart['source_dir'] = None
+        self.assertIsNone(ChartBuilder(self.chart).get_cache_key())
+
+    def test_corrupt_cache_entry_is_rebuilt(self):
+        key = ChartBuilder(self.chart).get_cache_key()
+        self._write_temporary_file_contents(self.cache_dir, key, 'garbage')
+
+        helm_chart = ChartBuilder(self.chart).get_helm_chart()
+
+        self.assertEqual('hello-world-chart', helm_chart.metadata.name)
+        with open(os.path.join(self.cache_dir, key), 'rb') as f:
+            self.assertEqual(helm_chart, Chart.FromString(f.read()))
+
+
 class ChartBuilderNegativeTestCase(BaseChartBuilderTestCase):
 
     def setUp(self):
@@ -0,0 +1,67 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+
+import fixtures
+import mock
+
+from armada.exceptions.source_exceptions import InvalidPathException
+from armada.handlers.document import ReferenceResolver
+from armada.tests.unit import base
+
+
+class ReferenceResolverTestCase(base.ArmadaTestCase):
+
+    def _write(self, name, content):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    @mock.patch('armada.handlers.document.http')
+    def test_resolve_reference_concurrently_in_order(self, mock_http):
+        # Both http references must be fetched at the same time to get
+        # through
+        barrier = threading.Barrier(2, timeout=5)
+
+        def _get(url, timeout):
+            barrier.wait()
+            response = mock.Mock(status_code=200)
+            response.content = url.encode('utf-8')
+            return response
+
+        mock_http.get_session.return_value.get.side_effect = _get
+        path = self._write('doc.yaml', b'file')
+
+        data = ReferenceResolver.resolve_reference(
+            ['http://host/a', path, 'https://host/b'])
+
+        self.assertEqual([b'http://host/a', b'file', b'https://host/b'], data)
+        mock_http.get_session.return_value.get.assert_any_call(
+            'http://host/a', timeout=30)
+
+    @mock.patch('armada.handlers.document.http')
+    def test_resolve_reference_invalid_scheme(self, mock_http):
+        self.assertRaises(InvalidPathException,
+                          ReferenceResolver.resolve_reference,
+                          ['http://host/a', 'foo://host/b'])
+        mock_http.get_session.return_value.get.assert_not_called()
+
+    def test_resolve_reference_single(self):
+        path = self._write('doc.yaml', b'file')
+
+        self.assertEqual([b'file'], ReferenceResolver.resolve_reference(path))
+        self.assertEqual([], ReferenceResolver.resolve_reference([]))
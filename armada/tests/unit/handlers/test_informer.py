@@ -0,0 +1,117 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import testtools
+
+from kubernetes.client.rest import ApiException
+
+from armada.handlers import informer
+
+
+def _obj(name, resource_version, namespace='ns'):
+    obj = mock.Mock()
+    obj.metadata.name = name
+    obj.metadata.namespace = namespace
+    obj.metadata.resource_version = resource_version
+    return obj
+
+
+def _list_response(objects, resource_version):
+    response = mock.Mock()
+    response.items = objects
+    response.metadata.resource_version = resource_version
+    return response
+
+
+class InformerTestCase(testtools.TestCase):
+
+    def _run_watches(self, inf, streams):
+        '''Run the informer watch loop over the given event streams, stopping
+        it once they are exhausted.'''
+        streams = list(streams)
+        calls = []
+
+        def _stream(func, **kwargs):
+            calls.append(kwargs)
+            events = streams.pop(0)
+            if isinstance(events, Exception):
+                raise events
+            for event in events:
+                yield event
+            if not streams:
+                inf._stopped.set()
+
+        with mock.patch.object(informer, 'watch') as mock_watch:
+            mock_watch.Watch.return_value.stream.side_effect = _stream
+            inf._run()
+        return calls
+
+    def test_start_lists_objects(self):
+        list_func = mock.Mock(return_value=_list_response(
+            [_obj('a', '1'), _obj('b', '2')], '10'))
+        inf = informer.Informer(list_func, namespace='ns',
+                                label_selector='app=x')
+
+        with mock.patch.object(informer.threading, 'Thread') as mock_thread:
+            inf.start()
+            inf.start()
+
+        list_func.assert_called_once_with(namespace='ns',
+                                          label_selector='app=x')
+        mock_thread.return_value.start.assert_called_once_with()
+        self.assertEqual(['a', 'b'],
+                         sorted(o.metadata.name for o in inf.list()))
+
+    def test_watch_applies_events_and_resumes(self):
+        list_func = mock.Mock(return_value=_list_response(
+            [_obj('a', '1'), _obj('b', '2')], '10'))
+        inf = informer.Informer(list_func, namespace='ns')
+        inf._list()
+
+        calls = self._run_watches(inf, [
+            [{'type': 'MODIFIED', 'object': _obj('a', '11')},
+             {'type': 'ADDED', 'object': _obj('c', '12')}],
+            [{'type': 'DELETED', 'object': _obj('b', '13')}],
+        ])
+
+        # The second watch resumes where the first one ended, without
+        # listing again
+        self.assertEqual(['10', '12'],
+                         [c['resource_version'] for c in calls])
+        list_func.assert_called_once_with(namespace='ns')
+        self.assertEqual({'a': '11', 'c': '12'},
+                         {o.metadata.name: o.metadata.resource_version
+                          for o in inf.list()})
+
+    def test_watch_expired_lists_again(self):
+        list_func = mock.Mock(side_effect=[
+            _list_response([_obj('a', '1')], '10'),
+            _list_response([_obj('b', '20')], '20'),
+            _list_response([_obj('b', '30')], '30'),
+        ])
+        inf = informer.Informer(list_func, namespace='ns')
+        inf._list()
+
+        calls = self._run_watches(inf, [
+            [{'type': 'ERROR', 'object': None,
+              'raw_object': {'code': 410, 'message': 'too old'}}],
+            ApiException(status=410),
+            [],
+        ])
+
+        self.assertEqual(['10', '20', '30'],
+                         [c['resource_version'] for c in calls])
+        self.assertEqual(3, list_func.call_count)
+        self.assertEqual(['b'], [o.metadata.name for o in inf.list()])
@@ -0,0 +1,327 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from armada.exceptions import k8s_exceptions
+from armada.handlers import k8s
+from armada.tests.unit import base
+
+
+def _meta(name, labels=None, resource_version='1', owner=None):
+    metadata = mock.Mock()
+    metadata.name = name
+    metadata.namespace = 'ns'
+    metadata.labels = labels if labels is not None else {'app': 'x'}
+    metadata.resource_version = resource_version
+    metadata.uid = 'uid-' + name
+    metadata.generation = 2
+    metadata.owner_references = []
+    if owner:
+        ref = mock.Mock(kind=owner[0], controller=True)
+        ref.name = owner[1]
+        metadata.owner_references = [ref]
+    return metadata
+
+
+def _pod(name, phase='Running', ready='True', node=None, **kwargs):
+    pod = mock.Mock()
+    pod.metadata = _meta(name, **kwargs)
+    pod.spec.node_name = node
+    pod.status.phase = phase
+    condition = mock.Mock(type='Ready', status=ready)
+    pod.status.conditions = [condition]
+    return pod
+
+
+def _deployment(name, replicas=2, updated=2, total=2, ready=2,
+                observed=2, labels=None, **kwargs):
+    deployment = mock.Mock()
+    deployment.metadata = _meta(name, labels=labels, **kwargs)
+    deployment.spec.replicas = replicas
+    deployment.spec.template.metadata.labels = {'app': 'x'}
+    deployment.status.observed_generation = observed
+    deployment.status.updated_replicas = updated
+    deployment.status.replicas = total
+    deployment.status.ready_replicas = ready
+    return deployment
+
+
+@mock.patch('armada.handlers.k8s.client')
+@mock.patch('armada.handlers.k8s.config')
+class K8sTestCase(base.ArmadaTestCase):
+
+    def _informers(self, k8s_obj, *states):
+        '''
+        Serve the given ``{kind: objects}`` states from fake informers, the
+        first one up front and the next ones on each wait, until its
+        predicate is met.
+        '''
+        states = list(states)
+        current = {}
+
+        def _set_state():
+            state = states.pop(0)
+            for kind in k8s.WAIT_KINDS:
+                current[kind] = state.get(kind, [])
+
+        def _informer(kind, namespace, label_selector=''):
+            informer = mock.Mock()
+            informer.list.side_effect = lambda: list(current[kind])
+            return informer
+
+        def _wait_for(predicate, timeout):
+            if states:
+                _set_state()
+            while not predicate() and states:
+                _set_state()
+            return predicate()
+
+        _set_state()
+        k8s_obj.get_informer = mock.Mock(side_effect=_informer)
+        k8s_obj._wait_for = mock.Mock(side_effect=_wait_for)
+
+    @mock.patch('armada.handlers.k8s.time.sleep')
+    def test_wait_until_ready(self, mock_sleep, mock_config, mock_client):
+        k8s_obj = k8s.K8s()
+        other = _pod('other', phase='Pending', labels={'app': 'y'})
+        self._informers(
+            k8s_obj,
+            {'pod': [_pod('a', phase='Pending'),
+                     _pod('b', phase='Succeeded'), other]},
+            {'pod': [_pod('a', resource_version='2'),
+                     _pod('b', phase='Succeeded'), other]})
+
+        self.assertTrue(k8s_obj.wait_until_ready(
+            namespace='ns', labels={'app': 'x'}, timeout=10,
+            k8s_wait_attempts=2))
+
+        k8s_obj.get_informer.assert_has_calls(
+            [mock.call(kind, 'ns') for kind in k8s.WAIT_KINDS])
+        # The modified pod resets the successes, two more attempts follow
+        self.assertEqual(3, mock_sleep.call_count)
+
+    def test_wait_until_ready_timeout(self, mock_config, mock_client):
+        k8s_obj = k8s.K8s()
+        self._informers(k8s_obj, {'pod': [_pod('a', ready='False')]})
+
+        self.assertRaises(
+            k8s_exceptions.KubernetesWatchTimeoutException,
+            k8s_obj.wait_until_ready, namespace='ns', labels={'app': 'x'},
+            timeout=10)
+
+    @mock.patch('armada.handlers.k8s.time.sleep')
+    def test_wait_until_ready_workloads(self, mock_sleep, mock_config,
+                                        mock_client):
+        k8s_obj = k8s.K8s()
+        # The pods of the Deployment are left to its status, selected by
+        # the labels of its pod template
+        managed_pod = _pod('web-5d4f-abcde', ready='False',
+                           labels={'app': 'x', 'pod-template-hash': '5d4f'},
+                           owner=('ReplicaSet', 'web-5d4f'))
+        self._informers(
+            k8s_obj,
+            {'deployment': [_deployment('web', labels={}, updated=1)],
+             'pod': [managed_pod]},
+            {'deployment': [_deployment('web', labels={})],
+             'pod': [managed_pod]})
+
+        self.assertTrue(k8s_obj.wait_until_ready(
+            namespace='ns', labels={'app': 'x'}, timeout=10))
+
+    def test_wait_until_ready_workloads_timeout(self, mock_config,
+                                                mock_client):
+        k8s_obj = k8s.K8s()
+        self._informers(
+            k8s_obj, {'deployment': [_deployment('web', observed=1)]})
+
+        self.assertRaises(
+            k8s_exceptions.KubernetesWatchTimeoutException,
+            k8s_obj.wait_until_ready, namespace='ns', labels={'app': 'x'},
+            timeout=10)
+
+    @mock.patch('armada.handlers.k8s.time.sleep')
+    def test_wait_until_ready_release_resources(self, mock_sleep,
+                                                mock_config, mock_client):
+        k8s_obj = k8s.K8s()
+        # Unready resources of other releases sharing the namespace and
+        # labels are not waited on
+        self._informers(
+            k8s_obj,
+            {'deployment': [_deployment('web'),
+                            _deployment('other-web', ready=0)],
+             'pod': [_pod('bare'), _pod('other', ready='False')]})
+
+        self.assertTrue(k8s_obj.wait_until_ready(
+            release='rel', namespace='ns', labels={'app': 'x'}, timeout=10,
+            resources={('Deployment', 'web'), ('Pod', 'bare')}))
+
+    @mock.patch('armada.handlers.k8s.time.sleep')
+    def test_wait_until_ready_release_label(self, mock_sleep, mock_config,
+                                            mock_client):
+        k8s_obj = k8s.K8s()
+        self._informers(
+            k8s_obj,
+            {'pod': [_pod('a', labels={'app': 'x', 'release': 'rel'}),
+                     _pod('b', ready='False',
+                          labels={'app': 'x', 'release_group': 'other'})]})
+
+        self.assertTrue(k8s_obj.wait_until_ready(
+            release='rel', namespace='ns', labels={'app': 'x'}, timeout=10))
+
+        self.assertRaises(
+            k8s_exceptions.KubernetesWatchTimeoutException,
+            k8s_obj.wait_until_ready, release='other', namespace='ns',
+            labels={'app': 'x'}, timeout=10)
+
+    def test_wait_for_pods_redeployment(self, mock_config, mock_client):
+        k8s_obj = k8s.K8s()
+        old_pods = [
+            _pod('ds-a', node='n1', owner=('DaemonSet', 'ds')),
+            _pod('ds-b', node='n2', owner=('DaemonSet', 'ds')),
+            _pod('web-5d4f-a', owner=('ReplicaSet', 'web-5d4f'),
+                 labels={'pod-template-hash': '5d4f'}),
+            _pod('bare'),
+        ]
+        new_web = _pod('web-5d4f-c', owner=('ReplicaSet', 'web-5d4f'),
+                       labels={'pod-template-hash': '5d4f'})
+        self._informers(
+            k8s_obj,
+            {'pod': old_pods},
+            # Replacement of ds-b not ready yet, ds-c on another node
+            {'pod': [_pod('ds-c', node='n1', owner=('DaemonSet', 'ds')),
+                     _pod('ds-d', node='n2', owner=('DaemonSet', 'ds'),
+                          ready='False'),
+                     new_web]},
+            {'pod': [_pod('ds-c', node='n1', owner=('DaemonSet', 'ds')),
+                     _pod('ds-d', node='n2', owner=('DaemonSet', 'ds')),
+                     new_web]})
+
+        k8s_obj.wait_for_pods_redeployment(
+            old_pods, 'ns', label_selector='app=x', timeout=10)
+
+        k8s_obj.get_informer.assert_called_once_with('pod', 'ns', 'app=x')
+        k8s_obj._wait_for.assert_called_once_with(mock.ANY, 10)
+
+    def test_wait_for_pods_redeployment_orphans(self, mock_config,
+                                                mock_client):
+        k8s_obj = k8s.K8s()
+        # Pods orphaned by the deletion of their daemonset
+        old_pods = [_pod('ds-a', node='n1'), _pod('ds-b', node='n2')]
+        new_pod = _pod('ds-c', node='n1', owner=('DaemonSet', 'ds'))
+        self._informers(
+            k8s_obj,
+            {'pod': old_pods},
+            # A pod of another controller on n2 does not replace ds-b
+            {'pod': [new_pod,
+                     _pod('other', node='n2', owner=('DaemonSet', 'other'))]},
+            {'pod': [new_pod,
+                     _pod('ds-d', node='n2', owner=('DaemonSet', 'ds'))]})
+        k8s_obj.wait_for_pods_redeployment(
+            old_pods, 'ns', timeout=10, controller=('DaemonSet', 'ds'))
+
+        # Waited until the last state
+        pods = k8s_obj.get_informer('pod', 'ns').list()
+        self.assertEqual(['ds-c', 'ds-d'], [p.metadata.name for p in pods])
+
+    def test_wait_for_pods_redeployment_orphans_by_node(self, mock_config,
+                                                        mock_client):
+        k8s_obj = k8s.K8s()
+        old_pods = [_pod('ds-a', node='n1')]
+        self._informers(
+            k8s_obj,
+            {'pod': old_pods},
+            {'pod': [_pod('ds-b', node='n2', owner=('DaemonSet', 'ds'))]},
+            {'pod': [_pod('ds-c', node='n1', owner=('DaemonSet', 'ds'))]})
+        # Without the controller, any new pod on the node replaces it
+        k8s_obj.wait_for_pods_redeployment(old_pods, 'ns', timeout=10)
+
+        pods = k8s_obj.get_informer('pod', 'ns').list()
+        self.assertEqual(['ds-c'], [p.metadata.name for p in pods])
+
+    def test_wait_for_pods_redeployment_timeout(self, mock_config,
+                                                mock_client):
+        k8s_obj = k8s.K8s()
+        old_pods = [_pod('job-a', owner=('Job', 'job'))]
+        self._informers(k8s_obj, {'pod': old_pods})
+
+        self.assertRaises(
+            k8s_exceptions.KubernetesWatchTimeoutException,
+            k8s_obj.wait_for_pods_redeployment, old_pods, 'ns', timeout=10)
+
+    def test_is_ready_workloads(self, mock_config, mock_client):
+        k8s_obj = k8s.K8s()
+
+        self.assertTrue(k8s_obj._is_ready('deployment', _deployment('d')))
+        # Old replicas not terminated yet
+        self.assertFalse(k8s_obj._is_ready(
+            'deployment', _deployment('d', total=3)))
+        self.assertFalse(k8s_obj._is_ready(
+            'deployment', _deployment('d', ready=1)))
+
+        statefulset = mock.Mock()
+        statefulset.metadata.generation = 1
+        statefulset.spec.replicas = 3
+        statefulset.spec.update_strategy.type = 'RollingUpdate'
+        statefulset.spec.update_strategy.rolling_update.partition = 1
+        statefulset.status.observed_generation = 1
+        statefulset.status.updated_replicas = 2
+        statefulset.status.ready_replicas = 3
+        self.assertTrue(k8s_obj._is_ready('statefulset', statefulset))
+        statefulset.status.ready_replicas = 2
+        self.assertFalse(k8s_obj._is_ready('statefulset', statefulset))
+
+        daemonset = mock.Mock()
+        daemonset.metadata.generation = 1
+        daemonset.spec.update_strategy.type = 'RollingUpdate'
+        daemonset.status.observed_generation = 1
+        daemonset.status.desired_number_scheduled = 3
+        daemonset.status.updated_number_scheduled = 3
+        daemonset.status.number_ready = 3
+        self.assertTrue(k8s_obj._is_ready('daemonset', daemonset))
+        daemonset.status.updated_number_scheduled = 2
+        self.assertFalse(k8s_obj._is_ready('daemonset', daemonset))
+
+        job = mock.Mock()
+        job.spec.completions = None
+        job.status.succeeded = None
+        self.assertFalse(k8s_obj._is_ready('job', job))
+        job.status.succeeded = 1
+        self.assertTrue(k8s_obj._is_ready('job', job))
+
+    @mock.patch('armada.handlers.k8s.Informer')
+    def test_get_informer_shared(self, mock_informer, mock_config,
+                                 mock_client):
+        mock_informer.side_effect = lambda *a, **kw: mock.Mock()
+        k8s_obj = k8s.K8s()
+
+        informer = k8s_obj.get_informer('pod', 'ns')
+        self.assertIs(informer, k8s_obj.get_informer('pod', 'ns'))
+        mock_informer.assert_called_once_with(
+            k8s_obj.client.list_namespaced_pod, namespace='ns',
+            label_selector='', condition=k8s_obj._informer_condition)
+        self.assertEqual(2, informer.start.call_count)
+
+        deployments = k8s_obj.get_informer('deployment', 'ns')
+        self.assertIsNot(informer, deployments)
+        mock_informer.assert_called_with(
+            k8s_obj.apps_api.list_namespaced_deployment, namespace='ns',
+            label_selector='', condition=k8s_obj._informer_condition)
+        self.assertIsNot(informer,
+                         k8s_obj.get_informer('pod', 'ns', 'app=x'))
+
+        k8s_obj.stop_informers()
+        informer.stop.assert_called_once_with()
+        deployments.stop.assert_called_once_with()
+        self.assertIsNot(informer, k8s_obj.get_informer('pod', 'ns'))
@@ -0,0 +1,112 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import mock
+
+from hapi.release.test_run_pb2 import TestRun
+from hapi.services.tiller_pb2 import TestReleaseResponse
+
+from armada.const import DEFAULT_TEST_TIMEOUT
+from armada.handlers import test
+from armada.tests.unit import base
+
+
+def _release_status(*statuses):
+    return mock.Mock(**{'info.status.last_test_suite_run.results': [
+        mock.Mock(status=status) for status in statuses]})
+
+
+class RunTestsTestCase(base.ArmadaTestCase):
+
+    def test_test_passed(self):
+        self.assertTrue(test.test_passed(
+            _release_status(TestRun.SUCCESS, TestRun.SUCCESS)))
+        self.assertFalse(test.test_passed(
+            _release_status(TestRun.SUCCESS, TestRun.FAILURE)))
+        self.assertFalse(test.test_passed(_release_status()))
+
+    def test_parse_test_response(self):
+        test_run = test.parse_test_response(TestReleaseResponse(
+            msg='FAILED: test-a, run `kubectl logs test-a` for more info',
+            status=TestRun.FAILURE))
+        self.assertEqual(('test-a', TestRun.FAILURE),
+                         (test_run.name, test_run.status))
+        self.assertIsNone(test.parse_test_response(TestReleaseResponse(
+            msg='RUNNING: test-a', status=TestRun.RUNNING)))
+        self.assertIsNone(test.parse_test_response(TestReleaseResponse(
+            msg='No Tests Found')))
+
+        # Older Tillers leave the status unset
+        test_run = test.parse_test_response(TestReleaseResponse(
+            msg='PASSED: test-a'))
+        self.assertEqual(('test-a', TestRun.SUCCESS),
+                         (test_run.name, test_run.status))
+        self.assertIsNone(test.parse_test_response(TestReleaseResponse(
+            msg='RUNNING: test-a')))
+
+    def test_run_tests_concurrently(self):
+        self.override_config('release_test_workers', 3)
+        tiller = mock.Mock()
+        # Every release must be under test at once to get past the barrier
+        barrier = threading.Barrier(3, timeout=10)
+        statuses = {
+            'pass': _release_status(TestRun.SUCCESS),
+            'fail': _release_status(TestRun.FAILURE),
+            'none': False,
+        }
+
+        def _testing_release(release, timeout):
+            barrier.wait()
+            return statuses[release]
+
+        tiller.testing_release.side_effect = _testing_release
+
+        results, errors = test.run_tests(
+            tiller, [('fail', 10), ('none', None), ('pass', 20)])
+
+        self.assertEqual({'passed': ['pass'], 'skipped': ['none'],
+                          'failed': ['fail']}, results)
+        self.assertEqual(['passed', 'skipped', 'failed'], list(results))
+        self.assertEqual({}, errors)
+        tiller.testing_release.assert_has_calls([
+            mock.call('fail', timeout=10),
+            mock.call('none', timeout=DEFAULT_TEST_TIMEOUT),
+            mock.call('pass', timeout=20)], any_order=True)
+
+    def test_run_tests_errors(self):
+        tiller = mock.Mock()
+        error = Exception('boom')
+
+        def _testing_release(release, timeout):
+            if release == 'broken':
+                raise error
+            return _release_status(TestRun.SUCCESS)
+
+        tiller.testing_release.side_effect = _testing_release
+
+        results, errors = test.run_tests(
+            tiller, [('broken', None), ('ok', None)], max_workers=1)
+
+        self.assertEqual(['ok'], results['passed'])
+        self.assertEqual(['broken'], results['failed'])
+        self.assertEqual({'broken': error}, errors)
+
+    def test_run_tests_empty(self):
+        tiller = mock.Mock()
+        results, errors = test.run_tests(tiller, [])
+        self.assertEqual({'passed': [], 'skipped': [], 'failed': []},
+                         results)
+        tiller.testing_release.assert_not_called()
@@ -14,9 +14,15 @@
 
 import mock
 
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.release.test_run_pb2 import TestRun
+from hapi.services.tiller_pb2 import TestReleaseResponse
+
 from armada.exceptions import tiller_exceptions as ex
 from armada.handlers import tiller
 from armada.tests.unit import base
+from armada.utils.release import release_digest
 
 
 class TillerTestCase(base.ArmadaTestCase):
@@ -173,7 +179,7 @@ class TillerTestCase(base.ArmadaTestCase):
     def test_list_releases(self, mock_release_service_stub,
                            mock_list_releases_request, mock_grpc, _):
         mock_release_service_stub.return_value.ListReleases. \
-            return_value = [mock.Mock(releases=['foo', 'bar'])]
+            return_value = [mock.Mock(releases=['foo', 'bar'], next='')]
 
         tiller_obj = tiller.Tiller('host', '8080', None)
         self.assertEqual(['foo', 'bar'], tiller_obj.list_releases())
@@ -188,11 +194,95 @@ class TillerTestCase(base.ArmadaTestCase):
 
         mock_list_releases_request.assert_called_once_with(
             limit=tiller.RELEASE_LIMIT,
+            offset='',
             status_codes=[tiller.STATUS_DEPLOYED,
                           tiller.STATUS_FAILED],
             sort_by='LAST_RELEASED',
             sort_order='DESC')
 
+    @mock.patch('armada.handlers.tiller.K8s')
+    @mock.patch('armada.handlers.tiller.grpc')
+    @mock.patch.object(tiller, 'ListReleasesRequest')
+    @mock.patch.object(tiller, 'ReleaseServiceStub')
+    def test_iter_releases_paginates(self, mock_release_service_stub,
+                                     mock_list_releases_request, mock_grpc,
+                                     _):
+        mock_release_service_stub.return_value.ListReleases.side_effect = [
+            [mock.Mock(releases=['foo', 'bar'], next='baz')],
+            [mock.Mock(releases=['baz', 'qux'], next='quux')],
+            [mock.Mock(releases=['quux'], next='')],
+        ]
+
+        tiller_obj = tiller.Tiller('host', '8080', None)
+        releases = tiller_obj.iter_releases()
+
+        self.assertNotIsInstance(releases, list)
+        self.assertEqual(['foo', 'bar', 'baz', 'qux', 'quux'],
+                         list(releases))
+
+        offsets = [c[1]['offset']
+                   for c in mock_list_releases_request.call_args_list]
+        self.assertEqual(['', 'baz', 'quux'], offsets)
+
+    @mock.patch('armada.handlers.tiller.K8s')
+    @mock.patch('armada.handlers.tiller.grpc')
+    @mock.patch.object(tiller, 'ListReleasesRequest')
+    @mock.patch.object(tiller, 'ReleaseServiceStub')
+    def test_iter_releases_stops_on_repeated_offset(
+            self, mock_release_service_stub, mock_list_releases_request,
+            mock_grpc, _):
+        mock_release_service_stub.return_value.ListReleases.return_value = [
+            mock.Mock(releases=['foo'], next='foo')]
+
+        tiller_obj = tiller.Tiller('host', '8080', None)
+
+        self.assertEqual(['foo', 'foo'], tiller_obj.list_releases())
+        self.assertEqual(2, mock_list_releases_request.call_count)
+
+    @mock.patch('armada.handlers.tiller.K8s')
+    @mock.patch('armada.handlers.tiller.grpc')
+    @mock.patch.object(tiller.Tiller, 'iter_releases')
+    def test_get_release_index(self, mock_iter_releases, mock_grpc, _):
+        release = mock.Mock()
+        release.name = 'armada-foo'
+        release.version = 3
+        release.namespace = 'openstack'
+        release.info.status.Code.Name.return_value = 'DEPLOYED'
+        release.chart = Chart(metadata=Metadata(name='foo'))
+        release.config.raw = 'key: value\n'
+        mock_iter_releases.return_value = iter([release])
+
+        tiller_obj = tiller.Tiller('host', '8080', None)
+        index = tiller_obj.get_release_index()
+
+        self.assertEqual(1, len(index))
+        entry = index[0]
+        self.assertEqual(('armada-foo', 3, 'openstack', 'DEPLOYED'),
+                         entry[:4])
+        self.assertEqual(release_digest(release.chart, {'key': 'value'}),
+                         entry.checksum)
+        self.assertFalse(hasattr(entry, 'chart'))
+
+    @mock.patch('armada.handlers.tiller.K8s')
+    @mock.patch('armada.handlers.tiller.grpc')
+    @mock.patch.object(tiller.Tiller, 'uninstall_release')
+    @mock.patch.object(tiller.Tiller, 'get_release_index')
+    def test_chart_cleanup_with_known_releases(self, mock_index,
+                                               mock_uninstall, mock_grpc, _):
+        known_releases = [
+            tiller.ReleaseIndexEntry('armada-foo', 1, 'ns', 'DEPLOYED', ''),
+            tiller.ReleaseIndexEntry('armada-bar', 1, 'ns', 'DEPLOYED', ''),
+            tiller.ReleaseIndexEntry('other-baz', 1, 'ns', 'DEPLOYED', ''),
+        ]
+        charts = [{'chart_group': [{'chart': {'name': 'foo'}}]}]
+
+        tiller_obj = tiller.Tiller('host', '8080', None)
+        tiller_obj.chart_cleanup('armada', charts,
+                                 known_releases=known_releases)
+
+        mock_index.assert_not_called()
+        mock_uninstall.assert_called_once_with('armada-bar')
+
     @mock.patch('armada.handlers.tiller.K8s')
     @mock.patch('armada.handlers.tiller.grpc')
     @mock.patch.object(tiller, 'GetReleaseContentRequest')
@@ -259,6 +349,22 @@ class TillerTestCase(base.ArmadaTestCase):
             mock_rel_status_request.return_value, tiller_obj.timeout,
             metadata=tiller_obj.metadata)
 
+    def test_release_requests(self):
+        chart = Chart(metadata=Metadata(name='chart'))
+
+        request = tiller.install_release_request(
+            chart, 'release', 'ns', values='a: 1', timeout=10)
+        self.assertEqual(('release', 'ns', 'a: 1', 10),
+                         (request.name, request.namespace,
+                          request.values.raw, request.timeout))
+
+        request = tiller.update_release_request(
+            chart, 'release', disable_hooks=True)
+        self.assertEqual(('release', '', True),
+                         (request.name, request.values.raw,
+                          request.disable_hooks))
+        self.assertEqual(chart, request.chart)
+
     @mock.patch('armada.handlers.tiller.K8s')
     @mock.patch('armada.handlers.tiller.grpc')
     @mock.patch.object(tiller, 'UninstallReleaseRequest')
@@ -281,3 +387,49 @@ class TillerTestCase(base.ArmadaTestCase):
         uninstall_release_stub.assert_called_once_with(
             mock_uninstall_release_request.return_value, tiller_obj.timeout,
             metadata=tiller_obj.metadata)
+
+    @mock.patch('armada.handlers.tiller.K8s')
+    @mock.patch('armada.handlers.tiller.grpc')
+    @mock.patch.object(tiller.Tiller, 'get_release_status')
+    @mock.patch.object(tiller.Tiller, 'get_release_content')
+    @mock.patch.object(tiller, 'ReleaseServiceStub')
+    def test_testing_release(self, mock_release_service_stub,
+                             mock_release_content, mock_release_status,
+                             mock_grpc, _):
+        run_release_test = mock_release_service_stub.return_value \
+            .RunReleaseTest
+        run_release_test.return_value = iter([
+            TestReleaseResponse(msg='RUNNING: test-a',
+                                status=TestRun.RUNNING),
+            TestReleaseResponse(msg='PASSED: test-a', status=TestRun.SUCCESS),
+            TestReleaseResponse(msg='RUNNING: test-b',
+                                status=TestRun.RUNNING),
+            TestReleaseResponse(
+                msg='FAILED: test-b, run `kubectl logs test-b --namespace '
+                    'ns` for more info', status=TestRun.FAILURE),
+        ])
+
+        tiller_obj = tiller.Tiller('host', '8080', None)
+        resp = tiller_obj.testing_release('release', timeout=10)
+
+        results = resp.info.status.last_test_suite_run.results
+        self.assertEqual([('test-a', TestRun.SUCCESS),
+                          ('test-b', TestRun.FAILURE)],
+                         [(r.name, r.status) for r in results])
+        self.assertEqual('release', resp.name)
+        run_release_test.assert_called_once_with(
+            mock.ANY, 10 + tiller.GRPC_EPSILON, metadata=tiller_obj.metadata)
+        # The results come from the stream alone
+        mock_release_content.assert_not_called()
+        mock_release_status.assert_not_called()
+
+    @mock.patch('armada.handlers.tiller.K8s')
+    @mock.patch('armada.handlers.tiller.grpc')
+    @mock.patch.object(tiller, 'ReleaseServiceStub')
+    def test_testing_release_no_tests(self, mock_release_service_stub,
+                                      mock_grpc, _):
+        mock_release_service_stub.return_value.RunReleaseTest \
+            .return_value = iter([TestReleaseResponse(msg='No Tests Found')])
+
+        tiller_obj = tiller.Tiller('host', '8080', None)
+        self.assertFalse(tiller_obj.testing_release('release'))
@@ -0,0 +1,225 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import mock
+
+from hapi.chart.chart_pb2 import Chart
+from hapi.release.release_pb2 import Release
+from hapi.release.test_run_pb2 import TestRun
+from hapi.services.tiller_pb2 import InstallReleaseResponse
+from hapi.services.tiller_pb2 import ListReleasesResponse
+from hapi.services.tiller_pb2 import TestReleaseResponse
+
+from armada.exceptions import tiller_exceptions as ex
+from armada.handlers import tiller
+from armada.handlers import tiller_async
+from armada.tests.unit import base
+
+
+class FakeCall(object):
+    '''gRPC future, completed by ``set_result`` or ``set_exception``.'''
+
+    def __init__(self):
+        self._callbacks = []
+        self._result = None
+        self._exception = None
+        self.cancelled = False
+
+    def add_done_callback(self, fn):
+        self._callbacks.append(fn)
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _done(self):
+        for fn in self._callbacks:
+            fn(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._done()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done()
+
+
+def _done_call(result=None, exception=None):
+    call = FakeCall()
+    call.add_done_callback = lambda fn: fn(call)
+    call._result = result
+    call._exception = exception
+    return call
+
+
+@mock.patch.object(tiller_async, 'ReleaseServiceStub')
+class AsyncTillerTestCase(base.ArmadaTestCase):
+
+    def setUp(self):
+        super(AsyncTillerTestCase, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.tiller = mock.Mock(timeout=tiller.TILLER_TIMEOUT,
+                                metadata=[('key', 'value')])
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_single_stub(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        stub = mock_stub.return_value
+        stub.GetVersion.future.return_value = _done_call(
+            mock.Mock(**{'Version.sem_ver': 'v2.9.1'}))
+        stub.GetReleaseStatus.future.return_value = _done_call('status')
+
+        self.assertEqual('v2.9.1', self._run(async_tiller.tiller_version()))
+        self.assertEqual('status',
+                         self._run(async_tiller.get_release_status('r')))
+        mock_stub.assert_called_once_with(self.tiller.channel)
+
+    def test_install_release(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        release = Release(name='release', namespace='ns', version=1)
+        install = mock_stub.return_value.InstallRelease
+        install.future.return_value = _done_call(
+            InstallReleaseResponse(release=release))
+
+        result = self._run(async_tiller.install_release(
+            Chart(), 'release', 'ns', timeout=10))
+
+        self.assertIsInstance(result, tiller.TillerResult)
+        self.assertEqual(('release', 'ns', 1),
+                         (result.release, result.namespace, result.version))
+        install.future.assert_called_once_with(
+            mock.ANY, 10 + tiller.GRPC_EPSILON,
+            metadata=self.tiller.metadata)
+
+    def test_install_release_error(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        stub = mock_stub.return_value
+        stub.InstallRelease.future.return_value = _done_call(
+            exception=Exception('boom'))
+        stub.GetReleaseStatus.future.return_value = _done_call(
+            mock.Mock(**{'info.Description': 'failed'}))
+
+        self.assertRaises(
+            ex.ReleaseException, self._run,
+            async_tiller.install_release(Chart(), 'release',
+                                         'ns'))
+
+    def test_concurrent_calls(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        calls = {}
+
+        def _future(request, timeout, metadata):
+            calls[request.name] = FakeCall()
+            return calls[request.name]
+
+        mock_stub.return_value.GetReleaseStatus.future.side_effect = _future
+
+        async def _test():
+            tasks = [self.loop.create_task(
+                async_tiller.get_release_status(name))
+                for name in ('a', 'b', 'c')]
+            await asyncio.sleep(0)
+            # All the requests are in flight at once
+            self.assertEqual(['a', 'b', 'c'], sorted(calls))
+            for name in ('c', 'b', 'a'):
+                calls[name].set_result(name.upper())
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(['A', 'B', 'C'], self._run(_test()))
+
+    def _cancel(self, coro):
+        '''Run ``coro`` until it waits, cancel it and return its task.'''
+        async def _test():
+            task = self.loop.create_task(coro)
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.sleep(0)
+            return task
+
+        return self._run(_test())
+
+    def test_cancel_call(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        call = FakeCall()
+        mock_stub.return_value.GetReleaseContent.future.return_value = call
+
+        task = self._cancel(async_tiller.get_release_content('release'))
+
+        self.assertTrue(task.cancelled())
+        self.assertTrue(call.cancelled)
+
+    def test_cancel_install_release(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        stub = mock_stub.return_value
+        call = FakeCall()
+        stub.InstallRelease.future.return_value = call
+
+        task = self._cancel(async_tiller.install_release(
+            Chart(), 'release', 'ns'))
+
+        # The cancellation is not handled as a failed install
+        self.assertTrue(task.cancelled())
+        self.assertTrue(call.cancelled)
+        stub.GetReleaseStatus.future.assert_not_called()
+
+    def test_list_releases(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        pages = {
+            '': [ListReleasesResponse(releases=[Release(name='a')],
+                                      next='b')],
+            'b': [ListReleasesResponse(releases=[Release(name='b')])],
+        }
+        list_releases = mock_stub.return_value.ListReleases
+        list_releases.side_effect = \
+            lambda request, timeout, metadata: iter(pages[request.offset])
+
+        releases = self._run(async_tiller.list_releases())
+
+        self.assertEqual(['a', 'b'], [r.name for r in releases])
+        self.assertEqual(2, list_releases.call_count)
+
+    def test_testing_release(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        run_release_test = mock_stub.return_value.RunReleaseTest
+        run_release_test.return_value = iter([
+            TestReleaseResponse(msg='RUNNING: test-a',
+                                status=TestRun.RUNNING),
+            TestReleaseResponse(msg='PASSED: test-a', status=TestRun.SUCCESS),
+        ])
+
+        resp = self._run(async_tiller.testing_release('release', timeout=10))
+
+        results = resp.info.status.last_test_suite_run.results
+        self.assertEqual([('test-a', TestRun.SUCCESS)],
+                         [(r.name, r.status) for r in results])
+        run_release_test.assert_called_once_with(
+            mock.ANY, 10 + tiller.GRPC_EPSILON,
+            metadata=self.tiller.metadata)
+
+    def test_testing_release_no_tests(self, mock_stub):
+        async_tiller = tiller_async.AsyncTiller(self.tiller, loop=self.loop)
+        mock_stub.return_value.RunReleaseTest.return_value = iter(
+            [TestReleaseResponse(msg='No Tests Found')])
+
+        self.assertFalse(self._run(async_tiller.testing_release('release')))
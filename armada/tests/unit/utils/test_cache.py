@@ -0,0 +1,91 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+import fixtures
+import testtools
+
+from armada.utils import cache
+
+
+class CacheTestCase(testtools.TestCase):
+
+    def setUp(self):
+        super(CacheTestCase, self).setUp()
+        self.cache_dir = self.useFixture(fixtures.TempDir()).path
+
+    def _age(self, name, mtime):
+        os.utime(os.path.join(self.cache_dir, name), (mtime, mtime))
+
+    def test_read_write_entry(self):
+        self.assertIsNone(cache.read_entry(self.cache_dir, 'key'))
+
+        cache.write_entry(self.cache_dir, 'key', b'data')
+
+        self.assertEqual(b'data', cache.read_entry(self.cache_dir, 'key'))
+        self.assertEqual(['key'], os.listdir(self.cache_dir))
+
+    def test_read_entry_marks_it_used(self):
+        cache.write_entry(self.cache_dir, 'key', b'data')
+        self._age('key', 1000)
+
+        cache.read_entry(self.cache_dir, 'key')
+
+        self.assertGreater(
+            os.stat(os.path.join(self.cache_dir, 'key')).st_mtime, 1000)
+
+    def test_evict_least_recently_used(self):
+        for age, name in enumerate(['old', 'older', 'oldest']):
+            cache.write_entry(self.cache_dir, name, b'x' * 10)
+            self._age(name, 3000 - age * 1000)
+        os.mkdir(os.path.join(self.cache_dir, 'dir'))
+        cache.write_entry(os.path.join(self.cache_dir, 'dir'), 'f', b'x' * 10)
+        self._age('dir', 500)
+
+        evicted = cache.evict(self.cache_dir, 20, keep=('dir',))
+
+        self.assertEqual(['oldest', 'older'], evicted)
+        self.assertEqual(['dir', 'old'], sorted(os.listdir(self.cache_dir)))
+
+    def test_evict_expired(self):
+        for name in ('new', 'old'):
+            cache.write_entry(self.cache_dir, name, b'x')
+        self._age('old', time.time() - 120)
+
+        evicted = cache.evict(self.cache_dir, 1024, max_age=60)
+
+        self.assertEqual(['old'], evicted)
+        self.assertEqual(['new'], os.listdir(self.cache_dir))
+
+    def test_evict_with_remove(self):
+        for age, name in enumerate(['in-use', 'unused']):
+            cache.write_entry(self.cache_dir, name, b'x' * 10)
+            self._age(name, 3000 - age * 1000)
+
+        def _remove(name):
+            if name == 'in-use':
+                return False
+            cache.remove_entry(cache.entry_path(self.cache_dir, name))
+            return True
+
+        evicted = cache.evict(self.cache_dir, 0, remove=_remove)
+
+        self.assertEqual(['unused'], evicted)
+        self.assertEqual(['in-use'], os.listdir(self.cache_dir))
+
+    def test_evict_missing_cache_dir(self):
+        self.assertEqual(
+            [], cache.evict(os.path.join(self.cache_dir, 'missing'), 0))
@@ -0,0 +1,87 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import testtools
+
+from armada import exceptions
+from armada.utils import dependency
+
+
+class BuildGraphTestCase(testtools.TestCase):
+
+    def test_build_graph_preserves_order(self):
+        graph = dependency.build_graph(
+            [('c', ['a']), ('a', None), ('b', ['a', 'c'])])
+
+        self.assertEqual(['c', 'a', 'b'], list(graph))
+        self.assertEqual({'a', 'c'}, graph['b'])
+        self.assertEqual(set(), graph['a'])
+
+    def test_build_graph_unknown_dependency(self):
+        self.assertRaisesRegex(
+            exceptions.ManifestException, 'unknown ChartGroup',
+            dependency.build_graph, [('a', ['missing'])], 'ChartGroup')
+
+    def test_build_graph_duplicate_name(self):
+        self.assertRaisesRegex(
+            exceptions.ManifestException, 'Duplicate',
+            dependency.build_graph, [('a', []), ('a', [])])
+
+    def test_build_graph_cycle(self):
+        self.assertRaisesRegex(
+            exceptions.ManifestException, 'cycle',
+            dependency.build_graph,
+            [('a', ['c']), ('b', ['a']), ('c', ['b']), ('d', [])])
+
+
+class RunGraphTestCase(testtools.TestCase):
+
+    def test_run_graph_respects_dependencies(self):
+        graph = dependency.build_graph(
+            [('storage', []), ('ingress', []),
+             ('app', ['storage', 'ingress'])])
+        lock = threading.Lock()
+        finished = []
+
+        def _run(name):
+            if name == 'app':
+                self.assertEqual({'storage', 'ingress'}, set(finished))
+            with lock:
+                finished.append(name)
+            return name.upper()
+
+        results, failures, skipped = dependency.run_graph(graph, _run, 2)
+
+        self.assertEqual(
+            {'storage': 'STORAGE', 'ingress': 'INGRESS', 'app': 'APP'},
+            dict(results))
+        self.assertEqual({}, dict(failures))
+        self.assertEqual([], skipped)
+
+    def test_run_graph_skips_dependents_of_failures(self):
+        graph = dependency.build_graph(
+            [('a', []), ('b', ['a']), ('c', ['b']), ('d', [])])
+
+        def _run(name):
+            if name == 'a':
+                raise Exception('boom')
+            return name
+
+        results, failures, skipped = dependency.run_graph(graph, _run, 4)
+
+        self.assertEqual(['d'], list(results))
+        self.assertEqual(['a'], list(failures))
+        self.assertEqual(['b', 'c'], skipped)
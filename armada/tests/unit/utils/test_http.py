@@ -0,0 +1,47 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from armada.tests.unit import base
+from armada.utils import http
+
+
+class HttpTestCase(base.ArmadaTestCase):
+
+    def setUp(self):
+        super(HttpTestCase, self).setUp()
+        http.reset_session()
+        self.addCleanup(http.reset_session)
+
+    def test_get_session_is_shared(self):
+        session = http.get_session()
+
+        self.assertIs(session, http.get_session())
+
+        http.reset_session()
+        self.assertIsNot(session, http.get_session())
+
+    def test_get_session_pooling_and_retries(self):
+        self.override_config('http_pool_maxsize', 4)
+        self.override_config('http_retries', 5)
+        self.override_config('http_retry_backoff_factor', 2)
+
+        session = http.get_session()
+
+        for scheme in ('http://', 'https://'):
+            adapter = session.get_adapter(scheme + 'example.com')
+            self.assertEqual(4, adapter._pool_maxsize)
+            self.assertTrue(adapter._pool_block)
+            self.assertEqual(5, adapter.max_retries.total)
+            self.assertEqual(2, adapter.max_retries.backoff_factor)
+            self.assertIn(503, adapter.max_retries.status_forcelist)
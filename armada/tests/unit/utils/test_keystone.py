@@ -0,0 +1,51 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from armada.tests.unit import base
+from armada.utils.keystone import KeystoneUtils
+
+
+@mock.patch('armada.utils.keystone.session')
+@mock.patch('armada.utils.keystone.v3')
+class KeystoneUtilsTestCase(base.ArmadaTestCase):
+
+    def setUp(self):
+        super(KeystoneUtilsTestCase, self).setUp()
+        KeystoneUtils.reset_session()
+        self.addCleanup(KeystoneUtils.reset_session)
+
+    def test_get_session_is_cached(self, mock_v3, mock_session):
+        ks_session = KeystoneUtils.get_session()
+
+        self.assertIs(ks_session, KeystoneUtils.get_session())
+        mock_v3.Password.assert_called_once()
+        mock_session.Session.assert_called_once()
+        # A token is only requested when building the session
+        ks_session.get_auth_headers.assert_called_once_with()
+
+        KeystoneUtils.reset_session()
+        KeystoneUtils.get_session()
+        self.assertEqual(2, mock_session.Session.call_count)
+
+    def test_get_session_failure_is_not_cached(self, mock_v3, mock_session):
+        mock_session.Session.return_value.get_auth_headers.side_effect = (
+            Exception('unauthorized'))
+
+        self.assertRaises(Exception, KeystoneUtils.get_session)
+
+        mock_session.Session.return_value.get_auth_headers.side_effect = None
+        self.assertIs(mock_session.Session.return_value,
+                      KeystoneUtils.get_session())
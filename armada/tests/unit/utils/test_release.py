@@ -12,8 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import json
 import unittest
 
+from google.protobuf.any_pb2 import Any
+from hapi.chart.chart_pb2 import Chart
+from hapi.chart.config_pb2 import Config
+from hapi.chart.metadata_pb2 import Metadata
+from hapi.chart.template_pb2 import Template
+import yaml
+
 from armada.utils import release as rel
 
 
@@ -36,3 +45,93 @@ class ReleaseTestCase(unittest.TestCase):
         prefix, chart = (4, 4)
 
         assert rel.release_prefix(prefix, chart) == expected
+
+    def _chart(self, templates, files=(), dependencies=()):
+        return Chart(
+            metadata=Metadata(name='test', version='0.1.0'),
+            values=Config(raw='foo: bar\n'),
+            templates=[Template(name=n, data=d) for n, d in templates],
+            files=[Any(type_url=n, value=v) for n, v in files],
+            dependencies=list(dependencies))
+
+    def test_chart_digest_ignores_order(self):
+        chart_a = self._chart([('a.yaml', b'a'), ('b.yaml', b'b')],
+                              files=[('x', b'x'), ('y', b'y')])
+        chart_b = self._chart([('b.yaml', b'b'), ('a.yaml', b'a')],
+                              files=[('y', b'y'), ('x', b'x')])
+
+        assert rel.chart_digest(chart_a) == rel.chart_digest(chart_b)
+
+    def test_chart_digest_detects_changes(self):
+        chart = self._chart([('a.yaml', b'a')])
+        changed_template = self._chart([('a.yaml', b'A')])
+        moved_boundary = self._chart([('a.yam', b'la')])
+        with_dependency = self._chart([('a.yaml', b'a')],
+                                      dependencies=[self._chart([])])
+
+        digests = {rel.chart_digest(c) for c in (
+            chart, changed_template, moved_boundary, with_dependency)}
+        assert len(digests) == 4
+
+    def test_values_digest_normalized(self):
+        assert (rel.values_digest({'a': 1, 'b': {'c': [1, 2]}}) ==
+                rel.values_digest({'b': {'c': [1, 2]}, 'a': 1}))
+        assert rel.values_digest(None) == rel.values_digest({})
+        assert rel.values_digest({'a': 1}) != rel.values_digest({'a': '1'})
+
+    def test_release_digest(self):
+        chart = self._chart([('a.yaml', b'a')])
+
+        assert (rel.release_digest(chart, {'a': 1}) ==
+                rel.release_digest(chart, {'a': 1}))
+        assert (rel.release_digest(chart, {'a': 1}) !=
+                rel.release_digest(chart, {'a': 2}))
+
+    def test_values_diff_ignores_order_and_formatting(self):
+        installed = yaml.safe_load('a: 1\nb:\n  c: [1, 2]\n')
+        target = yaml.safe_load('b: {c: [1, 2]}\na: 1')
+
+        diff = rel.values_diff(installed, target)
+        assert not any(diff.values())
+        assert list(diff) == ['changed', 'added', 'removed']
+
+    def test_values_diff_key_paths(self):
+        installed = {'a': 1, 'b': {'c': 2, 'd': 3}, 'e': [1], 'f': {'g': 1}}
+        target = {'a': 1, 'b': {'c': 4, 'h': 5}, 'e': [1, 2], 'f': 'g'}
+
+        diff = rel.values_diff(installed, target)
+        assert diff['changed'] == {
+            'b.c': {'from': 2, 'to': 4},
+            'e': {'from': [1], 'to': [1, 2]},
+            'f': {'from': {'g': 1}, 'to': 'g'}}
+        assert diff['added'] == {'b.h': 5}
+        assert diff['removed'] == {'b.d': 3}
+
+    def test_values_diff_empty_values(self):
+        assert not any(rel.values_diff(None, {}).values())
+        assert rel.values_diff(None, {'a': 1})['added'] == {'a': 1}
+        assert rel.values_diff({'a': 1}, None)['removed'] == {'a': 1}
+
+    def test_values_diff_json_safe(self):
+        installed = yaml.safe_load('a: 2018-01-01\nb: !!binary YQ==\n')
+        target = {'a': '2018-01-02', 'c': {1: datetime.date(2018, 1, 3)}}
+
+        diff = rel.values_diff(installed, target)
+        assert diff['changed'] == {'a': {'from': '2018-01-01',
+                                         'to': '2018-01-02'}}
+        assert diff['added'] == {'c': {'1': '2018-01-03'}}
+        json.dumps(diff)
+
+    def test_manifest_resources(self):
+        manifest = ('---\n# Source: chart/templates/deployment.yaml\n'
+                    'apiVersion: apps/v1\nkind: Deployment\n'
+                    'metadata:\n  name: web\n'
+                    '---\n# Source: chart/templates/empty.yaml\n'
+                    '---\n# Source: chart/templates/job.yaml\n'
+                    'apiVersion: batch/v1\nkind: Job\n'
+                    'metadata:\n  name: db-init\n')
+        assert rel.manifest_resources(manifest) == {
+            ('Deployment', 'web'), ('Job', 'db-init')}
+        assert rel.manifest_resources('') == set()
+        assert rel.manifest_resources('a: [b') is None
+        assert rel.manifest_resources(None) is None
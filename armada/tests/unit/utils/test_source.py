@@ -12,11 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import io
 import os
 import socket
 import shutil
+import tarfile
 
 import fixtures
+from git import Actor
+from git import Repo
 import mock
 import testtools
 
@@ -112,54 +117,276 @@ class GitTestCase(base.ArmadaTestCase):
             source.git_clone, url,
             proxy_server=proxy_url)
 
-    @mock.patch('armada.utils.source.tempfile')
-    @mock.patch('armada.utils.source.requests')
-    def test_tarball_download(self, mock_requests, mock_temp):
-        url = 'http://localhost:8879/charts/mariadb-0.1.0.tgz'
-        mock_temp.mkstemp.return_value = (None, '/tmp/armada')
-        mock_response = mock.Mock()
-        mock_response.content = 'some string'
-        mock_requests.get.return_value = mock_response
-
-        mock_open = mock.mock_open()
-        with mock.patch.object(source, 'open', mock_open, create=True):
-            source.download_tarball(url)
-
-        mock_temp.mkstemp.assert_called_once()
-        mock_requests.get.assert_called_once_with(url, verify=False)
-        mock_open.assert_called_once_with('/tmp/armada', 'wb')
-        mock_open().write.assert_called_once_with(
-            mock_requests.get(url).content)
+    def _make_repo(self, content):
+        repo_dir = self.useFixture(fixtures.TempDir()).path
+        repo = Repo.init(repo_dir)
+        self._commit(repo, content)
+        return repo
+
+    def _commit(self, repo, content):
+        with open(os.path.join(repo.working_dir, 'Chart.yaml'), 'w') as f:
+            f.write(content)
+        repo.index.add(['Chart.yaml'])
+        actor = Actor('armada', 'armada@example.com')
+        return repo.index.commit(content, author=actor, committer=actor)
+
+    def _read_chart(self, git_dir):
+        with open(os.path.join(git_dir, 'Chart.yaml')) as f:
+            return f.read()
+
+    def _commit_files(self, repo, files):
+        for name, content in files.items():
+            path = os.path.join(repo.working_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        repo.index.add(list(files))
+        actor = Actor('armada', 'armada@example.com')
+        return repo.index.commit('files', author=actor, committer=actor)
+
+    def test_git_clone_shallow(self):
+        repo = self._make_repo('name: first')
+        self._commit(repo, 'name: second')
+        # A file:// URL, local paths would ignore the depth
+        url = 'file://' + repo.working_dir
+
+        git_dir = source.git_clone(url, 'master')
+        self.addCleanup(shutil.rmtree, git_dir)
+
+        self.assertEqual('name: second', self._read_chart(git_dir))
+        clone = Repo(git_dir)
+        self.assertEqual(1, len(list(clone.iter_commits('HEAD'))))
+        self.assertEqual(['origin'], [r.name for r in clone.remotes])
+
+    def test_git_clone_sparse(self):
+        self.override_config('git_sparse_checkout', True)
+        repo = self._make_repo('name: top')
+        self._commit_files(repo, {'chart_1/Chart.yaml': 'name: chart_1',
+                                  'chart_2/Chart.yaml': 'name: chart_2',
+                                  'chart_3/Chart.yaml': 'name: chart_3'})
+
+        git_dir = source.git_clone(repo.working_dir, 'master',
+                                   subpaths=['chart_1', 'chart_3/'])
+        self.addCleanup(shutil.rmtree, git_dir)
+
+        self.assertEqual(['.git', 'chart_1', 'chart_3'],
+                         sorted(os.listdir(git_dir)))
+
+        # The whole repository is needed for a chart at its root
+        git_dir = source.git_clone(repo.working_dir, 'master',
+                                   subpaths=['chart_1', '.'])
+        self.addCleanup(shutil.rmtree, git_dir)
+
+        self.assertEqual(['.git', 'Chart.yaml', 'chart_1', 'chart_2',
+                          'chart_3'], sorted(os.listdir(git_dir)))
+
+    def _mirrors(self, cache_dir):
+        # Lock files are hidden
+        return [n for n in os.listdir(cache_dir) if not n.startswith('.')]
+
+    def test_git_clone_mirror_cache(self):
+        cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.override_config('git_cache_dir', cache_dir)
+        repo = self._make_repo('name: first')
+        first = repo.head.commit
+
+        git_dir = source.git_clone(repo.working_dir, 'master')
+        self.assertEqual('name: first', self._read_chart(git_dir))
+        self.assertEqual(1, len(self._mirrors(cache_dir)))
+
+        self._commit(repo, 'name: second')
+        new_git_dir = source.git_clone(repo.working_dir, 'master')
+        old_git_dir = source.git_clone(repo.working_dir, first.hexsha)
+        self.assertEqual('name: second', self._read_chart(new_git_dir))
+        self.assertEqual('name: first', self._read_chart(old_git_dir))
+
+        for path in (git_dir, new_git_dir, old_git_dir):
+            source.source_cleanup(path)
+            self.assertFalse(os.path.exists(path))
+
+        # The mirror is reused once the worktrees have been cleaned up
+        git_dir = source.git_clone(repo.working_dir, 'master')
+        self.addCleanup(source.source_cleanup, git_dir)
+        self.assertEqual('name: second', self._read_chart(git_dir))
+        self.assertEqual(1, len(self._mirrors(cache_dir)))
+
+    def test_git_clone_mirror_cache_eviction(self):
+        cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.override_config('git_cache_dir', cache_dir)
+        self.override_config('git_cache_max_size', 0)
+
+        git_dirs = []
+        for content in ('name: first', 'name: second'):
+            repo = self._make_repo(content)
+            git_dirs.append(source.git_clone(repo.working_dir))
+            self.assertEqual(content, self._read_chart(git_dirs[-1]))
+
+        # Mirrors with checkouts in use are kept
+        source.evict_git_cache()
+        self.assertEqual(2, len(self._mirrors(cache_dir)))
+        self.assertEqual('name: first', self._read_chart(git_dirs[0]))
+
+        source.source_cleanup(git_dirs[0])
+        self.assertFalse(os.path.exists(git_dirs[0]))
+        source.evict_git_cache()
+        self.assertEqual(1, len(self._mirrors(cache_dir)))
+
+        source.source_cleanup(git_dirs[1])
+        self.assertFalse(os.path.exists(git_dirs[1]))
+        source.evict_git_cache()
+        self.assertEqual([], self._mirrors(cache_dir))
+
+    def _tarball(self, files):
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w:gz') as tar:
+            for name, content in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return data.getvalue()
+
+    def _mock_tarball_response(self, mock_session, tarball):
+        mock_response = mock.MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.raw = io.BytesIO(tarball)
+        mock_session.get.return_value = mock_response
+        return mock_response
+
+    def _list_files(self, path):
+        self.addCleanup(shutil.rmtree, path)
+        return sorted(os.path.relpath(os.path.join(root, f), path)
+                      for root, _, files in os.walk(path) for f in files)
+
+    @mock.patch('armada.utils.source.http')
+    def test_get_tarball_streamed(self, mock_http):
+        mock_session = mock_http.get_session.return_value
+        url = 'http://localhost:8879/charts/charts.tgz'
+        tarball = self._tarball({'charts/a/Chart.yaml': b'name: a',
+                                 'charts/b/Chart.yaml': b'name: b',
+                                 'charts/ab/Chart.yaml': b'name: ab',
+                                 '../evil': b'evil'})
+        self._mock_tarball_response(mock_session, tarball)
+
+        path = source.get_tarball(
+            url, subpaths=['charts/a', 'charts/b/'],
+            checksum=hashlib.sha256(tarball).hexdigest())
+
+        mock_session.get.assert_called_once_with(url, verify=False,
+                                                 stream=True, headers=None)
+        self.assertEqual(['charts/a/Chart.yaml', 'charts/b/Chart.yaml'],
+                         self._list_files(path))
+
+        self._mock_tarball_response(mock_session, tarball)
+        path = source.get_tarball(url, subpaths=['charts/a', '.'])
+        self.assertEqual(['charts/a/Chart.yaml', 'charts/ab/Chart.yaml',
+                          'charts/b/Chart.yaml'], self._list_files(path))
+
+    @mock.patch('armada.utils.source.http')
+    def test_get_tarball_skips_escaping_links(self, mock_http):
+        mock_session = mock_http.get_session.return_value
+        outside = self.useFixture(fixtures.TempDir()).path
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w:gz') as tar:
+            links = [('abs', tarfile.SYMTYPE, outside),
+                     ('up', tarfile.SYMTYPE, '../..'),
+                     ('hard', tarfile.LNKTYPE, '../evil'),
+                     ('charts/values', tarfile.SYMTYPE, 'a/values.yaml')]
+            for name, link_type, linkname in links:
+                info = tarfile.TarInfo(name)
+                info.type = link_type
+                info.linkname = linkname
+                tar.addfile(info)
+            for name in ('abs/x', 'up/x', 'charts/a/values.yaml'):
+                info = tarfile.TarInfo(name)
+                info.size = 1
+                tar.addfile(info, io.BytesIO(b'x'))
+        self._mock_tarball_response(mock_session, data.getvalue())
+
+        path = source.get_tarball('http://localhost/charts.tgz')
+
+        # Without the links, the members under them stay in the tarball
+        self.assertEqual(['abs/x', 'charts/a/values.yaml', 'charts/values',
+                          'up/x'], self._list_files(path))
+        self.assertTrue(os.path.islink(os.path.join(path, 'charts/values')))
+        self.assertEqual([], os.listdir(outside))
+
+    @mock.patch('armada.utils.source.http')
+    def test_get_tarball_cached(self, mock_http):
+        mock_session = mock_http.get_session.return_value
+        cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.override_config('tarball_cache_dir', cache_dir)
+        url = 'http://localhost:8879/charts/charts.tgz'
+        tarball = self._tarball({'a/Chart.yaml': b'name: a',
+                                 'b/Chart.yaml': b'name: b'})
+        checksum = hashlib.sha256(tarball).hexdigest()
+
+        response = self._mock_tarball_response(mock_session, tarball)
+        response.status_code = 200
+        response.headers = {'ETag': '"v1"',
+                            'Last-Modified': 'Mon, 01 Oct 2018 00:00:00 GMT'}
+        path = source.get_tarball(url, subpaths=['a'])
+
+        # Cached tarballs are extracted whole, named after their checksum
+        self.assertEqual(os.path.join(cache_dir, checksum), path)
+        self.assertEqual(['a/Chart.yaml', 'b/Chart.yaml'],
+                         sorted(os.path.relpath(os.path.join(root, f), path)
+                                for root, _, files in os.walk(path)
+                                for f in files))
+
+        # Revalidated with a conditional request
+        mock_session.reset_mock()
+        response = self._mock_tarball_response(mock_session, b'')
+        response.status_code = 304
+        self.assertEqual(path, source.get_tarball(url))
+        mock_session.get.assert_called_once_with(
+            url, verify=False, stream=True,
+            headers={'If-None-Match': '"v1"',
+                     'If-Modified-Since': 'Mon, 01 Oct 2018 00:00:00 GMT'})
+
+        # Used without any request when pinned
+        mock_session.reset_mock()
+        self.assertEqual(path, source.get_tarball(url, checksum=checksum))
+        mock_session.get.assert_not_called()
+
+        # Downloaded again when the pinned checksum differs
+        new_tarball = self._tarball({'a/Chart.yaml': b'name: new'})
+        new_checksum = hashlib.sha256(new_tarball).hexdigest()
+        response = self._mock_tarball_response(mock_session, new_tarball)
+        response.status_code = 200
+        response.headers = {}
+        self.assertEqual(os.path.join(cache_dir, new_checksum),
+                         source.get_tarball(url, checksum=new_checksum))
+        mock_session.get.assert_called_once_with(
+            url, verify=False, stream=True, headers=None)
+
+        self.override_config('tarball_cache_max_size', 0)
+        source.evict_tarball_cache()
+        self.assertEqual([], [n for n in os.listdir(cache_dir)
+                              if not n.startswith('.')])
 
+    @test_utils.attr(type=['negative'])
     @mock.patch('armada.utils.source.tempfile')
-    @mock.patch('armada.utils.source.os.path')
-    @mock.patch('armada.utils.source.tarfile')
-    def test_tarball_extract(self, mock_tarfile, mock_path, mock_temp):
-        mock_path.exists.return_value = True
-        mock_temp.mkdtemp.return_value = '/tmp/armada'
-        mock_opened_file = mock.Mock()
-        mock_tarfile.open.return_value = mock_opened_file
-
-        path = '/tmp/mariadb-0.1.0.tgz'
-        source.extract_tarball(path)
-
-        mock_path.exists.assert_called_once()
-        mock_temp.mkdtemp.assert_called_once()
-        mock_tarfile.open.assert_called_once_with(path)
-        mock_opened_file.extractall.assert_called_once_with('/tmp/armada')
+    @mock.patch('armada.utils.source.http')
+    def test_get_tarball_bad_checksum(self, mock_http, mock_temp):
+        mock_session = mock_http.get_session.return_value
+        temp_dir = self.useFixture(fixtures.TempDir()).path
+        mock_temp.mkdtemp.return_value = temp_dir
+        self._mock_tarball_response(
+            mock_session, self._tarball({'Chart.yaml': b'name: a'}))
+
+        self.assertRaises(source_exceptions.TarballChecksumException,
+                          source.get_tarball, 'http://localhost/chart.tgz',
+                          checksum='0' * 64)
+        self.assertFalse(os.path.exists(temp_dir))
 
     @test_utils.attr(type=['negative'])
-    @mock.patch('armada.utils.source.os.path')
-    @mock.patch('armada.utils.source.tarfile')
-    def test_tarball_extract_bad_path(self, mock_tarfile, mock_path):
-        mock_path.exists.return_value = False
-        path = '/tmp/armada'
-
-        self.assertRaises(source_exceptions.InvalidPathException,
-                          source.extract_tarball, path)
+    @mock.patch('armada.utils.source.http')
+    def test_get_tarball_bad_tarball(self, mock_http):
+        mock_session = mock_http.get_session.return_value
+        self._mock_tarball_response(mock_session, b'not a tarball')
 
-        mock_tarfile.open.assert_not_called()
-        mock_tarfile.extractall.assert_not_called()
+        self.assertRaises(source_exceptions.TarballExtractException,
+                          source.get_tarball, 'http://localhost/chart.tgz')
 
     @testtools.skipUnless(
         is_connected(), 'git clone requires network connectivity.')
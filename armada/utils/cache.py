@@ -0,0 +1,145 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Helpers for the on-disk caches kept by Armada.
+
+A cache is a directory holding one entry (file or directory) per key. The
+modification time of an entry records when it was last used, which is what
+``evict`` relies on to drop the least recently used entries first.
+'''
+
+import os
+import shutil
+import tempfile
+import time
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def entry_path(cache_dir, key):
+    '''Return the path of the entry for ``key`` in ``cache_dir``.'''
+    return os.path.join(cache_dir, key)
+
+
+def touch(path):
+    '''Mark the entry at ``path`` as used just now.'''
+    try:
+        os.utime(path, None)
+    except OSError:
+        LOG.debug('Failed to update access time of cache entry %s', path)
+
+
+def read_entry(cache_dir, key):
+    '''Return the content of the file entry for ``key``, or None if it is
+    not cached.
+    '''
+    path = entry_path(cache_dir, key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    touch(path)
+    return data
+
+
+def write_entry(cache_dir, key, data):
+    '''Atomically store ``data`` as the file entry for ``key``.'''
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path(cache_dir, key))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def remove_entry(path):
+    '''Remove the file or directory entry at ``path``.'''
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def entry_size(path):
+    '''Return the disk usage in bytes of the file or directory at
+    ``path``.
+    '''
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def evict(cache_dir, max_size, keep=(), max_age=None, remove=None):
+    '''Remove the least recently used entries of ``cache_dir`` until it
+    uses at most ``max_size`` bytes, and the entries unused for more than
+    ``max_age`` seconds.
+
+    :param str cache_dir: Cache directory.
+    :param int max_size: Maximum size of the cache, in bytes.
+    :param keep: Names of entries that must not be evicted, such as the
+        ones in use by the current run.
+    :param int max_age: optional, maximum age of the entries, in seconds.
+    :param remove: optional callable removing the entry of the name it is
+        passed, instead of ``remove_entry``. It returns whether the entry was
+        removed, False leaving an entry still in use in the cache.
+    :returns: List of the evicted entry names.
+    '''
+    try:
+        names = [n for n in os.listdir(cache_dir) if not n.startswith('.')]
+    except OSError:
+        return []
+
+    entries = []
+    total = 0
+    for name in names:
+        path = entry_path(cache_dir, name)
+        try:
+            used = os.lstat(path).st_mtime
+            size = entry_size(path)
+        except OSError:
+            continue
+        entries.append((used, name, size))
+        total += size
+
+    expired = time.time() - max_age if max_age else None
+    evicted = []
+    for used, name, size in sorted(entries):
+        if total <= max_size and (expired is None or used >= expired):
+            break
+        if name in keep:
+            continue
+        LOG.debug('Evicting %s from cache %s', name, cache_dir)
+        if remove is None:
+            remove_entry(entry_path(cache_dir, name))
+        elif not remove(name):
+            continue
+        evicted.append(name)
+        total -= size
+
+    return evicted
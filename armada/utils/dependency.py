@@ -0,0 +1,113 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from concurrent import futures
+
+from oslo_log import log as logging
+
+from armada import exceptions
+
+LOG = logging.getLogger(__name__)
+
+
+def build_graph(nodes, kind='node'):
+    '''Build and validate a dependency graph.
+
+    :param nodes: List of ``(name, depends_on)`` tuples, in manifest order.
+    :param str kind: What the nodes are, only used in error messages.
+    :returns: OrderedDict mapping each name to the set of names it depends on,
+        preserving the order of ``nodes``.
+    :raises ManifestException: If a name is duplicated, a dependency is
+        unknown or the dependencies contain a cycle.
+    '''
+    graph = OrderedDict()
+    for name, depends_on in nodes:
+        if name in graph:
+            raise exceptions.ManifestException(
+                details='Duplicate {} "{}"'.format(kind, name))
+        graph[name] = set(depends_on or [])
+
+    for name, deps in graph.items():
+        unknown = sorted(d for d in deps if d not in graph)
+        if unknown:
+            raise exceptions.ManifestException(
+                details='{} "{}" depends on unknown {}(s): {}'.format(
+                    kind, name, kind, unknown))
+
+    # Kahn's algorithm, whatever cannot be sorted is part of a cycle
+    remaining = OrderedDict((name, set(deps)) for name, deps in graph.items())
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise exceptions.ManifestException(
+                details='Dependency cycle between {}s: {}'.format(
+                    kind, list(remaining)))
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return graph
+
+
+def run_graph(graph, func, max_workers):
+    '''Call ``func(name)`` for every node of ``graph`` on a thread pool.
+
+    A node is started as soon as all of its dependencies have succeeded, so
+    independent branches of the graph run in parallel. Nodes depending
+    (directly or not) on a failed node are skipped; unrelated branches keep
+    running.
+
+    :param graph: Validated dependency graph, as returned by ``build_graph``.
+    :param func: Callable taking the node name.
+    :param int max_workers: Maximum number of nodes running at once.
+    :returns: Tuple of ``(results, failures, skipped)``: a dict of node name
+        to the value returned by ``func``, a dict of node name to the
+        exception it raised, and the list of skipped node names.
+    '''
+    results = OrderedDict()
+    failures = OrderedDict()
+    skipped = []
+    pending = OrderedDict(graph)
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                deps = pending[name]
+                if any(d in failures or d in skipped for d in deps):
+                    LOG.warn('Skipping %s, a dependency failed.', name)
+                    skipped.append(name)
+                    del pending[name]
+                elif all(d in results for d in deps):
+                    running[executor.submit(func, name)] = name
+                    del pending[name]
+
+            if not running:
+                # Skips may have unblocked further skips, keep going until
+                # nothing is left to decide.
+                continue
+
+            done, _ = futures.wait(
+                running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    LOG.exception('%s failed.', name)
+                    failures[name] = e
+
+    return results, failures, skipped
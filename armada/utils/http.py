@@ -0,0 +1,74 @@
+# Copyright 2018 The Armada Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Shared HTTP session for the outbound requests of Armada, such as fetching
+documents and chart tarballs.'''
+
+import threading
+
+from oslo_config import cfg
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+CONF = cfg.CONF
+
+# Server errors worth retrying, as they are usually transient
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    '''Return the HTTP session shared by all threads of the process.
+
+    The session keeps connections alive in per host pools of at most
+    ``CONF.http_pool_maxsize`` connections, and retries failed connections
+    and idempotent requests answered with a server error
+    ``CONF.http_retries`` times with an exponential backoff.
+
+    :rtype: :class:`requests.Session`
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def reset_session():
+    '''Close the shared session, a new one is built on next use.'''
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def _build_session():
+    retry = Retry(
+        total=CONF.http_retries,
+        backoff_factor=CONF.http_retry_backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        # Hand the last response over rather than raising once exhausted
+        raise_on_status=False)
+    # Block rather than open extra connections to a host beyond the limit
+    adapter = HTTPAdapter(pool_maxsize=CONF.http_pool_maxsize,
+                          pool_block=True, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -14,11 +14,14 @@
 """Utility functions for accessing Openstack Keystone."""
 
 import os
+import threading
 
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
 from oslo_config import cfg
 
+from armada.utils import http
+
 
 CONF = cfg.CONF
 
@@ -26,16 +29,36 @@ CONF = cfg.CONF
 class KeystoneUtils(object):
     """Utility methods for using Keystone."""
 
-    @staticmethod
-    def get_session():
+    _session = None
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls):
         """Get an initialized keystone session.
 
+        The session is built once and shared by the whole process. Its auth
+        plugin caches the token and only requests a new one when the token
+        is about to expire, or has been rejected.
+
         Authentication is based on the keystone_authtoken
         section of the config file primarily. If that fails
         then attempt to create a session from environmental
         variables. This is for cases of the CLI needing
         a token.
         """
+        with cls._session_lock:
+            if cls._session is None:
+                cls._session = cls._build_session()
+            return cls._session
+
+    @classmethod
+    def reset_session(cls):
+        """Forget the shared session, a new one is built on next use."""
+        with cls._session_lock:
+            cls._session = None
+
+    @staticmethod
+    def _build_session():
         auth_info = dict()
         auth_fields = ['auth_url', 'username', 'password', 'project_id',
                        'user_domain_name']
@@ -43,7 +66,8 @@ class KeystoneUtils(object):
             for f in auth_fields:
                 auth_info[f] = getattr(CONF.keystone_authtoken, f)
             auth = v3.Password(**auth_info)
-            ks_session = session.Session(auth=auth)
+            ks_session = session.Session(auth=auth,
+                                         session=http.get_session())
             # Test the session
             ks_session.get_auth_headers()
         except Exception:  # nosec this isn't a security issue
@@ -55,7 +79,8 @@ class KeystoneUtils(object):
             for f in auth_fields:
                 auth_info[f] = os.environ.get('os_{}'.format(f).upper())
             auth = v3.Password(**auth_info)
-            ks_session = session.Session(auth=auth)
+            ks_session = session.Session(auth=auth,
+                                         session=http.get_session())
             # Test the session
             ks_session.get_auth_headers()
         except Exception:
@@ -13,6 +13,13 @@
 # limitations under the License.
 
 
+from collections import OrderedDict
+import hashlib
+import json
+
+import yaml
+
+
 def release_prefix(prefix, chart):
     '''
     how to attach prefix to chart
@@ -28,3 +35,134 @@ def label_selectors(labels):
     """
     return ",".join(
         ["%s=%s" % (k, v) for k, v in labels.items()])
+
+
+def _update_digest(digest, *parts):
+    '''Feed length-prefixed ``parts`` to ``digest``, so that the boundaries
+    between consecutive parts are part of what is hashed.'''
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        digest.update(str(len(part)).encode('utf-8') + b':')
+        digest.update(part)
+
+
+def chart_digest(chart):
+    """
+    :param chart: :class:`hapi.chart.chart_pb2.Chart` protobuf
+
+    :return: hex digest of the chart's metadata, default values, templates,
+        files and (recursively) dependencies, independent of their order
+    """
+    digest = hashlib.sha256()
+    _update_digest(digest, chart.metadata.SerializeToString(),
+                   chart.values.raw)
+    for template in sorted(chart.templates, key=lambda t: t.name):
+        _update_digest(digest, 'template', template.name, template.data)
+    for chart_file in sorted(chart.files, key=lambda f: f.type_url):
+        _update_digest(digest, 'file', chart_file.type_url, chart_file.value)
+    for dependency in sorted(chart_digest(d) for d in chart.dependencies):
+        _update_digest(digest, 'dependency', dependency)
+    return digest.hexdigest()
+
+
+def values_digest(values):
+    """
+    :param values: parsed values (override) mapping, None meaning no values
+
+    :return: hex digest of the values, independent of key order and YAML
+        formatting
+    """
+    normalized = json.dumps(values or {}, sort_keys=True, default=str)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def release_digest(chart, values):
+    """
+    :param chart: :class:`hapi.chart.chart_pb2.Chart` protobuf
+    :param values: parsed values (override) mapping
+
+    :return: hex digest identifying what a release of ``chart`` with
+        ``values`` would deploy
+    """
+    digest = hashlib.sha256()
+    _update_digest(digest, chart_digest(chart), values_digest(values))
+    return digest.hexdigest()
+
+
+def _json_safe(value):
+    """
+    Return ``value`` with any scalar which JSON cannot represent, such as a
+    YAML timestamp or binary, rendered as a string, as ``values_digest``
+    does.
+    """
+    if isinstance(value, dict):
+        return OrderedDict((k if isinstance(k, str) else str(k),
+                            _json_safe(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def values_diff(installed, target):
+    """
+    Compare two parsed values mappings key by key, so that key order and
+    YAML formatting never show up as differences. Nested mappings are
+    walked, any other value (including lists) is compared as a whole.
+
+    :param installed: parsed values of the deployed release, None meaning no
+        values
+    :param target: parsed values about to be deployed, None meaning no
+        values
+
+    :return: OrderedDict with ``changed``, ``added`` and ``removed`` entries,
+        each an OrderedDict keyed by dotted key path (the notation of
+        ``--set``). ``changed`` maps to ``{'from': ..., 'to': ...}`` dicts,
+        ``added`` to the new values and ``removed`` to the old ones. The
+        values are JSON serializable.
+    """
+    diff = OrderedDict(
+        (kind, OrderedDict()) for kind in ('changed', 'added', 'removed'))
+
+    def _walk(path, old, new):
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key in sorted(set(old) | set(new), key=str):
+                key_path = '{}.{}'.format(path, key) if path else str(key)
+                if key not in new:
+                    diff['removed'][key_path] = _json_safe(old[key])
+                elif key not in old:
+                    diff['added'][key_path] = _json_safe(new[key])
+                else:
+                    _walk(key_path, old[key], new[key])
+        elif old != new:
+            diff['changed'][path] = {'from': _json_safe(old),
+                                     'to': _json_safe(new)}
+
+    _walk('', installed or {}, target or {})
+    return diff
+
+
+def manifest_resources(manifest):
+    """
+    :param manifest: rendered manifest of a release, as returned by Tiller
+
+    :return: set of ``(kind, name)`` tuples of the resources defined by the
+        manifest, or None if it is missing or cannot be parsed
+    """
+    if not isinstance(manifest, str):
+        return None
+    try:
+        documents = list(yaml.safe_load_all(manifest))
+    except yaml.YAMLError:
+        return None
+
+    resources = set()
+    for document in documents:
+        if not isinstance(document, dict):
+            continue
+        name = (document.get('metadata') or {}).get('name')
+        if document.get('kind') and name:
+            resources.add((document['kind'], name))
+    return resources
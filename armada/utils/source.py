@@ -12,28 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import hashlib
+import json
 import os
 import shutil
 import tarfile
 import tempfile
 
 from git import exc as git_exc
-from git import Git
 from git import Repo
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
-import requests
 from requests.packages import urllib3
 
 from armada.exceptions import source_exceptions
+from armada.utils import cache
+from armada.utils import http
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 
-def git_clone(repo_url, ref='master', proxy_server=None, auth_method=None):
+def git_clone(repo_url, ref='master', proxy_server=None, auth_method=None,
+              subpaths=None):
     '''Clone a git repository from ``repo_url`` using the reference ``ref``.
 
+    Only ``ref`` is fetched, with a history limited to
+    ``CONF.git_fetch_depth`` commits, unless the repository is checked out
+    from a mirror (see ``CONF.git_cache_dir``).
+
     :param repo_url: URL of git repo to clone.
     :param ref: branch, commit or reference in the repo to clone. Default is
         'master'.
@@ -44,6 +53,8 @@ def git_clone(repo_url, ref='master', proxy_server=None, auth_method=None):
         ``CONF.ssh_key_path``. If value is None, authentication is skipped.
         Valid values include "SSH" or None. Note that the values are not
         case sensitive. Default is None.
+    :param subpaths: optional, paths within the repo that are used. When
+        ``CONF.git_sparse_checkout`` is set, only these are checked out.
     :returns: Path to the cloned repo.
     :raises GitException: If ``repo_url`` is invalid or could not be found.
     :raises GitAuthException: If authentication with the Git repository failed.
@@ -79,17 +90,12 @@ def git_clone(repo_url, ref='master', proxy_server=None, auth_method=None):
                   'with no authentication.', repo_url, ref)
 
     try:
-        if proxy_server:
-            LOG.debug('Cloning [%s] with proxy [%s]', repo_url, proxy_server)
-            repo = Repo.clone_from(repo_url, temp_dir, env=env_vars,
-                                   config='http.proxy=%s' % proxy_server)
+        if CONF.git_cache_dir:
+            _git_mirror_checkout(repo_url, ref, temp_dir, env_vars,
+                                 proxy_server=proxy_server)
         else:
-            LOG.debug('Cloning [%s]', repo_url)
-            repo = Repo.clone_from(repo_url, temp_dir, env=env_vars)
-
-        repo.remotes.origin.fetch(ref)
-        g = Git(repo.working_dir)
-        g.checkout('FETCH_HEAD')
+            _git_fetch_checkout(repo_url, ref, temp_dir, env_vars,
+                                proxy_server=proxy_server, subpaths=subpaths)
     except git_exc.GitCommandError as e:
         LOG.exception('Encountered GitCommandError during clone.')
         if ssh_cmd and ssh_cmd in e.stderr:
@@ -106,47 +112,376 @@ def git_clone(repo_url, ref='master', proxy_server=None, auth_method=None):
     return temp_dir
 
 
-def get_tarball(tarball_url, verify=False):
-    tarball_path = download_tarball(tarball_url, verify=verify)
-    return extract_tarball(tarball_path)
+def _git_fetch_checkout(repo_url, ref, checkout_dir, env_vars,
+                        proxy_server=None, subpaths=None):
+    '''Check ``ref`` of ``repo_url`` out in ``checkout_dir``, fetching
+    nothing but that ref, in a single round trip.
+    '''
+    repo = Repo.init(checkout_dir)
+    repo.create_remote('origin', repo_url)
+
+    if proxy_server:
+        LOG.debug('Fetching [%s] with proxy [%s]', repo_url, proxy_server)
+        repo.git.config('http.proxy', proxy_server)
+
+    subpaths = [p.strip('/') for p in subpaths or []]
+    if CONF.git_sparse_checkout and subpaths and all(
+            p not in ('', '.') for p in subpaths):
+        LOG.debug('Sparse checkout of %s from [%s]', subpaths, repo_url)
+        repo.git.config('core.sparseCheckout', 'true')
+        info_dir = os.path.join(repo.git_dir, 'info')
+        os.makedirs(info_dir, exist_ok=True)
+        with open(os.path.join(info_dir, 'sparse-checkout'), 'w') as f:
+            f.writelines('/{}/\n'.format(p) for p in sorted(set(subpaths)))
 
+    LOG.debug('Fetching [%s] at depth %s', ref, CONF.git_fetch_depth or 'all')
+    repo.git.fetch('origin', ref, depth=CONF.git_fetch_depth or None,
+                   env=env_vars)
+    repo.git.checkout('FETCH_HEAD')
 
-def download_tarball(tarball_url, verify=False):
+
+def _git_mirror_checkout(repo_url, ref, checkout_dir, env_vars,
+                         proxy_server=None):
+    '''Check ``ref`` of ``repo_url`` out in ``checkout_dir`` through the
+    local mirror of the repository kept under ``CONF.git_cache_dir``.
+
+    The mirror is a bare repository only ever fetching the requested refs,
+    so that updating it only transfers the objects it does not have yet.
+    Fetched refs are recorded under ``refs/armada/`` to keep their objects
+    from being garbage collected. The checkout is a detached ``git worktree``
+    of the mirror, which ``source_cleanup`` removes like any other clone.
     '''
-    Downloads a tarball to /tmp and returns the path
+    cache_dir = CONF.git_cache_dir
+    key = hashlib.sha256(repo_url.encode('utf-8')).hexdigest()
+    mirror_dir = cache.entry_path(cache_dir, key)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Serialize updates of a mirror, between threads and processes
+    with _mirror_lock(cache_dir, key):
+        if os.path.isdir(mirror_dir):
+            LOG.debug('Updating mirror of [%s]', repo_url)
+            mirror = Repo(mirror_dir)
+            # Forget the worktrees of previous runs that were cleaned up
+            mirror.git.worktree('prune')
+        else:
+            LOG.debug('Creating mirror of [%s]', repo_url)
+            mirror = Repo.init(mirror_dir, bare=True)
+            mirror.create_remote('origin', repo_url)
+
+        if proxy_server:
+            LOG.debug('Fetching [%s] with proxy [%s]', repo_url, proxy_server)
+            mirror.git(c='http.proxy=%s' % proxy_server)
+        mirror.git.fetch('origin', ref, env=env_vars)
+
+        ref_key = hashlib.sha256(ref.encode('utf-8')).hexdigest()
+        mirror.git.update_ref('refs/armada/%s' % ref_key, 'FETCH_HEAD')
+        mirror.git.worktree('add', '--detach', checkout_dir, 'FETCH_HEAD')
+
+    cache.touch(mirror_dir)
+
+
+def _mirror_lock(cache_dir, key):
+    '''Return the lock serializing the uses of a git mirror, between
+    threads and processes.'''
+    return lockutils.lock(key, lock_file_prefix='.lock', external=True,
+                          lock_path=cache_dir)
+
+
+def _remove_git_mirror(cache_dir, key):
+    '''Remove the git mirror of ``key`` unless it still has worktrees
+    checked out, returning whether it was removed.'''
+    mirror_dir = cache.entry_path(cache_dir, key)
+    with _mirror_lock(cache_dir, key):
+        try:
+            # Forget the worktrees that were cleaned up
+            Repo(mirror_dir).git.worktree('prune')
+        except git_exc.GitError as e:
+            LOG.warning('Removing invalid git mirror %s: %s', mirror_dir, e)
+        else:
+            worktrees_dir = os.path.join(mirror_dir, 'worktrees')
+            if os.path.isdir(worktrees_dir) and os.listdir(worktrees_dir):
+                LOG.debug('Not evicting git mirror %s, it has worktrees '
+                          'checked out', mirror_dir)
+                return False
+        cache.remove_entry(mirror_dir)
+        return True
+
+
+def evict_git_cache():
+    '''Evict git mirrors from the git cache, least recently used first,
+    until it fits in ``CONF.git_cache_max_size``.
+
+    Mirrors with worktrees still checked out, by this run or by another
+    process, are kept.
+    '''
+    cache_dir = CONF.git_cache_dir
+    if not cache_dir:
+        return
+
+    cache.evict(cache_dir, CONF.git_cache_max_size * 1024 * 1024,
+                remove=functools.partial(_remove_git_mirror, cache_dir))
+
+
+def git_tree_sha(git_path, subpath='.'):
+    '''Return the SHA of the git tree checked out at ``subpath`` of the
+    repository ``git_path``, which identifies the content of the files under
+    it.
+
+    :returns: Hex SHA of the tree, or None if ``git_path`` is not a git
+        repository or has local changes under ``subpath``.
     '''
+    subpath = os.path.normpath(subpath or '.').strip('/')
     try:
-        if not verify:
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        repo = Repo(git_path)
+        if repo.is_dirty(untracked_files=True, path=subpath):
+            return None
+        tree = repo.head.commit.tree
+        if subpath != '.':
+            tree = tree / subpath
+        return tree.hexsha
+    except (git_exc.GitError, KeyError, ValueError) as e:
+        LOG.debug('Could not get the git tree of %s in %s: %s',
+                  subpath, git_path, e)
+        return None
 
-        tarball_filename = tempfile.mkstemp(prefix='armada')[1]
-        response = requests.get(tarball_url, verify=verify)
 
-        with open(tarball_filename, 'wb') as f:
-            f.write(response.content)
+# Size of the chunks read from tarball downloads
+TARBALL_CHUNK_SIZE = 64 * 1024
+
+# Also have tarfile reject unsafe members, where it supports extraction
+# filters
+TARBALL_EXTRACT_ARGS = (
+    {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {})
 
-        return tarball_filename
-    except Exception:
-        raise source_exceptions.TarballDownloadException(tarball_url)
 
+class _HashingReader(object):
+    '''File-like wrapper computing the SHA-256 digest of what is read.'''
 
-def extract_tarball(tarball_path):
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size=TARBALL_CHUNK_SIZE):
+        data = self._fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _in_subpaths(name, subpaths):
+    '''Whether the tarball member ``name`` is within one of ``subpaths``.'''
+    name = os.path.normpath(name)
+    return any(name == p or name.startswith(p + os.sep) for p in subpaths)
+
+
+def _is_within(path, directory):
+    '''Whether ``path`` resolves to a path within ``directory``.'''
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def _is_contained_member(member, dest_dir):
+    '''Whether extracting the tarball ``member`` in ``dest_dir`` only
+    writes to, or links to, paths within ``dest_dir``, following the links
+    already extracted.
     '''
-    Extracts a tarball to /tmp and returns the path
+    path = os.path.join(dest_dir, member.name)
+    if not _is_within(path, dest_dir):
+        return False
+    if member.issym():
+        target = os.path.join(os.path.dirname(path), member.linkname)
+        return _is_within(target, dest_dir)
+    if member.islnk():
+        return _is_within(os.path.join(dest_dir, member.linkname), dest_dir)
+    return True
+
+
+def get_tarball(tarball_url, verify=False, subpaths=None, checksum=None):
+    '''Download and extract the tarball at ``tarball_url``.
+
+    The response is streamed straight into the extraction, without being
+    buffered in memory or written to a temporary file. When
+    ``CONF.tarball_cache_dir`` is set, the extracted tarball is taken from
+    or added to the tarball cache, see ``_get_cached_tarball``.
+
+    :param tarball_url: URL of the (optionally compressed) tarball.
+    :param verify: Whether to verify the server certificate, or the path to
+        the CA bundle to verify it with.
+    :param subpaths: optional, paths within the tarball that are used. Only
+        these are extracted, unless the tarball is cached.
+    :param checksum: optional, expected SHA-256 hex digest of the tarball.
+    :returns: Path to the directory the tarball was extracted in.
+    :raises TarballDownloadException: If the tarball could not be
+        downloaded.
+    :raises TarballExtractException: If the tarball could not be extracted.
+    :raises TarballChecksumException: If the tarball does not match
+        ``checksum``.
     '''
-    if not os.path.exists(tarball_path):
-        raise source_exceptions.InvalidPathException(tarball_path)
+    if CONF.tarball_cache_dir:
+        return _get_cached_tarball(tarball_url, verify, checksum)
 
-    temp_dir = tempfile.mkdtemp(prefix='armada')
+    subpaths = [os.path.normpath(p) for p in subpaths or []]
+    if os.curdir in subpaths:
+        subpaths = []
 
+    response = _request_tarball(tarball_url, verify)
+    temp_dir = tempfile.mkdtemp(prefix='armada')
     try:
-        file = tarfile.open(tarball_path)
-        file.extractall(temp_dir)
+        actual = _extract_tarball_stream(response, temp_dir, tarball_url,
+                                         subpaths=subpaths)
+        _verify_checksum(tarball_url, checksum, actual)
     except Exception:
-        raise source_exceptions.TarballExtractException(tarball_path)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
     return temp_dir
 
 
+def _request_tarball(tarball_url, verify, headers=None):
+    '''Start streaming the tarball at ``tarball_url``.'''
+    if not verify:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    try:
+        response = http.get_session().get(
+            tarball_url, verify=verify, stream=True, headers=headers)
+        response.raise_for_status()
+    except Exception:
+        LOG.exception('Failed to download %s', tarball_url)
+        raise source_exceptions.TarballDownloadException(tarball_url)
+    return response
+
+
+def _extract_tarball_stream(response, dest_dir, tarball_url, subpaths=None):
+    '''Extract the tarball streamed by ``response`` in ``dest_dir``.
+
+    :returns: SHA-256 hex digest of the tarball.
+    '''
+    try:
+        with response:
+            # Undo any Content-Encoding, but not the tarball compression
+            response.raw.decode_content = True
+            reader = _HashingReader(response.raw)
+
+            with tarfile.open(fileobj=reader, mode='r|*',
+                              bufsize=TARBALL_CHUNK_SIZE) as tar:
+                for member in tar:
+                    name = os.path.normpath(member.name)
+                    if not _is_contained_member(member, dest_dir):
+                        LOG.warn('Skipping %s from %s, it is outside of '
+                                 'the tarball', member.name, tarball_url)
+                    elif not subpaths or _in_subpaths(name, subpaths):
+                        tar.extract(member, dest_dir, **TARBALL_EXTRACT_ARGS)
+
+            # Read what follows the end of the archive, for the checksum
+            while reader.read():
+                pass
+    except Exception:
+        LOG.exception('Failed to extract %s', tarball_url)
+        raise source_exceptions.TarballExtractException(tarball_url)
+
+    return reader.digest.hexdigest()
+
+
+def _verify_checksum(tarball_url, checksum, actual):
+    if checksum and checksum.lower() != actual:
+        raise source_exceptions.TarballChecksumException(
+            tarball_url, checksum, actual)
+
+
+def _get_cached_tarball(tarball_url, verify, checksum):
+    '''Return the extracted tarball at ``tarball_url`` from the tarball
+    cache, downloading it only if needed.
+
+    Extracted tarballs are stored whole under ``CONF.tarball_cache_dir``,
+    named after their SHA-256 digest. For each URL, the digest of the last
+    tarball downloaded from it and the ``ETag`` and ``Last-Modified``
+    headers it was served with are kept, so that it can be revalidated with a
+    conditional request. A tarball whose ``checksum`` is pinned and already
+    cached is used without any request.
+
+    Trees handed out may be in use until the end of the run, so they are
+    not evicted here, see ``evict_tarball_cache``.
+    '''
+    cache_dir = CONF.tarball_cache_dir
+    checksum = checksum.lower() if checksum else None
+    if checksum and os.path.isdir(cache.entry_path(cache_dir, checksum)):
+        LOG.info('Using cached tarball %s for %s', checksum, tarball_url)
+        cache.touch(cache.entry_path(cache_dir, checksum))
+        return cache.entry_path(cache_dir, checksum)
+
+    url_key = hashlib.sha256(tarball_url.encode('utf-8')).hexdigest()
+    urls_dir = os.path.join(cache_dir, '.urls')
+    os.makedirs(urls_dir, exist_ok=True)
+    meta_path = os.path.join(urls_dir, url_key + '.json')
+
+    with lockutils.lock(url_key, lock_file_prefix='.lock', external=True,
+                        lock_path=cache_dir):
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            meta = {}
+
+        cached = meta.get('sha256')
+        if cached and (checksum in (None, cached)) and os.path.isdir(
+                cache.entry_path(cache_dir, cached)):
+            headers = {}
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        else:
+            headers = None
+
+        response = _request_tarball(tarball_url, verify, headers=headers)
+        if headers and response.status_code == 304:
+            response.close()
+            LOG.info('Cached tarball %s for %s is up to date', cached,
+                     tarball_url)
+            cache.touch(cache.entry_path(cache_dir, cached))
+            return cache.entry_path(cache_dir, cached)
+
+        LOG.info('Downloading tarball %s into the cache', tarball_url)
+        temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+        try:
+            actual = _extract_tarball_stream(response, temp_dir, tarball_url)
+            _verify_checksum(tarball_url, checksum, actual)
+
+            tree = cache.entry_path(cache_dir, actual)
+            if os.path.isdir(tree):
+                # Same content as a tarball cached from another URL
+                shutil.rmtree(temp_dir)
+                cache.touch(tree)
+            else:
+                os.rename(temp_dir, tree)
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        meta = {'url': tarball_url,
+                'sha256': actual,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}
+        cache.write_entry(urls_dir, url_key + '.json',
+                          json.dumps(meta).encode('utf-8'))
+
+    return tree
+
+
+def evict_tarball_cache():
+    '''Evict extracted tarballs from the tarball cache, least recently used
+    first, until it fits in ``CONF.tarball_cache_max_size``, and those
+    unused for ``CONF.tarball_cache_max_age``.
+    '''
+    if not CONF.tarball_cache_dir:
+        return
+
+    max_age = CONF.tarball_cache_max_age * 3600 or None
+    cache.evict(CONF.tarball_cache_dir,
+                CONF.tarball_cache_max_size * 1024 * 1024, max_age=max_age)
+
+
 def source_cleanup(git_path):
     '''Clean up the git repository that was created by ``git_clone`` above.
 
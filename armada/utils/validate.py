@@ -23,6 +23,7 @@ from oslo_log import log as logging
 from armada.const import KEYWORD_GROUPS, KEYWORD_CHARTS, KEYWORD_RELEASE
 from armada.handlers.manifest import Manifest
 from armada.exceptions.manifest_exceptions import ManifestException
+from armada.utils import http
 from armada.utils.validation_message import ValidationMessage
 
 LOG = logging.getLogger(__name__)
@@ -228,7 +229,7 @@ def validate_armada_documents(documents):
 
 def validate_manifest_url(value):
     try:
-        return (requests.get(value).status_code == 200)
+        return (http.get_session().get(value).status_code == 200)
     except requests.exceptions.RequestException:
         return False
 